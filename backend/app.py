@@ -1,9 +1,28 @@
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request, send_file, stream_with_context, url_for
 from flask_cors import CORS
+from flask_migrate import Migrate
+from sqlalchemy import text, update
+from sqlalchemy.exc import IntegrityError
 from models import db, Image, Design, Treatment, Material, Lens
+from schema import MIGRATIONS_DIR, upgrade_schema
 from auth import auth_bp, require_auth
+from batch import BatchError, apply_batch
+from cache import ANY, ResponseCache
+from changes import PUBLIC_TYPES, ChangeLogExpired, change_tables, changes_since, parse_change_limit, parse_change_types, parse_since, start_pruner
+from events import mark_changed
+from facets import index as facet_index, parse_facet_filters
+from images import MAX_AGE, ImageError, local_path, parse_variant, probe, variants
+from pubsub import start_listener, subscribe
+from lenses import LENS_EXPANSIONS, parse_expand, lens_load_options, lens_tables, lens_tags, serialize_lens
+from listing import STREAM_BATCH_SIZE, ListQuery, ListQueryError, check_stream, encode_stream_chunk, is_id
+from metrics import metrics_bp
+from search import parse_limit, parse_types, search
+from serializers import column_select, row_serializer, to_dict
+from snapshot import FORMATS, read_file, snapshot
+from stats import get_stats
+from versions import CATALOG_TABLES, conditional
+import gzip
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,6 +34,10 @@ CORS(app, supports_credentials=True, origins=[
     os.getenv('FRONTEND_URL', 'http://localhost:5173')
 ])
 
+# Per-route latency and SQL metrics on /metrics (registered first so its
+# timer covers the other request hooks)
+app.register_blueprint(metrics_bp)
+
 # Register auth blueprint
 app.register_blueprint(auth_bp)
 
@@ -22,28 +45,150 @@ app.register_blueprint(auth_bp)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'postgresql://vittion:vittion@db:5432/vittion')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db.init_app(app)
+# Connection pool sized from the serving layout (see gunicorn.conf.py): each
+# worker gets an equal share of DB_MAX_CONNECTIONS, one connection of which
+# is kept for the change listener
+def engine_options(uri):
+    if not uri.startswith('postgresql'):
+        return {}
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    threads = int(os.getenv('GUNICORN_THREADS', 1))
+    budget = max(2, int(os.getenv('DB_MAX_CONNECTIONS', 90)) // workers)
+    pool_size = int(os.getenv('DB_POOL_SIZE', max(1, min(threads, budget - 1))))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', max(0, min(pool_size, budget - 1 - pool_size))))
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+        'connect_args': {'options': f'-c statement_timeout={statement_timeout}'},
+    }
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
-# Helper to serialize models
+db.init_app(app)
+migrate = Migrate(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
+
+# Serialized responses of the public lens endpoints, invalidated per row
+lens_cache = ResponseCache(
+    maxsize=int(os.getenv('LENS_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('LENS_CACHE_TTL', 300))
+)
+subscribe(lens_cache.invalidate)
+
+# Relay catalog changes committed by other workers (started once per process)
+@app.before_request
+def start_change_listener():
+    start_listener(db.engine)
+
+# Drop change log entries past their retention (once per process)
+@app.before_request
+def start_change_log_pruner():
+    start_pruner(app)
+
+# --- Health ---
+
+# Liveness: the process is up and serving requests
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    return jsonify({"status": "ok"})
+
+# Readiness: the database answers, so the worker can take traffic
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception as e:
+        app.logger.warning(f"Readiness check failed: {e}")
+        return jsonify({"status": "unavailable"}), 503
+    return jsonify({"status": "ok"})
+
+# Helper to serialize models (per-model serializers are compiled at import)
 def serialize(obj):
     if obj is None:
         return None
-    data = {}
-    for column in obj.__table__.columns:
-        val = getattr(obj, column.name)
-        if isinstance(val, datetime):
-            val = val.isoformat()
-        data[column.name] = val
-    return data
+    return to_dict(obj)
+
+@app.errorhandler(ListQueryError)
+def handle_list_query_error(e):
+    return jsonify({"error": str(e)}), 400
+
+# Filtered, sorted list of a model; paginated when ?limit= or ?cursor= is given
+def list_payload(model, options=(), serializer=None):
+    params = ListQuery.from_args(model, request.args)
+    if serializer is None:
+        # Fast path: plain column tuples, no ORM instances or identity map
+        rows = db.session.execute(params.apply(column_select(model))).all()
+        serializer = row_serializer(model)
+    else:
+        rows = params.apply(model.query.options(*options)).all()
+    rows, next_cursor = params.page(rows)
+    items = [serializer(row) for row in rows]
+    if not params.paginated:
+        return items, rows
+    return {"items": items, "next_cursor": next_cursor}, rows
+
+def list_response(model):
+    if request.args.get('stream'):
+        return stream_response(model, request.args['stream'])
+    return jsonify(list_payload(model)[0])
+
+# Whole filtered collection as a chunked JSON array (?stream=json) or NDJSON
+# (?stream=ndjson), read from a server-side cursor so memory stays bounded
+def stream_response(model, fmt, options=(), serializer=None):
+    params = ListQuery.from_args(model, request.args)
+    mimetype = check_stream(fmt, params)
+
+    def generate():
+        if serializer is None:
+            rows = db.session.execute(
+                params.apply(column_select(model)),
+                execution_options={'yield_per': STREAM_BATCH_SIZE}
+            )
+            to_json = row_serializer(model)
+        else:
+            rows = params.apply(model.query.options(*options)).yield_per(STREAM_BATCH_SIZE)
+            to_json = serializer
+        dumps = app.json.dumps
+        if fmt == 'json':
+            yield '['
+        batch, first = [], True
+        for row in rows:
+            batch.append(dumps(to_json(row)))
+            if len(batch) == STREAM_BATCH_SIZE:
+                yield encode_stream_chunk(fmt, batch, first)
+                batch, first = [], False
+        if batch:
+            yield encode_stream_chunk(fmt, batch, first)
+        if fmt == 'json':
+            yield ']'
+
+    return app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
+# Serve a JSON body from lens_cache; build() returns (payload, tags) on a miss
+def cached_json(key, build):
+    # Also keyed by the table versions of the ETag (see versions.conditional()):
+    # a body built before a change is never served under the ETag that follows it
+    key = (key, tuple(sorted(g.get('catalog_versions', {}).items())))
+    body = lens_cache.get(key)
+    if body is None:
+        generation = lens_cache.generation
+        payload, tags = build()
+        body = app.json.response(payload).get_data()
+        lens_cache.set(key, body, tags, generation)
+    return app.response_class(body, mimetype=app.json.mimetype)
 
 @app.route('/api/images', methods=['GET'])
 @require_auth
+@conditional('images')
 def get_images():
-    images = Image.query.all()
-    return jsonify([serialize(img) for img in images])
+    return list_response(Image)
 
 @app.route('/api/images/<int:id>', methods=['GET'])
 @require_auth
+@conditional('images')
 def get_image(id):
     image = Image.query.get_or_404(id)
     return jsonify(serialize(image))
@@ -52,11 +197,14 @@ def get_image(id):
 @require_auth
 def create_image():
     data = request.json
+    if not isinstance(data.get('url'), str):
+        return jsonify({"error": "url must be a string"}), 400
+    # Local images are measured; remote ones only when no resolution is given
     new_img = Image(
         name=data.get('name'),
         url=data.get('url'),
         category=data.get('category'),
-        resolution=data.get('resolution')
+        resolution=probe(data.get('url'), remote=not data.get('resolution')) or data.get('resolution')
     )
     db.session.add(new_img)
     db.session.commit()
@@ -67,10 +215,15 @@ def create_image():
 def update_image(id):
     image = Image.query.get_or_404(id)
     data = request.json
+    if 'url' in data and not isinstance(data['url'], str):
+        return jsonify({"error": "url must be a string"}), 400
+    url = image.url
     image.name = data.get('name', image.name)
     image.url = data.get('url', image.url)
     image.category = data.get('category', image.category)
     image.resolution = data.get('resolution', image.resolution)
+    if image.url != url and 'resolution' not in data:
+        image.resolution = probe(image.url)
     db.session.commit()
     return jsonify(serialize(image))
 
@@ -82,6 +235,25 @@ def delete_image(id):
     db.session.commit()
     return jsonify({"success": True})
 
+# A locally stored image (IMAGE_ROOT), or with ?w=&h= (fit, format, q) a
+# variant of it, encoded once by the image workers then served from disk;
+# public like the lenses that link to it
+@app.route('/api/media/<path:path>', methods=['GET'])
+def get_media(path):
+    source = local_path(path)
+    if source is None:
+        return jsonify({"error": "Image not found"}), 404
+    variant = parse_variant(request.args)
+    if variant is None:
+        return send_file(source, conditional=True, max_age=MAX_AGE)
+    try:
+        file = variants.get(source, variant)
+    except ImageError as e:
+        return jsonify({"error": str(e)}), e.status
+    # Named after the hash of the original and the parameters
+    etag = os.path.basename(file).partition('.')[0]
+    return send_file(file, mimetype=variant.mimetype, conditional=True, etag=etag, max_age=MAX_AGE)
+
 # --- Entities: Design, Treatment, Material ---
 
 def get_entity_model(model_type):
@@ -92,8 +264,9 @@ def get_entity_model(model_type):
 
 @app.route('/api/designs', methods=['GET'])
 @require_auth
+@conditional('designs')
 def get_designs():
-    return jsonify([serialize(d) for d in Design.query.all()])
+    return list_response(Design)
 
 @app.route('/api/designs', methods=['POST'])
 @require_auth
@@ -131,8 +304,9 @@ def delete_design(id):
 
 @app.route('/api/treatments', methods=['GET'])
 @require_auth
+@conditional('treatments')
 def get_treatments():
-    return jsonify([serialize(t) for t in Treatment.query.all()])
+    return list_response(Treatment)
 
 @app.route('/api/treatments', methods=['POST'])
 @require_auth
@@ -170,8 +344,9 @@ def delete_treatment(id):
 
 @app.route('/api/materials', methods=['GET'])
 @require_auth
+@conditional('materials')
 def get_materials():
-    return jsonify([serialize(m) for m in Material.query.all()])
+    return list_response(Material)
 
 @app.route('/api/materials', methods=['POST'])
 @require_auth
@@ -210,33 +385,97 @@ def delete_material(id):
 # --- Lenses ---
 
 @app.route('/api/lenses', methods=['GET'])
+@conditional(lambda: lens_tables(parse_expand(request.args.get('expand'))))
 def get_lenses():
-    lenses = Lens.query.all()
-    return jsonify([serialize(l) for l in lenses])
+    expand = parse_expand(request.args.get('expand'))
+    if request.args.get('stream'):
+        if not expand:
+            return stream_response(Lens, request.args['stream'])
+        return stream_response(
+            Lens,
+            request.args['stream'],
+            options=lens_load_options(expand),
+            serializer=lambda lens: serialize_lens(lens, expand)
+        )
+
+    def build():
+        if expand:
+            payload, rows = list_payload(
+                Lens,
+                options=lens_load_options(expand),
+                serializer=lambda lens: serialize_lens(lens, expand)
+            )
+        else:
+            payload, rows = list_payload(Lens)
+        # Any new or deleted lens can change a list page
+        tags = {('lenses', ANY)}
+        for lens in rows:
+            tags |= lens_tags(lens, expand)
+        return payload, tags
+
+    return cached_json(('lenses', tuple(sorted(request.args.items(multi=True)))), build)
 
 @app.route('/api/lenses/<int:id>', methods=['GET'])
+@conditional(*CATALOG_TABLES)
 def get_lens(id):
-    # Enriched fetch with joins
-    lens = Lens.query.get_or_404(id)
-    data = serialize(lens)
-    
-    # Manually append related info for demonstration dashboard
-    if lens.design:
-        data['design_info'] = serialize(lens.design)
-        if lens.design.image:
-            data['design_info']['image_url'] = lens.design.image.url
-            
-    if lens.material:
-        data['material_info'] = serialize(lens.material)
-        if lens.material.image:
-            data['material_info']['image_url'] = lens.material.image.url
-            
-    if lens.treatment:
-        data['treatment_info'] = serialize(lens.treatment)
-        if lens.treatment.image:
-            data['treatment_info']['image_url'] = lens.treatment.image.url
-            
-    return jsonify(data)
+    # Enriched fetch: lens, components and their images in one joined query
+    expand = set(LENS_EXPANSIONS)
+
+    def build():
+        lens = Lens.query.options(*lens_load_options(expand)).filter_by(id=id).first_or_404()
+        return serialize_lens(lens, expand), lens_tags(lens, expand)
+
+    return cached_json(('lens', id), build)
+
+# Enriched lens by EDI code, the reference used by the lab systems (the
+# unique constraint on edi_code indexes the lookup)
+@app.route('/api/lenses/by-edi/<path:code>', methods=['GET'])
+@conditional(*CATALOG_TABLES)
+def get_lens_by_edi(code):
+    expand = set(LENS_EXPANSIONS)
+
+    def build():
+        lens = Lens.query.options(*lens_load_options(expand)).filter_by(edi_code=code).first_or_404()
+        return serialize_lens(lens, expand), lens_tags(lens, expand)
+
+    return cached_json(('lens-edi', code), build)
+
+MAX_EDI_CODES = int(os.getenv('MAX_EDI_CODES', 10000))
+
+# Resolve a batch of EDI codes ({"codes": [...]}) with one IN query:
+# {"lenses": {code: enriched lens}, "unknown": [codes not in the catalog]}
+@app.route('/api/lenses/by-edi', methods=['POST'])
+def resolve_edi_codes():
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    codes = data.get('codes')
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return jsonify({"error": "codes must be a list of strings"}), 400
+    if len(codes) > MAX_EDI_CODES:
+        return jsonify({"error": f"At most {MAX_EDI_CODES} codes per request"}), 400
+    codes = list(dict.fromkeys(codes))
+    expand = set(LENS_EXPANSIONS)
+    lenses = {}
+    if codes:
+        query = Lens.query.options(*lens_load_options(expand)).filter(Lens.edi_code.in_(codes))
+        components = {}
+        lenses = {lens.edi_code: serialize_lens(lens, expand, components) for lens in query}
+    return jsonify({"lenses": lenses, "unknown": [code for code in codes if code not in lenses]})
+
+# Lens counts per design, material and treatment under the selected
+# ?design_id=1,2&material_id=...&treatment_id=... (null: without one), each
+# facet counted under the selection of the others
+@app.route('/api/lenses/facets', methods=['GET'])
+@conditional(*lens_tables({'design', 'material', 'treatment'}))
+def get_lens_facets():
+    filters = parse_facet_filters(request.args)
+
+    def build():
+        # Any lens or label change can change the counts
+        return facet_index.facets(filters), {(table, ANY) for table in ('lenses', 'designs', 'materials', 'treatments')}
+
+    return cached_json(('lens-facets', filters), build)
 
 @app.route('/api/lenses', methods=['POST'])
 @require_auth
@@ -276,50 +515,200 @@ def delete_lens(id):
     db.session.commit()
     return jsonify({"success": True})
 
-# --- Relationship Management ---
+# --- Search ---
 
-@app.route('/api/link', methods=['POST'])
+# Ranked matches of ?q= over codes, names and descriptions of the catalog;
+# ?types=lens,design,... narrows it, ?limit= caps it
+@app.route('/api/search', methods=['GET'])
 @require_auth
-def link_image():
-    data = request.json
-    entity_type = data.get('type')
-    entity_id = data.get('id')
-    image_id = data.get('image_id')
+@conditional(*CATALOG_TABLES)
+def search_catalog():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing query"}), 400
+    types = parse_types(request.args.get('types'))
+    limit = parse_limit(request.args.get('limit'))
+    return jsonify({"query": query, "results": search(query, types, limit)})
+
+# --- Catalog snapshot ---
+
+# Names of the current public catalog files (enriched lenses, JSON and
+# binary), rebuilt from what changed since the last call; the ETag follows
+# their content
+@app.route('/api/catalog/snapshot', methods=['GET'])
+def get_catalog_snapshot():
+    state = snapshot.current()
+    etag = '-'.join(name.partition('.')[0][:16] for name, _ in state.files.values())
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({
+            "version": state.version,
+            "lenses": state.count,
+            **{fmt: {"url": url_for('get_catalog_file', name=name), "size": len(data)}
+               for fmt, (name, data) in state.files.items()},
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# A snapshot file by content hash: never changes, cached for a year
+@app.route('/api/catalog/snapshot/<name>', methods=['GET'])
+def get_catalog_file(name):
+    data = read_file(name)
+    if data is None:
+        return jsonify({"error": "Snapshot not found"}), 404
+    etag = name.partition('.')[0]
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = app.response_class(data, mimetype=FORMATS[name.partition('.')[2]])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = app.response_class(gzip.decompress(data), mimetype=FORMATS[name.partition('.')[2]])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+# --- Change feed ---
+
+# Rows changed after version ?since= (current state or tombstone), in whole
+# versions of at most ?limit= log entries; ?types=lens,design,... narrows it.
+# Without ?since=, the current version to sync from after a full fetch.
+# Public when only lenses are asked for, like GET /api/lenses
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    types = parse_change_types(request.args.get('types'))
+    view = list_changes if set(types) <= PUBLIC_TYPES else require_auth(list_changes)
+    return view(types)
+
+@conditional(lambda: change_tables(parse_change_types(request.args.get('types'))))
+def list_changes(types):
+    since = parse_since(request.args.get('since'))
+    limit = parse_change_limit(request.args.get('limit'))
+    try:
+        return jsonify(changes_since(since, types, limit))
+    except ChangeLogExpired as e:
+        return jsonify({"error": str(e), "version": e.version}), 410
+
+# --- Dashboard ---
+
+@app.route('/api/stats', methods=['GET'])
+@require_auth
+@conditional(*CATALOG_TABLES)
+def get_catalog_stats():
+    return jsonify(get_stats(g.catalog_versions))
 
-    model = get_entity_model(entity_type)
-    if not model:
-        return jsonify({"error": "Invalid type"}), 400
+@app.route('/api/cache/stats', methods=['GET'])
+@require_auth
+def get_cache_stats():
+    return jsonify({"lenses": lens_cache.stats(), "images": variants.stats()})
 
-    entity = model.query.get(entity_id)
-    if not entity:
-        return jsonify({"error": "Entity not found"}), 404
+# --- Batch ---
 
-    entity.image_id = image_id
-    db.session.commit()
-    return jsonify({"success": True})
+MAX_BATCH_OPERATIONS = int(os.getenv('MAX_BATCH_OPERATIONS', 5000))
 
-@app.route('/api/unlink', methods=['POST'])
+@app.route('/api/batch', methods=['POST'])
 @require_auth
-def unlink_image():
+def batch_mutations():
     data = request.json
-    entity_type = data.get('type')
-    entity_id = data.get('id')
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    operations = data.get('operations')
+    if not isinstance(operations, list):
+        return jsonify({"error": "Missing operations"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+    try:
+        results = apply_batch(operations)
+        db.session.commit()
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e), "index": e.index}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e.orig)}), 409
+    return jsonify({"results": results})
 
-    model = get_entity_model(entity_type)
-    if not model:
-        return jsonify({"error": "Invalid type"}), 400
+# --- Relationship Management ---
 
-    entity = model.query.get(entity_id)
-    if not entity:
+# Targets as {model: (type, [ids])} from {type, id}, {type, ids: [...]} or
+# {items: [{type, id}, ...]} (mixed types); ValueError on a malformed body
+def parse_link_targets(data):
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    items = data.get('items')
+    if items is None:
+        ids = data.get('ids', [data.get('id')])
+        if not isinstance(ids, list):
+            raise ValueError("'ids' must be a list of ids")
+        items = [{'type': data.get('type'), 'id': id} for id in ids]
+    elif not isinstance(items, list):
+        raise ValueError("'items' must be a list")
+    targets = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Each item must be an object with 'type' and 'id'")
+        model = get_entity_model(item.get('type'))
+        if not model:
+            raise ValueError("Invalid type")
+        if not is_id(item.get('id')):
+            raise ValueError("Invalid id")
+        targets.setdefault(model, (item['type'], []))[1].append(item['id'])
+    if not targets:
+        raise ValueError("Nothing to link")
+    return targets
+
+# One UPDATE ... WHERE id IN (...) per type; RETURNING tells which ids exist
+def set_linked_image(targets, image_id):
+    missing = []
+    for model, (entity_type, ids) in targets.items():
+        table = model.__table__
+        updated = set(db.session.scalars(
+            update(table).where(table.c.id.in_(ids)).values(image_id=image_id)
+            .returning(table.c.id)
+        ))
+        mark_changed(db.session, table.name, updated)
+        missing += [{"type": entity_type, "id": id} for id in ids if id not in updated]
+    db.session.commit()
+    return missing
+
+def link_response(data, image_id):
+    try:
+        targets = parse_link_targets(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if image_id is not None and not is_id(image_id):
+        return jsonify({"error": "Invalid image_id"}), 400
+    try:
+        missing = set_linked_image(targets, image_id)
+    except IntegrityError as e:
+        # No such image
+        db.session.rollback()
+        return jsonify({"error": str(e.orig)}), 409
+    if 'items' not in data and 'ids' not in data and missing:
         return jsonify({"error": "Entity not found"}), 404
+    return jsonify({"success": True, "missing": missing})
 
-    entity.image_id = None
-    db.session.commit()
-    return jsonify({"success": True})
+@app.route('/api/link', methods=['POST'])
+@require_auth
+def link_image():
+    data = request.json
+    if not isinstance(data, dict) or 'image_id' not in data:
+        return jsonify({"error": "Expected a JSON object with image_id"}), 400
+    return link_response(data, data['image_id'])
+
+@app.route('/api/unlink', methods=['POST'])
+@require_auth
+def unlink_image():
+    return link_response(request.json, None)
 
-# Create tables if they don't exist
-with app.app_context():
-    db.create_all()
+# Bring the schema up to date with migrations/ (set AUTO_MIGRATE=0 when
+# `flask db upgrade` runs as a separate deploy step)
+if os.getenv('AUTO_MIGRATE', '1') != '0':
+    with app.app_context():
+        upgrade_schema()
 
 if __name__ == '__main__':
     debug_mode = os.getenv('FLASK_ENV') == 'development'
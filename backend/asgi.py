@@ -0,0 +1,179 @@
+"""
+Async (ASGI) read path for the public demonstrator endpoints.
+
+Serves ``GET /api/lenses`` (``?stream=`` included) and ``GET /api/lenses/<id>``
+with the same query parameters, bodies and errors as app.py, on an async
+SQLAlchemy engine, so a single worker keeps many requests in flight while they
+wait on the database.
+It also serves ``GET /api/changes/stream``, the Server-Sent Events push of
+catalog changes (see broadcast.py), whose connections stay open. Writes,
+authentication and every other route stay on the Flask app; a proxy can route
+these public paths here:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 2
+
+DATABASE_URL is reused with its async driver (asyncpg for PostgreSQL,
+aiosqlite for SQLite).
+"""
+
+import contextlib
+import json
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.exceptions import NotFound
+
+from broadcast import Broadcaster
+from changes import parse_since
+from lenses import LENS_EXPANSIONS, lens_load_options, parse_expand, serialize_lens
+from listing import STREAM_BATCH_SIZE, ListQuery, ListQueryError, check_stream, encode_stream_chunk
+from models import Lens
+from serializers import column_select, row_serializer
+
+load_dotenv()
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def create_engine_from_env():
+    url = async_database_url(os.getenv('DATABASE_URL', 'postgresql://vittion:vittion@db:5432/vittion'))
+    options = {}
+    if url.get_backend_name() == 'postgresql':
+        options = {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 20)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True,
+        }
+    return create_async_engine(url, **options)
+
+
+engine = create_engine_from_env()
+Session = async_sessionmaker(engine, expire_on_commit=False)
+broadcaster = Broadcaster(engine)
+
+
+def json_response(payload, status=200):
+    # Byte-for-byte what Flask's jsonify produces outside debug mode
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n'
+    return Response(body, status_code=status, media_type='application/json')
+
+
+def not_found():
+    # Flask's (werkzeug's) default 404 page
+    return Response(NotFound().get_body(), status_code=404, media_type='text/html')
+
+
+async def get_lenses(request):
+    fmt = request.query_params.get('stream')
+    try:
+        expand = parse_expand(request.query_params.get('expand'))
+        params = ListQuery.from_args(Lens, request.query_params)
+        if fmt:
+            mimetype = check_stream(fmt, params)
+    except ListQueryError as e:
+        return json_response({'error': str(e)}, 400)
+    if fmt:
+        return StreamingResponse(stream_lenses(params, expand, fmt), media_type=mimetype)
+
+    async with Session() as session:
+        if expand:
+            stmt = params.apply(select(Lens).options(*lens_load_options(expand)))
+            rows = (await session.scalars(stmt)).unique().all()
+            serializer = lambda lens: serialize_lens(lens, expand)
+        else:
+            rows = (await session.execute(params.apply(column_select(Lens)))).all()
+            serializer = row_serializer(Lens)
+        rows, next_cursor = params.page(rows)
+        items = [serializer(row) for row in rows]
+
+    if not params.paginated:
+        return json_response(items)
+    return json_response({'items': items, 'next_cursor': next_cursor})
+
+
+async def get_lens(request):
+    expand = set(LENS_EXPANSIONS)
+    stmt = select(Lens).options(*lens_load_options(expand)).where(Lens.id == request.path_params['id'])
+    async with Session() as session:
+        lens = (await session.scalars(stmt)).unique().first()
+        if lens is None:
+            return not_found()
+        return json_response(serialize_lens(lens, expand))
+
+
+# The whole filtered collection, as app.py's stream_response() encodes it
+async def stream_lenses(params, expand, fmt):
+    async with Session() as session:
+        if expand:
+            stmt = params.apply(select(Lens).options(*lens_load_options(expand)))
+            result = await session.stream_scalars(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+            serializer = lambda lens: serialize_lens(lens, expand)
+        else:
+            stmt = params.apply(column_select(Lens))
+            result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+            serializer = row_serializer(Lens)
+        if fmt == 'json':
+            yield '['
+        first = True
+        async for rows in result.partitions(STREAM_BATCH_SIZE):
+            # Encoded like Flask's app.json.dumps
+            batch = [json.dumps(serializer(row), sort_keys=True) for row in rows]
+            yield encode_stream_chunk(fmt, batch, first)
+            first = False
+        if fmt == 'json':
+            yield ']'
+
+
+# Change notifications as they are committed; EventSource resumes after the
+# Last-Event-ID it got (or ?since=, a version from GET /api/changes)
+async def stream_changes(request):
+    try:
+        since = parse_since(request.headers.get('last-event-id') or request.query_params.get('since'))
+    except ListQueryError as e:
+        return json_response({'error': str(e)}, 400)
+    if broadcaster.full():
+        return json_response({'error': 'Too many clients'}, 503)
+    return StreamingResponse(broadcaster.stream(since), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Unbuffered through nginx
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await broadcaster.start()
+    yield
+    await broadcaster.stop()
+    await engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/lenses', get_lenses, methods=['GET']),
+        Route('/api/lenses/{id:int}', get_lens, methods=['GET']),
+        Route('/api/changes/stream', stream_changes, methods=['GET']),
+    ],
+    # Same origins as app.py
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=['http://localhost:5173', 'http://localhost:3000',
+                       os.getenv('FRONTEND_URL', 'http://localhost:5173')],
+        allow_credentials=True,
+    )],
+    lifespan=lifespan,
+)
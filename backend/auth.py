@@ -9,34 +9,130 @@ Provides:
 
 from flask import Blueprint, request, jsonify, redirect, current_app, url_for
 from authlib.integrations.requests_client import OAuth2Session
+from collections import OrderedDict
 from functools import wraps
 import jwt
 import os
+import secrets
+import threading
+import time
 from datetime import datetime, timedelta, timezone
+from token_store import create_token_store, start_sweeper
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
-# In-memory storage for refresh tokens (use Redis/DB in production)
-# Format: {refresh_token: {"user_id": str, "expires_at": datetime}}
-refresh_tokens = {}
+# Refresh token store (see token_store.py), chosen with REFRESH_TOKEN_STORE
+# Records: {"user_id": str, "user_data": dict, "expires_at": datetime}
+# Created when the blueprint is registered (in memory until then, e.g. for
+# the benchmarks): always reach it through get_refresh_tokens()
+_refresh_tokens = None
+
+# Settings read from the environment once, when the blueprint is registered
+# (after app.py has loaded .env), instead of on every token operation
+_config = {}
+
+
+def _load_config():
+    _config.update(
+        secret=os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me'),
+        access_expires=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 900)),  # 15 minutes
+        refresh_expires=int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 604800)),  # 7 days
+        token_cache_size=int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 4096)),
+        github_client_id=os.getenv('GITHUB_CLIENT_ID'),
+        github_client_secret=os.getenv('GITHUB_CLIENT_SECRET'),
+        github_redirect_uri=os.getenv('GITHUB_REDIRECT_URI', 'http://localhost:5000/api/auth/callback'),
+        frontend_url=os.getenv('FRONTEND_URL', 'http://localhost:5173'),
+        token_sweep_interval=int(os.getenv('REFRESH_TOKEN_SWEEP_INTERVAL', 300)),
+    )
+
+
+def get_config() -> dict:
+    if not _config:
+        _load_config()
+    return _config
+
+
+def get_refresh_tokens():
+    global _refresh_tokens
+    if _refresh_tokens is None:
+        _refresh_tokens = create_token_store('memory')
+    return _refresh_tokens
+
+
+@auth_bp.record_once
+def _configure(state):
+    global _refresh_tokens
+    _load_config()
+    verified_tokens.resize(_config['token_cache_size'])
+    _refresh_tokens = create_token_store()
+
+
+@auth_bp.before_app_request
+def _start_token_sweeper():
+    start_sweeper(current_app._get_current_object(), get_refresh_tokens(),
+                  get_config()['token_sweep_interval'])
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified access-token payloads, each kept until its ``exp``."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resize(self, maxsize: int):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, token: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry['exp'] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry
+
+    def put(self, token: str, payload: dict):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[token] = payload
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_tokens = VerifiedTokenCache(4096)
 
 
 def get_oauth_client():
     """Create OAuth2 session for GitHub."""
+    config = get_config()
     return OAuth2Session(
-        client_id=os.getenv('GITHUB_CLIENT_ID'),
-        client_secret=os.getenv('GITHUB_CLIENT_SECRET'),
+        client_id=config['github_client_id'],
+        client_secret=config['github_client_secret'],
         authorization_endpoint='https://github.com/login/oauth/authorize',
         token_endpoint='https://github.com/login/oauth/access_token',
-        redirect_uri=os.getenv('GITHUB_REDIRECT_URI', 'http://localhost:5000/api/auth/callback')
+        redirect_uri=config['github_redirect_uri']
     )
 
 
 def generate_tokens(user_data: dict) -> dict:
     """Generate access and refresh tokens for a user."""
-    secret = os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me')
-    access_expires = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 900))  # 15 minutes
-    refresh_expires = int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 604800))  # 7 days
+    config = get_config()
+    secret = config['secret']
+    access_expires = config['access_expires']
+    refresh_expires = config['refresh_expires']
     
     now = datetime.now(timezone.utc)
     
@@ -57,16 +153,17 @@ def generate_tokens(user_data: dict) -> dict:
         'sub': str(user_data['id']),
         'iat': now,
         'exp': now + timedelta(seconds=refresh_expires),
-        'type': 'refresh'
+        'type': 'refresh',
+        'jti': secrets.token_urlsafe(16)  # unique even when issued in the same second
     }
     refresh_token = jwt.encode(refresh_payload, secret, algorithm='HS256')
     
     # Store refresh token
-    refresh_tokens[refresh_token] = {
+    get_refresh_tokens().put(refresh_token, {
         'user_id': str(user_data['id']),
         'user_data': user_data,
         'expires_at': now + timedelta(seconds=refresh_expires)
-    }
+    })
     
     return {
         'access_token': access_token,
@@ -78,9 +175,8 @@ def generate_tokens(user_data: dict) -> dict:
 
 def decode_token(token: str, token_type: str = 'access') -> dict | None:
     """Decode and validate a JWT token."""
-    secret = os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me')
     try:
-        payload = jwt.decode(token, secret, algorithms=['HS256'])
+        payload = jwt.decode(token, get_config()['secret'], algorithms=['HS256'])
         if payload.get('type') != token_type:
             return None
         return payload
@@ -90,6 +186,16 @@ def decode_token(token: str, token_type: str = 'access') -> dict | None:
         return None
 
 
+def verify_access_token(token: str) -> dict | None:
+    """Validate an access token, reusing the payload of a recent verification."""
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = decode_token(token, 'access')
+        if payload is not None:
+            verified_tokens.put(token, payload)
+    return payload
+
+
 def require_auth(f):
     """Decorator to protect routes requiring authentication."""
     @wraps(f)
@@ -100,7 +206,7 @@ def require_auth(f):
             return jsonify({'error': 'Missing or invalid authorization header'}), 401
         
         token = auth_header[7:]  # Remove 'Bearer ' prefix
-        payload = decode_token(token, 'access')
+        payload = verify_access_token(token)
         
         if not payload:
             return jsonify({'error': 'Invalid or expired token'}), 401
@@ -157,7 +263,7 @@ def callback():
         tokens = generate_tokens(user_data)
         
         # Redirect to frontend with tokens in URL fragment (more secure than query params)
-        frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:5173')
+        frontend_url = get_config()['frontend_url']
         redirect_url = (
             f"{frontend_url}/login/callback"
             f"#access_token={tokens['access_token']}"
@@ -169,7 +275,7 @@ def callback():
         
     except Exception as e:
         current_app.logger.error(f"OAuth callback error: {e}")
-        frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:5173')
+        frontend_url = get_config()['frontend_url']
         return redirect(f"{frontend_url}/login?error=oauth_failed")
 
 
@@ -187,22 +293,19 @@ def refresh():
     if not payload:
         return jsonify({'error': 'Invalid or expired refresh token'}), 401
     
-    # Check if refresh token is in our store and not revoked
-    token_data = refresh_tokens.get(refresh_token)
+    # Take the token out of the store atomically: it is revoked whatever
+    # happens next, and a concurrent refresh with it on another worker fails
+    token_data = get_refresh_tokens().pop(refresh_token)
     if not token_data:
         return jsonify({'error': 'Refresh token not found or revoked'}), 401
     
     # Check expiry
     if datetime.now(timezone.utc) > token_data['expires_at']:
-        del refresh_tokens[refresh_token]
         return jsonify({'error': 'Refresh token expired'}), 401
     
     # Generate new tokens
     new_tokens = generate_tokens(token_data['user_data'])
     
-    # Revoke old refresh token
-    del refresh_tokens[refresh_token]
-    
     return jsonify(new_tokens)
 
 
@@ -219,15 +322,12 @@ def logout():
     data = request.get_json() or {}
     refresh_token = data.get('refresh_token')
     
-    if refresh_token and refresh_token in refresh_tokens:
-        del refresh_tokens[refresh_token]
+    if refresh_token:
+        get_refresh_tokens().delete(refresh_token)
     
     return jsonify({'success': True})
 
 
 def cleanup_expired_tokens():
-    """Remove expired refresh tokens from storage."""
-    now = datetime.now(timezone.utc)
-    expired = [k for k, v in refresh_tokens.items() if v['expires_at'] < now]
-    for token in expired:
-        del refresh_tokens[token]
+    """Remove expired refresh tokens from storage (also run by the sweeper)."""
+    return get_refresh_tokens().purge_expired()
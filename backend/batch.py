@@ -0,0 +1,174 @@
+"""
+Transactional batch mutations for the admin dashboard.
+
+A batch is an ordered list of operations::
+
+    {"op": "create", "type": "lenses", "data": {...}}
+    {"op": "update", "type": "designs", "id": 3, "data": {...}}
+    {"op": "delete", "type": "images", "id": 7}
+    {"op": "link", "type": "Design", "id": 3, "image_id": 7}
+    {"op": "unlink", "type": "Matière", "id": 2}
+
+``type`` is a collection name (``images``, ``designs``, ``treatments``,
+``materials``, ``lenses``) or one of the /api/link names. Consecutive
+operations of the same kind are applied as one set-based statement (multi-row
+INSERT, executemany UPDATE, ``DELETE ... WHERE id IN``) and the whole batch is
+committed once; any database error rolls every operation back.
+"""
+
+from itertools import groupby
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from events import cascaded_changes, mark_changed
+from listing import is_id
+from models import db, Image, Design, Treatment, Material, Lens
+from serializers import row_serializer
+
+RESOURCES = {
+    'images': Image,
+    'designs': Design,
+    'treatments': Treatment,
+    'materials': Material,
+    'lenses': Lens,
+    'Design': Design,
+    'Traitement': Treatment,
+    'Matière': Material,
+}
+
+# Fields accepted by the create/update handlers of each model
+WRITABLE_FIELDS = {
+    Image: ('name', 'url', 'category', 'resolution'),
+    Design: ('code', 'name', 'description', 'image_id'),
+    Treatment: ('code', 'name', 'description', 'image_id'),
+    Material: ('code', 'name', 'description', 'image_id'),
+    Lens: ('name', 'description', 'edi_code', 'design_id', 'material_id', 'treatment_id'),
+}
+
+LINKABLE = (Design, Treatment, Material)
+
+OPERATIONS = ('create', 'update', 'delete', 'link', 'unlink')
+
+
+class BatchError(ValueError):
+    """Raised for an invalid operation; ``index`` is its position in the batch."""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+def parse_operation(index, raw):
+    if not isinstance(raw, dict):
+        raise BatchError(index, 'Operation must be an object')
+    op = raw.get('op')
+    if op not in OPERATIONS:
+        raise BatchError(index, f"Invalid op '{op}'")
+    model = RESOURCES.get(raw.get('type'))
+    if model is None:
+        raise BatchError(index, f"Invalid type '{raw.get('type')}'")
+    if op in ('link', 'unlink') and model not in LINKABLE:
+        raise BatchError(index, f"Cannot {op} images on '{raw.get('type')}'")
+
+    parsed = {'index': index, 'op': op, 'model': model}
+    if op != 'create':
+        if not is_id(raw.get('id')):
+            raise BatchError(index, 'Missing or invalid id')
+        parsed['id'] = raw['id']
+    if op in ('create', 'update'):
+        data = raw.get('data')
+        if not isinstance(data, dict):
+            raise BatchError(index, 'Missing data')
+        parsed['values'] = {k: data[k] for k in WRITABLE_FIELDS[model] if k in data}
+        for key, value in parsed['values'].items():
+            if key.endswith('_id') and value is not None and not is_id(value):
+                raise BatchError(index, f'Invalid {key}')
+        # As create_image/update_image: url is required and must be a string
+        if model is Image and (op == 'create' or 'url' in data) and not isinstance(data.get('url'), str):
+            raise BatchError(index, 'url must be a string')
+    if op == 'link':
+        if not is_id(raw.get('image_id')):
+            raise BatchError(index, 'Missing or invalid image_id')
+        parsed['values'] = {'image_id': raw['image_id']}
+    if op == 'unlink':
+        parsed['values'] = {'image_id': None}
+    return parsed
+
+
+def _group_key(operation):
+    # Creates and updates can only share a statement when they set the same
+    # columns (executemany binds every column of the first row for each row)
+    columns = tuple(sorted(operation['values'])) if operation['op'] in ('create', 'update') else ()
+    return operation['op'], operation['model'], columns
+
+
+def _existing_ids(model, ids):
+    table = model.__table__
+    return set(db.session.scalars(select(table.c.id).where(table.c.id.in_(ids))))
+
+
+def _create(model, group):
+    table = model.__table__
+    values = [operation['values'] for operation in group]
+    if db.session.get_bind().dialect.name != 'sqlite':
+        stmt = insert(table).returning(*table.columns, sort_by_parameter_order=True)
+        rows = db.session.execute(stmt, values).all()
+    else:
+        # SQLite would fall back to one INSERT per row to guarantee the order;
+        # its new autoincrement ids follow insertion order anyway
+        rows = sorted(db.session.execute(insert(table).returning(*table.columns), values), key=lambda row: row.id)
+    serializer = row_serializer(model)
+    mark_changed(db.session, table.name, [row.id for row in rows])
+    return [{'status': 201, 'id': row.id, 'item': serializer(row)} for row in rows]
+
+
+def _update(model, group):
+    table = model.__table__
+    existing = _existing_ids(model, {operation['id'] for operation in group})
+    params = [
+        {'_id': operation['id'], **operation['values']}
+        for operation in group if operation['id'] in existing and operation['values']
+    ]
+    if params:
+        values = [{k: v for k, v in p.items() if k != '_id'} for p in params]
+        if all(v == values[0] for v in values):
+            # Same new values for every row (unlink, re-pointing a family...)
+            ids = [p['_id'] for p in params]
+            db.session.execute(update(table).where(table.c.id.in_(ids)).values(values[0]))
+        else:
+            columns = {name: bindparam(name) for name in values[0]}
+            db.session.execute(update(table).where(table.c.id == bindparam('_id')).values(columns), params)
+        mark_changed(db.session, table.name, existing)
+    return [
+        {'status': 200 if operation['id'] in existing else 404, 'id': operation['id']}
+        for operation in group
+    ]
+
+
+def _delete(model, group):
+    table = model.__table__
+    existing = _existing_ids(model, {operation['id'] for operation in group})
+    if existing:
+        # Referencing rows are unlinked by ON DELETE SET NULL
+        cascaded = cascaded_changes(db.session, table, existing)
+        db.session.execute(delete(table).where(table.c.id.in_(existing)))
+        mark_changed(db.session, table.name, existing)
+        for other in sorted({name for name, _ in cascaded}):
+            mark_changed(db.session, other, [id for name, id in cascaded if name == other])
+    return [
+        {'status': 200 if operation['id'] in existing else 404, 'id': operation['id']}
+        for operation in group
+    ]
+
+
+HANDLERS = {'create': _create, 'update': _update, 'link': _update, 'unlink': _update, 'delete': _delete}
+
+
+def apply_batch(raw_operations):
+    """Validate and apply operations in order; the caller commits."""
+    operations = [parse_operation(i, raw) for i, raw in enumerate(raw_operations)]
+    results = []
+    for (op, model, _), group in groupby(operations, key=_group_key):
+        group = list(group)
+        results.extend(HANDLERS[op](model, group))
+    return results
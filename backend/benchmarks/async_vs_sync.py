@@ -0,0 +1,134 @@
+"""
+Load test: the public lens endpoints on the sync (gunicorn) and async
+(uvicorn + asgi.py) paths at high concurrency.
+
+Both servers run a single worker process against the same database; gunicorn
+gets --threads threads, uvicorn its event loop. --connections concurrent
+keep-alive connections, driven from one asyncio client, replay GET /api/lenses
+pages and GET /api/lenses/<id> for --duration seconds per server, and the
+requests/s with p50/p99 latency are reported. The async path pays off when
+requests wait on the database, so point BENCH_DATABASE_URL at a seeded Postgres
+for representative numbers; the default is a SQLite file filled with --lenses
+synthetic rows.
+
+Usage (from backend/):
+    python -m benchmarks.async_vs_sync [--connections 256] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import http.client
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.scaling import percentile, populate
+
+PORT = 5098
+
+SERVERS = {
+    'sync': [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--access-logfile', '/dev/null', 'app:app',
+    ],
+    'async': [
+        sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1',
+        '--port', str(PORT), '--no-access-log',
+    ],
+}
+
+
+def wait_ready(path, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', path)
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('server did not become ready')
+
+
+async def connection(paths, end, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    try:
+        while time.time() < end:
+            start = time.perf_counter()
+            writer.write(f'GET {next(paths)} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            head = await reader.readuntil(b'\r\n\r\n')
+            status = int(head.split(b' ', 2)[1])
+            length = 0
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        writer.close()
+
+
+async def drive(paths, connections, duration):
+    latencies, errors = [], []
+    end = time.time() + duration
+    await asyncio.gather(*(connection(paths, end, latencies, errors) for _ in range(connections)))
+    return sorted(latencies), errors
+
+
+def run(name, args, env, paths):
+    env = dict(env, WEB_CONCURRENCY='1', GUNICORN_THREADS=str(args.threads),
+               FLASK_PORT=str(PORT), FLASK_ENV='production')
+    server = subprocess.Popen(SERVERS[name], env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready('/api/lenses/1')
+        latencies, errors = asyncio.run(drive(paths, args.connections, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+    rate = len(latencies) / args.duration
+    print(f'{name:<6} {rate:9.1f} req/s   '
+          f'p50 {percentile(latencies, 0.5) * 1000:7.1f} ms   '
+          f'p99 {percentile(latencies, 0.99) * 1000:7.1f} ms   '
+          f'errors {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--connections', type=int, default=256)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads for the sync worker')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--lenses', type=int, default=1000)
+    args = parser.parse_args()
+
+    database_url = os.getenv('BENCH_DATABASE_URL')
+    if not database_url:
+        database_url = f'sqlite:///{tempfile.mkdtemp()}/async_vs_sync.db'
+    populate(database_url, args.lenses)
+    env = dict(os.environ, DATABASE_URL=database_url,
+               # Measure the request path, not the response cache
+               LENS_CACHE_SIZE='0')
+
+    # Kiosk-like mix: list pages, enriched pages and single lenses
+    paths = itertools.cycle([
+        '/api/lenses?limit=50',
+        '/api/lenses?limit=20&expand=design,material,treatment,images',
+        *(f'/api/lenses/{i}' for i in range(1, 9)),
+    ])
+    print(f'{os.cpu_count()} CPUs, {args.connections} connections, 1 worker each')
+    for name in SERVERS:
+        run(name, args, env, paths)
+
+
+if __name__ == '__main__':
+    main()
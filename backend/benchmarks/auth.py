@@ -0,0 +1,71 @@
+"""
+Benchmark: per-request access-token verification cost in require_auth,
+before (os.getenv + HS256 verify + JSON decode on every request) and after
+(verified-token cache), for a given token reuse rate.
+
+Usage (from backend/):
+    python -m benchmarks.auth [--requests 100000] [--reuse 0.99]
+
+With --reuse 0.99 one request in a hundred presents a token not seen before,
+e.g. a dashboard session issuing a few hundred calls per 15-minute token.
+"""
+
+import argparse
+import os
+import random
+import time
+
+import jwt
+
+from auth import _load_config, decode_token, generate_tokens, verified_tokens, verify_access_token
+
+
+def verify_before(token):
+    # decode_token as it was: environment lookup and full verify every time
+    secret = os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me')
+    try:
+        payload = jwt.decode(token, secret, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    return payload if payload.get('type') == 'access' else None
+
+
+def token_stream(requests, reuse):
+    rng = random.Random(42)
+    token, user = None, 0
+    for _ in range(requests):
+        if token is None or rng.random() > reuse:
+            user += 1
+            token = generate_tokens({'id': user, 'login': f'user{user}'})['access_token']
+        yield token
+
+
+def timed(verify, tokens):
+    start = time.perf_counter()
+    for token in tokens:
+        assert verify(token) is not None
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--reuse', type=float, default=0.99)
+    args = parser.parse_args()
+
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-of-at-least-32-bytes!')
+    _load_config()
+    tokens = list(token_stream(args.requests, args.reuse))
+    assert verify_before(tokens[0]) == decode_token(tokens[0])
+
+    before = timed(verify_before, tokens)
+    verified_tokens.clear()
+    after = timed(verify_access_token, tokens)
+    per_request = lambda total: total / args.requests * 1e6
+    print(f'{args.requests} requests, {len(set(tokens))} distinct tokens (reuse {args.reuse:.0%})')
+    print(f'before: {per_request(before):6.2f} us/request')
+    print(f'after:  {per_request(after):6.2f} us/request   speedup x{before / after:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic catalog generator for the benchmarks and query-budget checks.
+
+Builds a catalog shaped like the real one at any size: lenses are
+design x material x treatment combinations, so each component family grows
+with the cube root of the lens count; most components have an image and a
+few lenses miss a component. Output is deterministic for a given seed.
+
+Usage (from backend/, into DATABASE_URL, which must have no lenses yet):
+    python -m benchmarks.catalog --lenses 100000
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import insert
+
+from events import mark_changed
+from importer import Importer
+from models import Image, Design, Treatment, Material, Lens
+
+BATCH_SIZE = 10000
+
+COMPONENTS = (
+    (Design, 'D', ('Progressive', 'Single vision', 'Bifocal', 'Office', 'Sport', 'Driving')),
+    (Material, 'M', ('Polycarbonate', 'Trivex', 'Mineral', 'High index', 'CR-39')),
+    (Treatment, 'T', ('Anti-reflective', 'Blue light', 'Photochromic', 'Hard coat', 'UV')),
+)
+
+
+def catalog_size(lenses):
+    """Return ``(images, components_per_family)`` for a catalog of ``lenses``."""
+    components = max(4, round(lenses ** (1 / 3)))
+    return 3 * components + components // 2, components
+
+
+def generate_catalog(session, lenses, seed=0):
+    """Insert a synthetic catalog of ``lenses`` lenses; returns row counts."""
+    rng = random.Random(seed)
+    image_count, per_family = catalog_size(lenses)
+    counts = {}
+
+    images = [
+        {'id': i, 'name': f'image-{i}', 'url': f'https://cdn.example.com/catalog/{i}.jpg',
+         'category': ('Design', 'Matière', 'Traitement')[i % 3], 'resolution': '1024x1024'}
+        for i in range(1, image_count + 1)
+    ]
+    session.execute(insert(Image.__table__), images)
+    counts['images'] = image_count
+
+    families = []
+    for model, prefix, names in COMPONENTS:
+        rows = [
+            {'id': i, 'code': f'{prefix}{i:04d}', 'name': f'{names[i % len(names)]} {i}',
+             'description': f'{names[i % len(names)]} family, generation {i // len(names) + 1}',
+             'image_id': rng.randint(1, image_count) if rng.random() < 0.9 else None}
+            for i in range(1, per_family + 1)
+        ]
+        session.execute(insert(model.__table__), rows)
+        counts[model.__tablename__] = per_family
+        families.append(rows)
+
+    def component_id():
+        return rng.randint(1, per_family) if rng.random() < 0.98 else None
+
+    batch = []
+    for i in range(1, lenses + 1):
+        design_id, material_id, treatment_id = component_id(), component_id(), component_id()
+        name = ' '.join(
+            family[component - 1]['name'] for family, component in
+            zip(families, (design_id, material_id, treatment_id)) if component
+        )
+        batch.append({
+            'id': i, 'name': name or f'Lens {i}', 'edi_code': f'{i:08d}',
+            'description': f'Synthetic lens {i}' if i % 4 else None,
+            'design_id': design_id, 'material_id': material_id, 'treatment_id': treatment_id,
+        })
+        if len(batch) >= BATCH_SIZE:
+            session.execute(insert(Lens.__table__), batch)
+            batch = []
+    if batch:
+        session.execute(insert(Lens.__table__), batch)
+    counts['lenses'] = lenses
+    for name in counts:
+        mark_changed(session, name)
+    session.commit()
+
+    # Explicit ids leave Postgres sequences behind
+    importer = Importer(session)
+    for model in (Image, Design, Material, Treatment, Lens):
+        importer.fix_sequence(model)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lenses', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from app import app
+    from models import db
+    with app.app_context():
+        if db.session.query(Lens.id).first():
+            parser.error('the database already has lenses')
+        start = time.perf_counter()
+        counts = generate_catalog(db.session, args.lenses, args.seed)
+        print(', '.join(f'{n} {name}' for name, n in counts.items()),
+              f'in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+"""
+Endpoint benchmark suite: every route of app.py and auth.py against a
+synthetic catalog, at one or more scales.
+
+For each scale a catalog of that many lenses (see benchmarks/catalog.py) is
+generated, then every scenario below is driven through the Flask test client
+for --duration seconds (between --min-requests and --max-requests requests)
+and its throughput, latency percentiles and SQL statements per request are
+reported. Untimed setup (rows to delete, refresh tokens) happens between
+requests. Results are written as JSON to --output-dir, one file per scale;
+--compare prints the change against an earlier result file.
+
+The tables of BENCH_DATABASE_URL are dropped and regenerated for each scale;
+without it every scale gets a SQLite file, generated once under --data-dir
+and copied for each run.
+
+Usage (from backend/):
+    python -m benchmarks.endpoints [--scales 1000,100000,1000000] [--duration 2]
+    python -m benchmarks.endpoints --scales 100000 --compare benchmarks/results/<earlier>.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.images import SAMPLE, sample_media
+from benchmarks.scaling import percentile
+
+BATCH_OPERATIONS = 50
+EDI_BATCH_SIZE = 1000
+# Versions behind the catalog a syncing client asks the change feed for
+CHANGES_BEHIND = 100
+# Words of the synthetic catalog (see benchmarks/catalog.py), whole or prefixes
+SEARCH_QUERIES = ('progressive', 'photo', 'd00', 'sport uv', 'trivex anti', 'single vision 12')
+
+
+class Context:
+    """State shared by the scenarios of a run: catalog size, ids, tokens."""
+
+    def __init__(self, app, counts, seed):
+        self.app = app
+        self.counts = counts
+        self.rng = random.Random(seed)
+        self.serial = itertools.count(1)
+        self.headers = {}
+
+    def random_id(self, table):
+        return self.rng.randint(1, self.counts[table])
+
+    def unique(self, prefix):
+        return f'{prefix}-{os.getpid()}-{next(self.serial)}'
+
+    def insert(self, model, **values):
+        from models import db
+        with self.app.app_context():
+            row_id = db.session.execute(model.__table__.insert().values(**values)).inserted_primary_key[0]
+            db.session.commit()
+        return row_id
+
+
+# --- Scenarios: name, method, expected status and build(ctx) -> (path, body) ---
+
+def _component(prefix, table):
+    def create(ctx):
+        return f'/api/{table}', {'code': ctx.unique(prefix), 'name': 'Bench', 'image_id': ctx.random_id('images')}
+
+    def update(ctx):
+        return f"/api/{table}/{ctx.random_id(table)}", {'description': ctx.unique('desc')}
+
+    def delete(ctx):
+        from models import Design, Material, Treatment
+        model = {'designs': Design, 'treatments': Treatment, 'materials': Material}[table]
+        return f'/api/{table}/{ctx.insert(model, code=ctx.unique(prefix), name="Bench")}', None
+
+    def listing(ctx):
+        return f'/api/{table}', None
+
+    return [
+        (f'list {table}', 'GET', 200, listing),
+        (f'create {table}', 'POST', 201, create),
+        (f'update {table}', 'PUT', 200, update),
+        (f'delete {table}', 'DELETE', 200, delete),
+    ]
+
+
+def _create_lens(ctx):
+    return '/api/lenses', {
+        'name': 'Bench lens', 'edi_code': ctx.unique('L'), 'design_id': ctx.random_id('designs'),
+        'material_id': ctx.random_id('materials'), 'treatment_id': ctx.random_id('treatments'),
+    }
+
+
+def _resolve_edi_codes(ctx):
+    # An order batch: mostly known codes, a few unknown ones
+    codes = [f"{ctx.random_id('lenses'):08d}" for _ in range(EDI_BATCH_SIZE - 10)]
+    return '/api/lenses/by-edi', {'codes': codes + [ctx.unique('unknown') for _ in range(10)]}
+
+
+def _delete_lens(ctx):
+    from models import Lens
+    return f"/api/lenses/{ctx.insert(Lens, name='Bench', edi_code=ctx.unique('L'))}", None
+
+
+def _delete_image(ctx):
+    from models import Image
+    return f"/api/images/{ctx.insert(Image, name='Bench', url='https://cdn.example.com/bench.jpg')}", None
+
+
+def _batch(ctx):
+    operations = [
+        {'op': 'create', 'type': 'lenses', 'data': {'name': 'Batch', 'edi_code': ctx.unique('B')}}
+        for _ in range(BATCH_OPERATIONS // 2)
+    ]
+    operations += [
+        {'op': 'update', 'type': 'lenses', 'id': ctx.random_id('lenses'), 'data': {'description': 'batch'}}
+        for _ in range(BATCH_OPERATIONS // 2 - 5)
+    ]
+    operations += [
+        {'op': 'link', 'type': 'Design', 'id': ctx.random_id('designs'), 'image_id': ctx.random_id('images')}
+        for _ in range(5)
+    ]
+    return '/api/batch', {'operations': operations}
+
+
+def _changes(ctx, types=None):
+    from versions import CHANGES_COUNTER, current_versions
+    with ctx.app.app_context():
+        current = current_versions([CHANGES_COUNTER])[CHANGES_COUNTER]
+    path = f'/api/changes?since={max(0, current - CHANGES_BEHIND)}'
+    return (path + f'&types={types}' if types else path), None
+
+
+def _snapshot_file(ctx):
+    response = ctx.app.test_client().get('/api/catalog/snapshot')
+    return response.json[ctx.rng.choice(['json', 'bin'])]['url'], None
+
+
+def _refresh(ctx):
+    from auth import generate_tokens
+    with ctx.app.app_context():
+        tokens = generate_tokens({'id': 0, 'login': 'bench'})
+    return '/api/auth/refresh', {'refresh_token': tokens['refresh_token']}
+
+
+def _static(path, body=None):
+    return lambda ctx: (path, body)
+
+
+SCENARIOS = [
+    ('healthz', 'GET', 200, _static('/healthz')),
+    ('readyz', 'GET', 200, _static('/readyz')),
+    ('metrics', 'GET', 200, _static('/metrics')),
+    # Public lens endpoints
+    ('list lenses (all)', 'GET', 200, _static('/api/lenses')),
+    ('list lenses (page)', 'GET', 200, _static('/api/lenses?limit=50')),
+    ('list lenses (sorted page)', 'GET', 200, _static('/api/lenses?limit=50&sort=-name')),
+    ('list lenses (by design)', 'GET', 200, lambda ctx: (f"/api/lenses?limit=50&design_id={ctx.random_id('designs')}", None)),
+    ('list lenses (expanded page)', 'GET', 200, _static('/api/lenses?limit=50&expand=design,material,treatment,images')),
+    ('stream lenses (ndjson)', 'GET', 200, _static('/api/lenses?stream=ndjson')),
+    ('get lens', 'GET', 200, lambda ctx: (f"/api/lenses/{ctx.random_id('lenses')}", None)),
+    ('lens by EDI code', 'GET', 200, lambda ctx: (f"/api/lenses/by-edi/{ctx.random_id('lenses'):08d}", None)),
+    ('resolve EDI codes', 'POST', 200, _resolve_edi_codes),
+    ('lens facets', 'GET', 200, _static('/api/lenses/facets')),
+    ('lens facets (selection)', 'GET', 200, lambda ctx: (
+        f"/api/lenses/facets?design_id={ctx.random_id('designs')}"
+        f"&material_id={ctx.random_id('materials')},{ctx.random_id('materials')}", None)),
+    ('create lens', 'POST', 201, _create_lens),
+    ('update lens', 'PUT', 200, lambda ctx: (f"/api/lenses/{ctx.random_id('lenses')}", {'description': ctx.unique('d')})),
+    ('delete lens', 'DELETE', 200, _delete_lens),
+    # Images and components
+    ('list images', 'GET', 200, _static('/api/images')),
+    ('get image', 'GET', 200, lambda ctx: (f"/api/images/{ctx.random_id('images')}", None)),
+    ('create image', 'POST', 201, lambda ctx: ('/api/images', {'name': ctx.unique('img'), 'url': 'https://cdn.example.com/x.jpg'})),
+    ('update image', 'PUT', 200, lambda ctx: (f"/api/images/{ctx.random_id('images')}", {'category': 'Design'})),
+    ('delete image', 'DELETE', 200, _delete_image),
+    ('image original', 'GET', 200, _static(f'/api/media/{SAMPLE}')),
+    ('image variant (cached)', 'GET', 200, _static(f'/api/media/{SAMPLE}?w=320&h=240&fit=cover')),
+    # A width not asked before: rendered by the image workers
+    ('image variant (render)', 'GET', 200, lambda ctx: (f"/api/media/{SAMPLE}?w={100 + next(ctx.serial) % 2000}", None)),
+    *_component('D', 'designs'),
+    *_component('T', 'treatments'),
+    *_component('M', 'materials'),
+    ('link image', 'POST', 200, lambda ctx: ('/api/link', {'type': 'Design', 'id': ctx.random_id('designs'), 'image_id': ctx.random_id('images')})),
+    ('unlink image', 'POST', 200, lambda ctx: ('/api/unlink', {'type': 'Matière', 'id': ctx.random_id('materials')})),
+    ('batch', 'POST', 200, _batch),
+    # Delta sync, after the writes above
+    ('changes (all types)', 'GET', 200, _changes),
+    ('changes (lenses)', 'GET', 200, lambda ctx: _changes(ctx, 'lens')),
+    # Kiosk catalog, refreshed from the writes above
+    ('catalog snapshot (manifest)', 'GET', 200, _static('/api/catalog/snapshot')),
+    ('catalog snapshot (file)', 'GET', 200, _snapshot_file),
+    # Dashboard
+    ('search (words)', 'GET', 200, lambda ctx: (f'/api/search?q={ctx.rng.choice(SEARCH_QUERIES)}', None)),
+    ('search (lens code)', 'GET', 200, lambda ctx: (f"/api/search?q={ctx.random_id('lenses'):08d}", None)),
+    ('stats', 'GET', 200, _static('/api/stats')),
+    ('cache stats', 'GET', 200, _static('/api/cache/stats')),
+    # Authentication
+    ('auth login', 'GET', 302, _static('/api/auth/login')),
+    ('auth callback (no code)', 'GET', 400, _static('/api/auth/callback')),
+    ('auth me', 'GET', 200, _static('/api/auth/me')),
+    ('auth refresh', 'POST', 200, _refresh),
+    ('auth logout', 'POST', 200, _static('/api/auth/logout', {'refresh_token': 'unknown'})),
+]
+
+
+def run_scenario(client, ctx, scenario, args):
+    from query_budget import QueryLog
+
+    name, method, status, build = scenario
+    latencies, queries, statuses = [], 0, {}
+    deadline = time.perf_counter() + args.duration
+    while len(latencies) < args.max_requests and (
+            len(latencies) < args.min_requests or time.perf_counter() < deadline):
+        path, body = build(ctx)
+        with QueryLog() as log:
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body, headers=ctx.headers)
+            response.get_data()
+            response.close()
+            latencies.append(time.perf_counter() - start)
+        queries += log.count
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    total = sum(latencies)
+    latencies.sort()
+    result = {
+        'method': method,
+        'path': path,
+        'requests': len(latencies),
+        'rps': len(latencies) / total if total else None,
+        'mean_ms': total / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'queries_per_request': queries / len(latencies),
+        'statuses': {str(code): n for code, n in sorted(statuses.items())},
+    }
+    if set(statuses) != {status}:
+        result['unexpected_status'] = True
+    return result
+
+
+def prepare_database(scale, args):
+    """Point DATABASE_URL at a catalog of ``scale`` lenses.
+
+    Returns True when the catalog still has to be generated in the database.
+    """
+    url = os.getenv('BENCH_DATABASE_URL')
+    if url:
+        os.environ['DATABASE_URL'] = url
+        return True
+    os.makedirs(args.data_dir, exist_ok=True)
+    pristine = os.path.join(args.data_dir, f'catalog-{scale}-seed{args.seed}.db')
+    if not os.path.exists(pristine):
+        partial = pristine + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.catalog', '--lenses', str(scale), '--seed', str(args.seed)],
+            env=dict(os.environ, DATABASE_URL=f'sqlite:///{partial}'), check=True
+        )
+        os.replace(partial, pristine)
+    work = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    shutil.copyfile(pristine, work)
+    os.environ['DATABASE_URL'] = f'sqlite:///{work}'
+    return False
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(scale, args):
+    generate = prepare_database(scale, args)
+    if args.no_cache:
+        os.environ.update(LENS_CACHE_SIZE='0', STATS_CACHE_TTL='0')
+    os.environ.update(IMAGE_ROOT=sample_media(tempfile.mkdtemp()), IMAGE_CACHE_DIR=tempfile.mkdtemp(),
+                      IMAGE_PROBE_TIMEOUT='0')
+
+    from app import app
+    from auth import generate_tokens
+    from benchmarks.catalog import catalog_size, generate_catalog
+    from models import db
+    from schema import reset_schema
+
+    with app.app_context():
+        if generate:
+            reset_schema()
+            start = time.perf_counter()
+            generate_catalog(db.session, scale, args.seed)
+            print(f'generated {scale} lenses in {time.perf_counter() - start:.1f}s')
+        dialect = db.engine.dialect.name
+        tokens = generate_tokens({'id': 0, 'login': 'bench'})
+
+    images, per_family = catalog_size(scale)
+    counts = {'lenses': scale, 'images': images, 'designs': per_family,
+              'treatments': per_family, 'materials': per_family}
+    ctx = Context(app, counts, args.seed)
+    ctx.headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+    client = app.test_client()
+
+    covered = set()
+    adapter = app.url_map.bind('localhost')
+    results = {}
+    print(f'{"scenario":<30}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"SQL/req":>9}')
+    for scenario in SCENARIOS:
+        if args.only and args.only not in scenario[0]:
+            continue
+        result = run_scenario(client, ctx, scenario, args)
+        covered.add(adapter.match(result['path'].split('?')[0], scenario[1])[0])
+        results[scenario[0]] = result
+        flag = '  unexpected status' if result.get('unexpected_status') else ''
+        print(f"{scenario[0]:<30}{result['rps']:>9.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{result['p99_ms']:>9.2f}{result['queries_per_request']:>9.1f}{flag}")
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    if not args.only and endpoints - covered:
+        print('not benchmarked:', ', '.join(sorted(endpoints - covered)))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'scale': scale,
+            'catalog': counts,
+            'dialect': dialect,
+            'cache': not args.no_cache,
+            'seed': args.seed,
+            'duration': args.duration,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(args.output_dir, f'endpoints-{dialect}-{scale}-{stamp}.json')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {path}')
+    if args.compare:
+        compare(args.compare, report)
+
+
+def compare(baseline_path, report):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} ({baseline['meta']['revision']}, {baseline['meta']['dialect']}, "
+          f"{baseline['meta']['scale']} lenses)")
+    print(f'{"scenario":<30}{"p50 before":>12}{"p50 after":>11}{"change":>9}')
+    for name, result in report['results'].items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+        print(f"{name:<30}{before['p50_ms']:>12.2f}{result['p50_ms']:>11.2f}{change:>+8.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', default='1000,100000')
+    parser.add_argument('--duration', type=float, default=2, help='seconds per scenario')
+    parser.add_argument('--min-requests', type=int, default=5)
+    parser.add_argument('--max-requests', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help='run the scenarios whose name contains this')
+    parser.add_argument('--no-cache', action='store_true', help='disable the response caches')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'vittion-bench'),
+                        help='where generated SQLite catalogs are kept')
+    parser.add_argument('--output-dir', default=os.path.join('benchmarks', 'results'))
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(',')]
+    if len(scales) == 1:
+        return run_scale(scales[0], args)
+    # One process per scale: the app binds its database at import
+    argv, skip = [], False
+    for arg in sys.argv[1:]:
+        if not skip and arg != '--scales' and not arg.startswith('--scales='):
+            argv.append(arg)
+        skip = arg == '--scales'
+    for scale in scales:
+        print(f'\n=== {scale} lenses ===')
+        subprocess.run([sys.executable, '-m', 'benchmarks.endpoints', '--scales', str(scale), *argv], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Lens facets (see facets.py) on a synthetic catalog (see benchmarks/catalog.py):
+the first build of the cube, GET /api/lenses/facets and the cube alone under
+a few selections (median of --repeat), the refresh after a lens update, and
+the same counts computed with GROUP BY queries, one per facet, as a baseline.
+
+Usage (from backend/):
+    python -m benchmarks.facets [--lenses 100000] [--repeat 200]
+
+Reference run (SQLite 3, 100k lenses, 46 components per family, 1 CPU):
+
+    first build                                 1.92 s    (+28 MB peak RSS)
+                                                request       cube    GROUP BY
+    no selection                                2.14 ms    0.15 ms    41.01 ms
+    one design                                  2.15 ms    0.15 ms    23.90 ms
+    design and material                         2.18 ms    0.14 ms    13.07 ms
+    3 designs, 3 materials, 3 treatments        2.32 ms    0.22 ms    28.06 ms
+    20 designs, 20 materials, 20 treatments     7.47 ms    4.93 ms   199.55 ms
+    refresh after a lens update                 2.93 ms
+
+Requests run with the response cache off (LENS_CACHE_SIZE=0), so each one
+reads the cube and encodes the JSON; the rest of their time is Flask and the
+ETag lookup. A selection costs one group per combination of the selected
+values of the other facets, hence the wide one.
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+SELECTIONS = (
+    ('no selection', {}),
+    ('one design', {'design_id': '1'}),
+    ('design and material', {'design_id': '1', 'material_id': '2'}),
+    ('3 designs, 3 materials, 3 treatments', {name: '1,2,3' for name in ('design_id', 'material_id', 'treatment_id')}),
+    ('20 designs, 20 materials, 20 treatments',
+     {name: ','.join(map(str, range(1, 21))) for name in ('design_id', 'material_id', 'treatment_id')}),
+)
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def group_by(app, filters):
+    """The facet counts with one GROUP BY query per facet."""
+    from facets import FACETS
+    from models import db, Lens
+    with app.app_context():
+        for facet, (_, _, column) in enumerate(FACETS):
+            query = db.select(column, db.func.count(Lens.id)).group_by(column)
+            for other, (_, _, other_column) in enumerate(FACETS):
+                if other != facet and filters[other] is not None:
+                    query = query.where(other_column.in_(filters[other]))
+            db.session.execute(query).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lenses', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'vittion-bench'))
+    args = parser.parse_args()
+
+    from benchmarks.endpoints import prepare_database
+    generate = prepare_database(args.lenses, SimpleNamespace(data_dir=args.data_dir, seed=args.seed))
+    os.environ.update(AUTO_MIGRATE='0', LENS_CACHE_SIZE='0')
+
+    from app import app
+    from auth import generate_tokens
+    from werkzeug.datastructures import MultiDict
+    from benchmarks.catalog import catalog_size, generate_catalog
+    from facets import index, parse_facet_filters
+    from models import db
+    from schema import reset_schema, upgrade_schema
+
+    with app.app_context():
+        if generate:
+            reset_schema()
+            generate_catalog(db.session, args.lenses, args.seed)
+        else:
+            upgrade_schema()
+        headers = {'Authorization': 'Bearer ' + generate_tokens({'id': 0, 'login': 'bench'})['access_token']}
+        dialect = db.engine.dialect.name
+    client = app.test_client()
+
+    def facets(selection):
+        response = client.get('/api/lenses/facets', query_string=selection)
+        assert response.status_code == 200, response.json
+        return response.json
+
+    print(f'{dialect}, {args.lenses} lenses, {catalog_size(args.lenses)[1]} components per family, '
+          f'median of {args.repeat} runs\n')
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    facets({})
+    build = time.perf_counter() - start
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+    print(f"{'first build':<40}{build:8.2f} s    (+{grown:.0f} MB peak RSS)")
+
+    print(f"{'':<40}{'request':>11}{'cube':>11}{'GROUP BY':>12}")
+    for label, selection in SELECTIONS:
+        filters = parse_facet_filters(MultiDict(selection))
+        ms = timed(lambda: facets(selection), args.repeat)
+        cube = timed(lambda: index.facets(filters), args.repeat)
+        baseline = timed(lambda: group_by(app, filters), max(1, args.repeat // 20))
+        print(f'{label:<40}{ms:8.2f} ms{cube:8.2f} ms{baseline:9.2f} ms')
+
+    counter = iter(range(10 ** 9))
+    timings = []
+    for _ in range(max(1, args.repeat // 10)):
+        i = next(counter)
+        client.put(f'/api/lenses/{i % args.lenses + 1}', json={'design_id': i % 3 + 1}, headers=headers)
+        start = time.perf_counter()
+        facets({})
+        timings.append(time.perf_counter() - start)
+    print(f"{'refresh after a lens update':<40}{statistics.median(timings) * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
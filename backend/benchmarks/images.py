@@ -0,0 +1,136 @@
+"""
+Image variants (see images.py) on a generated photo: the latency of a render
+through the process pool, of a cached variant and of the original, the bytes
+each sends, and how request threads fare while variants are rendered: the
+latency of GET /healthz from another thread while --renders renders run,
+encoded in the pool, then in the request threads as a baseline.
+
+Usage (from backend/):
+    python -m benchmarks.images [--renders 8] [--repeat 50]
+
+Reference run (1 CPU, IMAGE_WORKERS=2, 2400x1600 JPEG of 1.3 MB):
+
+    render w=320 (pool, cold)                 46.8 ms       4.6 KB
+    render w=1280 (pool, cold)               391.9 ms     251.5 KB
+    cached w=320                               0.8 ms       4.5 KB
+    original                                   1.6 ms    1314.6 KB
+    /healthz during 8 renders   pool    p50    0.7 ms   p99    1.0 ms   max    5.7 ms
+    /healthz during 8 renders   thread  p50    0.9 ms   p99    1.6 ms   max   21.1 ms
+
+Pillow releases the GIL for most of the decoding and resampling, so on this
+machine rendering in threads stalls other requests only briefly; the pool
+also bounds the renders running at once to IMAGE_WORKERS and keeps a crashing
+decoder out of the web worker.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.scaling import percentile
+
+SAMPLE = 'photo.jpg'
+
+
+def sample_media(directory, size=(2400, 1600)):
+    """Write a noisy photo-like JPEG to ``directory``; returns the directory."""
+    from PIL import Image, ImageFilter
+    noise = Image.effect_noise(size, 64).filter(ImageFilter.GaussianBlur(1))
+    gradient = Image.linear_gradient('L').resize(size)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    image.save(os.path.join(directory, SAMPLE), quality=92)
+    return directory
+
+
+def timed(client, path, repeat):
+    timings, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        size = len(response.get_data())
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings) * 1000, size
+
+
+def probe_latency(client, busy):
+    """/healthz latencies while ``busy()`` runs in other threads."""
+    latencies, done = [], threading.Event()
+
+    def poll():
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/healthz')
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.002)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    busy()
+    done.set()
+    poller.join()
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--renders', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    root = sample_media(tempfile.mkdtemp())
+    os.environ.update(DATABASE_URL=f'sqlite:///{tempfile.mkdtemp()}/images.db', AUTO_MIGRATE='0',
+                      IMAGE_ROOT=root, IMAGE_CACHE_DIR=tempfile.mkdtemp())
+    from app import app
+    from images import WORKERS, local_path, parse_variant, render, variants
+    client = app.test_client()
+    source = os.path.join(root, SAMPLE)
+    print(f'{os.cpu_count()} CPU, IMAGE_WORKERS={WORKERS}, original {os.path.getsize(source) / 1024:.1f} KB\n')
+
+    # Start the pool outside the measurements
+    client.get(f'/api/media/{SAMPLE}?w=16')
+    counter = iter(range(100, 1000))
+    for width in (320, 1280):
+        timings = []
+        for i in range(max(1, args.repeat // 10)):
+            # A pixel narrower each time: a variant that is not cached yet
+            path = f'/api/media/{SAMPLE}?w={width - i}'
+            ms, size = timed(client, path, 1)
+            timings.append(ms)
+        print(f"{f'render w={width} (pool, cold)':<38}{statistics.median(timings):8.1f} ms  {size / 1024:8.1f} KB")
+    for label, path in (('cached w=320', f'/api/media/{SAMPLE}?w=320'), ('original', f'/api/media/{SAMPLE}')):
+        ms, size = timed(client, path, args.repeat)
+        print(f'{label:<38}{ms:8.1f} ms  {size / 1024:8.1f} KB')
+
+    def in_pool():
+        threads = [threading.Thread(target=client.get, args=(f'/api/media/{SAMPLE}?w={1280 - next(counter)}',))
+                   for _ in range(args.renders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def in_threads():
+        target = tempfile.mkdtemp()
+        threads = [threading.Thread(target=render, args=(
+            local_path(SAMPLE), os.path.join(target, f'{i}.webp'), parse_variant({'w': str(1280 - i)})
+        )) for i in range(args.renders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    for label, busy in (('pool', in_pool), ('thread', in_threads)):
+        latencies = probe_latency(client, busy)
+        print(f"{f'/healthz during {args.renders} renders':<28}{label:<8}"
+              f"p50 {percentile(latencies, 0.5) * 1000:6.1f} ms   p99 {percentile(latencies, 0.99) * 1000:6.1f} ms   "
+              f"max {latencies[-1] * 1000:6.1f} ms")
+    print(f'\n{variants.stats()}')
+
+
+if __name__ == '__main__':
+    main()
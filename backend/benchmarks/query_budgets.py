@@ -0,0 +1,227 @@
+"""
+Query budgets of every route, checked against a synthetic catalog.
+
+Each route of app.py and auth.py is called through the Flask test client with
+a declared statement budget (see query_budget.py); a route that issues more
+statements, repeats the same statement shape (N+1), answers with an
+unexpected status, or is not covered at all fails the run. Response caches
+are disabled so the cold path is measured. Budgets must not depend on the
+catalog size: run with a larger --lenses to confirm.
+
+Usage (from backend/):
+    python -m benchmarks.query_budgets [--lenses 5000] [--verbose]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.images import SAMPLE, sample_media
+from query_budget import DEFAULT_MAX_REPEATS, QueryLog
+
+# Filled in by main() once the app is imported
+app = None
+
+BATCH_SIZE = 40
+
+
+def check(method, path, budget, body=None, status=200, save_as=None, max_repeats=DEFAULT_MAX_REPEATS):
+    return {'method': method, 'path': path, 'budget': budget, 'body': body,
+            'status': status, 'save_as': save_as, 'max_repeats': max_repeats}
+
+
+def batch_operations():
+    operations = [
+        {'op': 'create', 'type': 'lenses', 'data': {'name': f'Batch {i}', 'edi_code': f'QB-BATCH-{i}', 'design_id': 1}}
+        for i in range(BATCH_SIZE)
+    ]
+    # Creates setting different columns: one INSERT per column set
+    operations += [{'op': 'create', 'type': 'designs', 'data': {'code': 'QB-BATCH-D1', 'name': 'a', 'description': 'x'}},
+                   {'op': 'create', 'type': 'designs', 'data': {'code': 'QB-BATCH-D2', 'name': 'b'}}]
+    operations += [{'op': 'update', 'type': 'lenses', 'id': i, 'data': {'description': f'v{i}'}} for i in range(1, BATCH_SIZE + 1)]
+    operations += [{'op': 'link', 'type': 'Design', 'id': i, 'image_id': 1} for i in range(1, 4)]
+    operations += [{'op': 'delete', 'type': 'lenses', 'id': i} for i in range(BATCH_SIZE + 1, 2 * BATCH_SIZE + 1)]
+    return operations
+
+
+# In order; '{name}' placeholders are ids saved by earlier checks
+CHECKS = [
+    # Health and monitoring
+    check('GET', '/healthz', 0),
+    check('GET', '/readyz', 1),
+    check('GET', '/metrics', 0),
+    # Public lens endpoints (ETag lookup + one query)
+    check('GET', '/api/lenses', 2),
+    check('GET', '/api/lenses?limit=50&sort=-name', 2),
+    check('GET', '/api/lenses?limit=50&expand=design,material,treatment,images', 2),
+    check('GET', '/api/lenses?stream=ndjson', 2),
+    check('GET', '/api/lenses?stream=json&expand=design,images', 2),
+    check('GET', '/api/lenses/1', 2),
+    check('GET', '/api/lenses/999999999', 2, status=404),
+    check('GET', '/api/lenses/by-edi/00000001', 2),
+    check('GET', '/api/lenses/by-edi/unknown', 2, status=404),
+    # EDI resolution: one IN query whatever the number of codes
+    check('POST', '/api/lenses/by-edi', 1, {'codes': [f'{i:08d}' for i in range(1, 500)] + ['unknown']}),
+    check('POST', '/api/lenses/by-edi', 0, {'codes': 'unknown'}, status=400),
+    check('POST', '/api/lenses/by-edi', 0, ['00000001'], status=400),
+    # Dashboard reads
+    check('GET', '/api/images', 2),
+    check('GET', '/api/images?limit=20&category=Design', 2),
+    check('GET', '/api/images/1', 2),
+    check('GET', '/api/designs', 2),
+    check('GET', '/api/treatments', 2),
+    check('GET', '/api/materials', 2),
+    check('GET', '/api/stats', 5),
+    # Search: ETag lookup, one scan per table to build the in-process index
+    # (SQLite, first search only), then one query per type of result
+    check('GET', '/api/search?q=progressive', 11),
+    check('GET', '/api/search?q=progress&types=design,lens', 3),
+    check('GET', '/api/search', 1, status=400),
+    # Facets: ETag lookup, then the component labels and one lens scan to
+    # build the cube (first call only)
+    check('GET', '/api/lenses/facets', 5),
+    check('GET', '/api/lenses/facets?design_id=1,2&treatment_id=null', 1),
+    check('GET', '/api/lenses/facets?design_id=x', 1, status=400),
+    check('GET', '/api/cache/stats', 0),
+    # Local images and their variants are files: no query
+    check('GET', f'/api/media/{SAMPLE}', 0),
+    check('GET', f'/api/media/{SAMPLE}?w=64&h=64&fit=cover', 0),
+    check('GET', '/api/media/unknown.jpg', 0, status=404),
+    check('GET', f'/api/media/{SAMPLE}?w=0', 0, status=400),
+    # Writes: the statement, the catalog version bumps (change log counter,
+    # then tables), the change log entries and the reload of the committed row
+    # for the response
+    check('POST', '/api/images', 5, {'name': 'qb', 'url': 'https://cdn.example.com/qb.jpg'}, 201, 'image'),
+    check('POST', '/api/images', 5, {'name': 'qb-local', 'url': f'/api/media/{SAMPLE}'}, 201),
+    check('PUT', '/api/images/{image}', 6, {'name': 'qb2'}),
+    check('POST', '/api/designs', 5, {'code': 'QB-D', 'name': 'qb', 'image_id': '{image}'}, 201, 'design'),
+    check('PUT', '/api/designs/{design}', 6, {'name': 'qb2'}),
+    check('POST', '/api/treatments', 5, {'code': 'QB-T', 'name': 'qb', 'image_id': '{image}'}, 201, 'treatment'),
+    check('PUT', '/api/treatments/{treatment}', 6, {'name': 'qb2'}),
+    check('POST', '/api/materials', 5, {'code': 'QB-M', 'name': 'qb', 'image_id': '{image}'}, 201, 'material'),
+    check('PUT', '/api/materials/{material}', 6, {'name': 'qb2'}),
+    check('POST', '/api/lenses', 5, {'name': 'qb', 'edi_code': 'QB-L', 'design_id': '{design}',
+                                     'material_id': '{material}', 'treatment_id': '{treatment}'}, 201, 'lens'),
+    check('PUT', '/api/lenses/{lens}', 6, {'name': 'qb2'}),
+    # Relationship management: one UPDATE (version bump, change log entries)
+    # per entity type
+    check('POST', '/api/link', 4, {'type': 'Design', 'id': '{design}', 'image_id': 1}),
+    check('POST', '/api/link', 10, {'items': [{'type': t, 'id': i} for t in ('Design', 'Traitement', 'Matière')
+                                             for i in range(1, 4)], 'image_id': 2}, max_repeats=4),
+    check('POST', '/api/unlink', 4, {'type': 'Design', 'ids': [1, 2, 3]}),
+    # Batch: statements per group of operations, version bumps and change log
+    # entries included
+    check('POST', '/api/batch', 18, {'operations': batch_operations()}, max_repeats=6),
+    check('POST', '/api/batch', 0, [{'op': 'delete', 'type': 'lenses', 'id': 1}], status=400),
+    check('POST', '/api/batch', 0, {'operations': [{'op': 'create', 'type': 'images', 'data': {'name': 'qb', 'url': 5}}]},
+          status=400),
+    # Deletes: lookup, ids of the referencing rows (unlinked by ON DELETE SET
+    # NULL, not loaded), DELETE, the version bumps and change log entries
+    check('DELETE', '/api/images/{image}', 6),
+    check('DELETE', '/api/designs/{design}', 6),
+    check('DELETE', '/api/treatments/{treatment}', 6),
+    check('DELETE', '/api/materials/{material}', 6),
+    check('DELETE', '/api/lenses/{lens}', 5),
+    check('DELETE', '/api/images/999999999', 1, status=404),
+    # Change feed: ETag lookup, log bounds, log entries, then one IN query per
+    # type with changed rows (version 1 is the catalog generation, logged as
+    # whole tables). The first read after writes also has the in-process
+    # caches catch up with the change log (see pubsub.catch_up())
+    check('GET', '/api/changes?since=1', 9),
+    check('GET', '/api/changes?since=1&types=lens', 4),
+    check('GET', '/api/changes?since=0&limit=1', 4),
+    check('GET', '/api/changes?since=999999999', 2, status=410),
+    check('GET', '/api/changes', 2),
+    check('GET', '/api/changes?since=-1', 1, status=400),
+    # Catalog snapshot: built on the first call (version, one query per
+    # component table, lenses), then served as is until the catalog version
+    # moves
+    check('GET', '/api/catalog/snapshot', 5),
+    check('GET', '/api/catalog/snapshot', 1),
+    check('GET', '/api/catalog/snapshot/unknown.json', 0, status=404),
+    # Facets after the writes above: ETag lookup, the labels of the changed
+    # components (one query per table) and the changed lenses
+    check('GET', '/api/lenses/facets?material_id=1', 5),
+    # Authentication
+    check('GET', '/api/auth/login', 0, status=302),
+    check('GET', '/api/auth/callback', 0, status=400),
+    check('GET', '/api/auth/me', 0),
+    check('POST', '/api/auth/refresh', 2, {'refresh_token': '{refresh_token}'}),
+    check('POST', '/api/auth/logout', 1, {'refresh_token': '{refresh_token}'}),
+]
+
+
+def fill(value, ids):
+    if isinstance(value, str) and value.startswith('{') and value.endswith('}'):
+        return ids[value[1:-1]]
+    if isinstance(value, dict):
+        return {k: fill(v, ids) for k, v in value.items()}
+    if isinstance(value, list):
+        return [fill(v, ids) for v in value]
+    return value
+
+
+def run_checks(client, headers, ids, verbose=False):
+    failures, covered = 0, set()
+    adapter = app.url_map.bind('localhost')
+    for spec in CHECKS:
+        path = spec['path'].format(**ids)
+        body = fill(spec['body'], ids)
+        covered.add(adapter.match(path.split('?')[0], spec['method'])[0])
+        with QueryLog() as log:
+            response = client.open(path, method=spec['method'], json=body, headers=headers)
+            response.get_data()
+            response.close()
+        problems = log.problems(spec['budget'], spec['max_repeats'])
+        if response.status_code != spec['status']:
+            problems.append(f"status {response.status_code}, expected {spec['status']}")
+        if spec['save_as'] and response.status_code == spec['status']:
+            ids[spec['save_as']] = response.json['id']
+        failures += bool(problems)
+        print(f"{'FAIL' if problems else 'ok':<5}{log.count:>3}/{spec['budget']:<3} {spec['method']:<7}{spec['path']}")
+        for problem in problems:
+            print(f'         {problem}')
+        if verbose or problems:
+            print('\n'.join(f'         {line}' for line in log.report().splitlines()))
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    for endpoint in sorted(endpoints - covered):
+        print(f'FAIL no budget declared for {endpoint}')
+        failures += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lenses', type=int, default=5000)
+    parser.add_argument('--verbose', action='store_true', help='list the statements of every route')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or f'sqlite:///{tempfile.mkdtemp()}/budgets.db'
+    # Measure the cold path, not the response caches
+    os.environ.update(LENS_CACHE_SIZE='0', STATS_CACHE_TTL='0', REFRESH_TOKEN_STORE='database')
+    # A local image to serve, and no network probing of the remote ones
+    os.environ.update(IMAGE_ROOT=sample_media(tempfile.mkdtemp()), IMAGE_CACHE_DIR=tempfile.mkdtemp(),
+                      IMAGE_PROBE_TIMEOUT='0')
+
+    global app
+    from app import app
+    from auth import generate_tokens
+    from benchmarks.catalog import generate_catalog
+    from models import db, Lens
+
+    with app.app_context():
+        if not db.session.query(Lens.id).first():
+            generate_catalog(db.session, args.lenses)
+        tokens = generate_tokens({'id': 0, 'login': 'query-budgets'})
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+    ids = {'refresh_token': tokens['refresh_token']}
+
+    failures = run_checks(app.test_client(), headers, ids, args.verbose)
+    print(f'{len(CHECKS)} checks, {failures} failures')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
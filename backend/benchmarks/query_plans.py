@@ -0,0 +1,165 @@
+"""
+Query plans and timings of the foreign-key heavy statements, before and after
+the c4e2a7f19b36 migration (foreign-key indexes, ON DELETE SET NULL).
+
+The same synthetic catalog (benchmarks/catalog.py) is generated at the
+baseline revision and at head; for each, the statements below are explained
+(EXPLAIN QUERY PLAN on SQLite, EXPLAIN ANALYZE on PostgreSQL, which also
+reports the time spent in each foreign-key trigger) and timed, every run in a
+transaction that is rolled back. "before" deletes are the statements the ORM
+used to issue: load the referencing rows, null them one by one, then delete.
+
+The tables of BENCH_DATABASE_URL (default: a SQLite file) are dropped.
+
+Usage (from backend/):
+    python -m benchmarks.query_plans [--lenses 100000] [--repeat 20]
+
+Reference run (SQLite 3, 100k lenses, 1 CPU, median of 20):
+
+    lenses of a design, first page    before   0.45 ms   after   0.30 ms
+      before: SCAN lenses
+      after:  SEARCH lenses USING INDEX ix_lenses_design_id (design_id=?)
+    count lenses of a design          before  10.19 ms   after   0.21 ms
+      before: SCAN lenses
+      after:  SEARCH lenses USING COVERING INDEX ix_lenses_design_id
+    delete a design (2245 lenses)     before  53.51 ms   after  32.79 ms
+      before: SCAN lenses (load), one UPDATE per lens, SCAN lenses (FK check)
+      after:  SEARCH lenses USING COVERING INDEX ix_lenses_design_id
+    delete an image                   before   0.45 ms   after   0.14 ms
+      before: SCAN designs, treatments, materials (load, then FK checks)
+      after:  SEARCH each USING COVERING INDEX ix_<table>_image_id
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or f'sqlite:///{tempfile.mkdtemp()}/plans.db'
+os.environ['AUTO_MIGRATE'] = '0'
+
+from sqlalchemy import func, select, text  # noqa: E402
+
+from app import app  # noqa: E402
+from benchmarks.catalog import generate_catalog  # noqa: E402
+from models import db, Design, Image, Lens  # noqa: E402
+from schema import reset_schema  # noqa: E402
+
+BASELINE = '8d1f0c3a2b47'
+CHILDREN = {  # referencing (table, column) of each parent table
+    'designs': [('lenses', 'design_id')],
+    'images': [('designs', 'image_id'), ('treatments', 'image_id'), ('materials', 'image_id')],
+}
+
+
+def lenses_of(design_id):
+    return [('SELECT * FROM lenses WHERE design_id = :id ORDER BY id LIMIT 50', {'id': design_id})]
+
+
+def count_lenses_of(design_id):
+    return [('SELECT count(*) FROM lenses WHERE design_id = :id', {'id': design_id})]
+
+
+def orm_delete(table, row_id):
+    # What session.delete() issued without passive_deletes
+    statements = []
+    for child, column in CHILDREN[table]:
+        statements.append((f'SELECT id FROM {child} WHERE {column} = :id', {'id': row_id}))
+        statements.append((f'UPDATE {child} SET {column} = NULL WHERE id = :child_id', 'children'))
+    statements.append((f'DELETE FROM {table} WHERE id = :id', {'id': row_id}))
+    return statements
+
+
+def db_delete(table, row_id):
+    return [(f'DELETE FROM {table} WHERE id = :id', {'id': row_id})]
+
+
+def execute(conn, statements):
+    children = []
+    for sql, params in statements:
+        if params == 'children':
+            if children:
+                conn.execute(text(sql), [{'child_id': child} for child in children])
+            continue
+        result = conn.execute(text(sql), params)
+        if result.returns_rows:
+            children = [row[0] for row in result]
+
+
+def explain(conn, statements):
+    dialect = conn.dialect.name
+    lines = []
+    for sql, params in statements:
+        if params == 'children':
+            sql, params = sql.replace(':child_id', '1'), {}
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN (ANALYZE, COSTS OFF) '
+        trans = conn.begin()
+        try:
+            for row in conn.execute(text(prefix + sql), params):
+                lines.append(row[-1] if dialect == 'sqlite' else row[0])
+        finally:
+            trans.rollback()
+    return lines
+
+
+def timed(conn, statements, repeat):
+    timings = []
+    for _ in range(repeat):
+        trans = conn.begin()
+        start = time.perf_counter()
+        execute(conn, statements)
+        timings.append(time.perf_counter() - start)
+        trans.rollback()
+    return statistics.median(timings) * 1000
+
+
+def measure(revision, args):
+    with app.app_context():
+        reset_schema(revision)
+        generate_catalog(db.session, args.lenses)
+        design_id, children = db.session.execute(
+            select(Lens.design_id, func.count()).where(Lens.design_id.is_not(None))
+            .group_by(Lens.design_id).order_by(func.count().desc()).limit(1)
+        ).one()
+        image_id = db.session.scalar(
+            select(Design.image_id).where(Design.image_id.is_not(None)).limit(1)
+        ) or db.session.scalar(select(Image.id).limit(1))
+        db.session.remove()
+
+        after = revision != BASELINE
+        delete = db_delete if after else orm_delete
+        cases = [
+            ('lenses of a design, first page', lenses_of(design_id)),
+            ('count lenses of a design', count_lenses_of(design_id)),
+            (f'delete a design ({children} lenses)', delete('designs', design_id)),
+            ('delete an image', delete('images', image_id)),
+        ]
+        results = {}
+        with db.engine.connect() as conn:
+            for name, statements in cases:
+                results[name] = (timed(conn, statements, args.repeat), explain(conn, statements))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lenses', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    before = measure(BASELINE, args)
+    after = measure('head', args)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print(f'{dialect}, {args.lenses} lenses, median of {args.repeat} runs\n')
+    for name, (ms_before, plan_before) in before.items():
+        ms_after, plan_after = after[name]
+        print(f'{name:<40}before {ms_before:8.2f} ms   after {ms_after:8.2f} ms')
+        print('  before:\n' + '\n'.join(f'    {line}' for line in plan_before))
+        print('  after:\n' + '\n'.join(f'    {line}' for line in plan_after))
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Load test: GET /api/lenses throughput as gunicorn workers are added.
+
+For each worker count, starts ``gunicorn -c gunicorn.conf.py app:app`` on a
+local port, waits for /readyz, then drives it with --clients keep-alive client
+processes for --duration seconds and reports requests/s and latency
+percentiles. Point BENCH_DATABASE_URL at a seeded Postgres to measure the real
+stack; the default is a SQLite file filled with --lenses synthetic rows.
+
+Usage (from backend/):
+    python -m benchmarks.scaling [--workers 1,2,4,8] [--clients 16] [--duration 10]
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PORT = 5099
+
+
+def populate(database_url, lenses):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    code = (
+        'from app import app\n'
+        'from models import db, Lens\n'
+        'with app.app_context():\n'
+        '    if not db.session.query(Lens.id).first():\n'
+        f'        db.session.execute(Lens.__table__.insert(), [\n'
+        f'            {{"name": f"Lens {{i}}", "edi_code": f"{{i:08d}}"}} for i in range({lenses})])\n'
+        '        db.session.commit()\n'
+    )
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+
+
+def wait_ready(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', '/readyz')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('server did not become ready')
+
+
+def client(path, duration, results):
+    conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+    latencies = []
+    end = time.time() + duration
+    while time.time() < end:
+        start = time.perf_counter()
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+    results.put(latencies)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(workers, args, env):
+    env = dict(env, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(args.threads),
+               FLASK_PORT=str(PORT), FLASK_ENV='production')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null', 'app:app'],
+        env=env, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready()
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=client, args=(args.path, args.duration, results))
+            for _ in range(args.clients)
+        ]
+        for p in clients:
+            p.start()
+        latencies = sorted(l for _ in clients for l in results.get())
+        for p in clients:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait()
+    rate = len(latencies) / args.duration
+    print(f'workers={workers:<3} {rate:9.1f} req/s   '
+          f'p50 {percentile(latencies, 0.5) * 1000:7.1f} ms   '
+          f'p99 {percentile(latencies, 0.99) * 1000:7.1f} ms')
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--lenses', type=int, default=1000)
+    parser.add_argument('--path', default='/api/lenses?limit=50')
+    args = parser.parse_args()
+
+    database_url = os.getenv('BENCH_DATABASE_URL')
+    if not database_url:
+        database_url = f'sqlite:///{tempfile.mkdtemp()}/scaling.db'
+    populate(database_url, args.lenses)
+    env = dict(os.environ, DATABASE_URL=database_url,
+               # Measure the request path, not the response cache
+               LENS_CACHE_SIZE='0')
+    print(f'{os.cpu_count()} CPUs, {args.clients} clients, GET {args.path}')
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(',')):
+        rate = run(workers, args, env)
+        baseline = baseline or rate
+        print(f'            scaling x{rate / baseline:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Search latency on a synthetic catalog (see benchmarks/catalog.py).
+
+Times the first search (which builds the in-process index on SQLite), then
+each query below through GET /api/search, then the search that follows a
+single-lens update (re-index of that row). On PostgreSQL
+(BENCH_DATABASE_URL) the same queries run on the full-text and trigram
+indexes.
+
+Usage (from backend/):
+    python -m benchmarks.search [--lenses 1000000] [--repeat 50]
+
+Reference run (SQLite 3, 1M lenses, 1 CPU, in-process index, median of 50;
+about 1.3 ms of each request is routing, authentication and the ETag lookup):
+
+    first search (index build)                24.1 s   (+1011 MB peak RSS)
+    exact code        00424242                2.20 ms   1 results
+    code prefix       004242                  2.42 ms   20 results
+    component code    d0042                   1.92 ms   1 results
+    common word       progressive             2.11 ms   20 results
+    word prefix       photo                   2.22 ms   20 results
+    two words         progressive trivex      2.24 ms   20 results
+    name and number   sport 58 uv             4.66 ms   20 results
+    no match          zzzz                    1.38 ms   0 results
+    update + search   (1 lens re-indexed)     5.66 ms
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+QUERIES = [
+    ('exact code', '00424242'),
+    ('code prefix', '004242'),
+    ('component code', 'd0042'),
+    ('common word', 'progressive'),
+    ('word prefix', 'photo'),
+    ('two words', 'progressive trivex'),
+    ('name and number', 'sport 58 uv'),
+    ('no match', 'zzzz'),
+]
+
+
+def timed(client, headers, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get('/api/search', query_string={'q': query}, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.json
+    return statistics.median(timings) * 1000, len(response.json['results'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lenses', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'vittion-bench'))
+    args = parser.parse_args()
+
+    from benchmarks.endpoints import prepare_database
+    generate = prepare_database(args.lenses, SimpleNamespace(data_dir=args.data_dir, seed=args.seed))
+    os.environ['AUTO_MIGRATE'] = '0'
+
+    from app import app
+    from auth import generate_tokens
+    from benchmarks.catalog import generate_catalog
+    from models import db
+    from schema import reset_schema, upgrade_schema
+
+    with app.app_context():
+        if generate:
+            reset_schema()
+            generate_catalog(db.session, args.lenses, args.seed)
+        else:
+            upgrade_schema()
+        headers = {'Authorization': 'Bearer ' + generate_tokens({'id': 0, 'login': 'bench'})['access_token']}
+        dialect = db.engine.dialect.name
+    client = app.test_client()
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    client.get('/api/search', query_string={'q': 'warmup'}, headers=headers)
+    build = time.perf_counter() - start
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+    print(f'{dialect}, {args.lenses} lenses, median of {args.repeat} runs\n')
+    print(f"{'first search (index build)':<38}{build:8.1f} s   (+{grown:.0f} MB peak RSS)")
+
+    for name, query in QUERIES:
+        ms, results = timed(client, headers, query, args.repeat)
+        print(f'{name:<18}{query:<20}{ms:8.2f} ms   {results} results')
+
+    timings = []
+    for i in range(args.repeat):
+        client.put('/api/lenses/1', json={'name': f'Reindexed {i}'}, headers=headers)
+        start = time.perf_counter()
+        response = client.get('/api/search', query_string={'q': f'reindexed {i}'}, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.json['results'][0]['id'] == 1
+    print(f"{'update + search':<18}{'(1 lens re-indexed)':<20}{statistics.median(timings) * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: list serialization, ORM + generic column loop vs compiled
+tuple serializers.
+
+Usage (from backend/):
+    python -m benchmarks.serialize [--rows 20000] [--repeat 5]
+
+The tables of BENCH_DATABASE_URL (default: in-memory SQLite) are dropped and
+recreated by the migrations.
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite://')
+
+from app import app  # noqa: E402
+from models import db, Image, Lens  # noqa: E402
+from schema import reset_schema  # noqa: E402
+from serializers import column_select, row_serializer  # noqa: E402
+
+
+def generic_serialize(obj):
+    # The column loop every list endpoint used before serializers.py
+    data = {}
+    for column in obj.__table__.columns:
+        val = getattr(obj, column.name)
+        if isinstance(val, datetime):
+            val = val.isoformat()
+        data[column.name] = val
+    return data
+
+
+def orm_path(model):
+    db.session.expunge_all()
+    return json.dumps([generic_serialize(obj) for obj in model.query.order_by(model.id).all()])
+
+
+def fast_path(model):
+    serializer = row_serializer(model)
+    rows = db.session.execute(column_select(model).order_by(model.id))
+    return json.dumps([serializer(row) for row in rows])
+
+
+def populate(rows):
+    db.session.execute(Image.__table__.insert(), [
+        {'name': f'Image {i}', 'url': f'https://cdn.example.com/{i}.jpg',
+         'category': 'Design', 'resolution': '800x600', 'upload_date': datetime(2026, 1, 1)}
+        for i in range(rows)
+    ])
+    db.session.execute(Lens.__table__.insert(), [
+        {'name': f'Lens {i}', 'description': 'Synthetic lens', 'edi_code': f'{i:08d}'}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_schema()
+        populate(args.rows)
+        for model in (Image, Lens):
+            assert orm_path(model) == fast_path(model)
+            before = best_of(lambda: orm_path(model), args.repeat)
+            after = best_of(lambda: fast_path(model), args.repeat)
+            print(f'{model.__tablename__:<8} {args.rows} rows: '
+                  f'orm+generic {before * 1000:8.1f} ms   '
+                  f'tuples+compiled {after * 1000:8.1f} ms   '
+                  f'speedup x{before / after:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Cost of the public catalog snapshot on a synthetic catalog (see
+benchmarks/catalog.py): the first build, the refresh after the writes below
+(one manifest request each, median of --repeat), and the size of both files
+against the enriched lens list the kiosks fetched before. The design updated
+is the most used one, embedded in lenses of every chunk: only the JSON
+segments are rebuilt, the binary ones reference it by id.
+
+Usage (from backend/):
+    python -m benchmarks.snapshot [--lenses 100000] [--repeat 20]
+
+Reference run (SQLite 3, 100k lenses, 1 CPU, --repeat 5):
+
+    first build                                 3.16 s    (+21 MB peak RSS)
+    manifest, nothing changed                   0.76 ms
+    refresh after a lens update                63.40 ms
+    refresh after a design update            2779.18 ms   (100 chunks, 2245 lenses)
+    refresh after an image update            2696.42 ms
+    /api/lenses?expand=design,material,treatment,images
+                                             10632.2 ms  63.5 MB
+    JSON snapshot file                          0.66 ms  4.1 MB gzip   (63.5 MB raw)
+    binary snapshot file                        0.56 ms  1.6 MB gzip   (6.4 MB raw)
+"""
+
+import argparse
+import gzip
+import os
+import resource
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+EXPANDED = '/api/lenses?expand=design,material,treatment,images'
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lenses', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'vittion-bench'))
+    args = parser.parse_args()
+
+    from benchmarks.endpoints import prepare_database
+    generate = prepare_database(args.lenses, SimpleNamespace(data_dir=args.data_dir, seed=args.seed))
+    os.environ.update(AUTO_MIGRATE='0', LENS_CACHE_SIZE='0', SNAPSHOT_DIR=tempfile.mkdtemp())
+
+    from app import app
+    from auth import generate_tokens
+    from benchmarks.catalog import generate_catalog
+    from models import db, Lens
+    from schema import reset_schema, upgrade_schema
+    from snapshot import CHUNK_SIZE
+
+    with app.app_context():
+        if generate:
+            reset_schema()
+            generate_catalog(db.session, args.lenses, args.seed)
+        else:
+            upgrade_schema()
+        headers = {'Authorization': 'Bearer ' + generate_tokens({'id': 0, 'login': 'bench'})['access_token']}
+        design_id, users = db.session.execute(
+            db.select(Lens.design_id, db.func.count()).where(Lens.design_id.is_not(None))
+            .group_by(Lens.design_id).order_by(db.func.count().desc()).limit(1)
+        ).one()
+        dialect = db.engine.dialect.name
+    client = app.test_client()
+
+    def manifest():
+        response = client.get('/api/catalog/snapshot')
+        assert response.status_code == 200, response.json
+        return response.json
+
+    print(f'{dialect}, {args.lenses} lenses, chunks of {CHUNK_SIZE}, median of {args.repeat} runs\n')
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    manifest()
+    build = time.perf_counter() - start
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+    print(f"{'first build':<40}{build:8.2f} s    (+{grown:.0f} MB peak RSS)")
+    print(f"{'manifest, nothing changed':<40}{timed(manifest, args.repeat):8.2f} ms")
+
+    counter = iter(range(10 ** 9))
+    writes = [
+        ('a lens update', lambda: client.put('/api/lenses/1', json={'description': f'snap {next(counter)}'}, headers=headers), ''),
+        ('a design update', lambda: client.put(f'/api/designs/{design_id}', json={'description': f'snap {next(counter)}'}, headers=headers),
+         f'   ({len({id // CHUNK_SIZE for id in _users(app, Lens, design_id)})} chunks, {users} lenses)'),
+        ('an image update', lambda: client.put('/api/images/1', json={'url': f'https://cdn.example.com/{next(counter)}.jpg'}, headers=headers), ''),
+    ]
+    for name, write, note in writes:
+        timings = []
+        for _ in range(args.repeat):
+            write()
+            start = time.perf_counter()
+            manifest()
+            timings.append(time.perf_counter() - start)
+        print(f"{'refresh after ' + name:<40}{statistics.median(timings) * 1000:8.2f} ms{note}")
+
+    start = time.perf_counter()
+    listing = client.get(EXPANDED)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f'{EXPANDED}\n{"":<40}{elapsed:8.1f} ms  {len(listing.data) / 2 ** 20:.1f} MB')
+    files = manifest()
+    for fmt, label in (('json', 'JSON snapshot file'), ('bin', 'binary snapshot file')):
+        url = files[fmt]['url']
+        ms = timed(lambda: client.get(url, headers={'Accept-Encoding': 'gzip'}).get_data(), args.repeat)
+        data = client.get(url, headers={'Accept-Encoding': 'gzip'}).data
+        raw = f'   ({len(gzip.decompress(data)) / 2 ** 20:.1f} MB raw)'
+        print(f'{label:<40}{ms:8.2f} ms  {len(data) / 2 ** 20:.1f} MB gzip{raw}')
+
+
+def _users(app, Lens, design_id):
+    from models import db
+    with app.app_context():
+        return db.session.scalars(db.select(Lens.id).where(Lens.design_id == design_id)).all()
+
+
+if __name__ == '__main__':
+    main()
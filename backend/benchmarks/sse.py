@@ -0,0 +1,167 @@
+"""
+Fan-out of the change stream: --clients SSE connections to one uvicorn worker
+(asgi.py), while lenses are updated one commit every --interval seconds.
+
+Reports how many clients got every change event, the delay between each
+commit and its arrival at the clients (p50/p99/max over all deliveries), and
+the worker's memory per connected client. The writes go through the Flask
+app in this process, on the same database. Without BENCH_DATABASE_URL a
+SQLite file with --lenses rows is used, and the worker polls the change log
+every SSE_POLL_INTERVAL seconds (delays include up to one interval); on
+PostgreSQL it is woken up by NOTIFY.
+
+Usage (from backend/):
+    python -m benchmarks.sse [--clients 2000] [--writes 20] [--interval 0.5]
+
+Reference run (SQLite 3, 1 CPU shared by the worker, the clients and the
+writer, SSE_POLL_INTERVAL=0.1):
+
+    2000 clients connected in 1.9 s, worker RSS +53.9 MB (27.6 KB per client)
+    20 commits, 40000/40000 deliveries, 0 clients dropped
+    commit -> client   p50   138.9 ms   p99   311.2 ms   max   334.5 ms
+
+    --clients 5000:
+    5000 clients connected in 5.8 s, worker RSS +133.5 MB (27.3 KB per client)
+    20 commits, 100000/100000 deliveries, 0 clients dropped
+    commit -> client   p50   253.8 ms   p99   634.7 ms   max   690.0 ms
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.scaling import percentile, populate
+
+PORT = 5096
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+async def wait_ready(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError('server did not become ready')
+
+
+async def listen(ready, arrivals, dropped):
+    """One SSE client: records when each event id arrives."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT, limit=2 ** 20)
+    writer.write(b'GET /api/changes/stream HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    await reader.readuntil(b'\r\n\r\n')
+    try:
+        while True:
+            # Chunked transfer: size line, then the chunk
+            size = int(await reader.readuntil(b'\r\n'), 16)
+            chunk = await reader.readexactly(size + 2)
+            now = time.perf_counter()
+            for line in chunk.split(b'\n'):
+                if line.startswith(b'id: '):
+                    version = int(line[4:])
+                    if b'event: ready' in chunk:
+                        ready.append(version)
+                    else:
+                        arrivals.setdefault(version, []).append(now)
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        dropped.append(1)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        writer.close()
+
+
+def write(app, headers, commits, args):
+    from versions import CHANGES_COUNTER, current_versions
+    client = app.test_client()
+    for i in range(args.writes):
+        time.sleep(args.interval)
+        client.put(f'/api/lenses/{i % args.lenses + 1}', json={'description': f'sse {i}'}, headers=headers)
+        committed = time.perf_counter()
+        with app.app_context():
+            commits[current_versions([CHANGES_COUNTER])[CHANGES_COUNTER]] = committed
+
+
+async def drive(server, args, app, headers):
+    await wait_ready()
+    before = rss_kb(server.pid)
+    ready, arrivals, dropped, commits = [], {}, [], {}
+    start = time.perf_counter()
+    clients = []
+    for _ in range(args.clients):
+        clients.append(asyncio.create_task(listen(ready, arrivals, dropped)))
+        await asyncio.sleep(0)
+    while len(ready) + len(dropped) < args.clients and time.perf_counter() - start < 60:
+        await asyncio.sleep(0.05)
+    connected = time.perf_counter() - start
+    grown = (rss_kb(server.pid) - before) / 1024
+    print(f'{len(ready)} clients connected in {connected:.1f} s, worker RSS +{grown:.1f} MB '
+          f'({grown * 1024 / max(1, len(ready)):.1f} KB per client)')
+
+    await asyncio.to_thread(write, app, headers, commits, args)
+    await asyncio.sleep(max(1.0, float(os.getenv('SSE_POLL_INTERVAL', 1)) * 2))
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+
+    # An event carries every version up to its id
+    delays, delivered = [], 0
+    for version, committed in commits.items():
+        event = min((v for v in arrivals if v >= version), default=None)
+        if event is None:
+            continue
+        times = arrivals[event]
+        delivered += len(times)
+        delays.extend(t - committed for t in times)
+    delays.sort()
+    print(f'{len(commits)} commits, {delivered}/{len(commits) * len(ready)} deliveries, '
+          f'{len(dropped)} clients dropped')
+    if delays:
+        print(f"commit -> client   p50 {percentile(delays, 0.5) * 1000:7.1f} ms   "
+              f"p99 {percentile(delays, 0.99) * 1000:7.1f} ms   max {delays[-1] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.5)
+    parser.add_argument('--lenses', type=int, default=1000)
+    args = parser.parse_args()
+
+    database_url = os.getenv('BENCH_DATABASE_URL') or f'sqlite:///{tempfile.mkdtemp()}/sse.db'
+    populate(database_url, args.lenses)
+    os.environ.update(DATABASE_URL=database_url, AUTO_MIGRATE='0')
+
+    from app import app
+    from auth import generate_tokens
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + generate_tokens({'id': 0, 'login': 'bench'})['access_token']}
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(PORT),
+         '--no-access-log', '--backlog', str(max(2048, args.clients))],
+        env=dict(os.environ), stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(drive(server, args, app, headers))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Server-Sent Events push of catalog changes, served by asgi.py.
+
+One follower task per process reads the catalog change log (see versions.py)
+after each commit and publishes a compact ``change`` event to every connected
+client: the ids changed per type, with the catalog version as event id.
+Demonstrator screens refetch only the lenses concerned instead of polling
+GET /api/lenses. A client reconnecting with Last-Event-ID (or ?since=) is
+first sent what it missed, read from the log in one query.
+
+Clients are coroutines waiting on a bounded queue on the event loop, not
+threads, so one worker holds thousands of them; each event is encoded once
+for all. A client whose queue overflows is disconnected and catches up from
+the log when it reconnects.
+
+The follower wakes up on the NOTIFY sent by every committing worker on
+PostgreSQL (see pubsub.py). Other databases are polled every
+SSE_POLL_INTERVAL seconds: one indexed lookup per process, whatever the
+number of clients.
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+from sqlalchemy import func, select
+
+from changes import CHANGE_TYPES, TABLE_TYPES, log_covers
+from models import CatalogChange, CatalogVersion
+from pubsub import CHANNEL
+from versions import CHANGES_COUNTER
+
+POLL_INTERVAL = float(os.getenv('SSE_POLL_INTERVAL', 1))
+HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))
+QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 64))
+MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', 10000))
+# Beyond this many ids of one type, an event resets the type instead
+MAX_EVENT_IDS = int(os.getenv('SSE_MAX_EVENT_IDS', 1000))
+# Replays reading more log entries than this reset every type
+MAX_REPLAY_ENTRIES = 10000
+# Reconnection delay advised to EventSource clients
+RETRY_MS = 3000
+
+HEARTBEAT = b': keep-alive\n\n'
+
+changes_table = CatalogChange.__table__
+versions_table = CatalogVersion.__table__
+
+logger = logging.getLogger(__name__)
+
+
+def encode_event(event, version, data):
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return f'id: {version}\nevent: {event}\ndata: {payload}\n\n'.encode()
+
+
+def change_event(version, entries):
+    """The ``change`` event of log entries ``(version, table_name, row_id)``."""
+    ids, reset = {}, set()
+    for _, table, row_id in entries:
+        change_type = TABLE_TYPES[table]
+        if row_id is None:
+            reset.add(change_type)
+        else:
+            ids.setdefault(change_type, set()).add(row_id)
+    reset.update(change_type for change_type, type_ids in ids.items() if len(type_ids) > MAX_EVENT_IDS)
+    return encode_event('change', version, {
+        'version': version,
+        'changes': {change_type: sorted(type_ids) for change_type, type_ids in ids.items()
+                    if change_type not in reset},
+        'reset': sorted(reset),
+    })
+
+
+def reset_event(version):
+    return encode_event('change', version, {'version': version, 'changes': {}, 'reset': sorted(CHANGE_TYPES)})
+
+
+def _entries(since, upto=None):
+    if upto is None:
+        # The committed version, read in the same statement: every entry up
+        # to it is committed too
+        upto = (
+            select(versions_table.c.version)
+            .where(versions_table.c.table_name == CHANGES_COUNTER)
+            .scalar_subquery()
+        )
+    return (
+        select(changes_table.c.version, changes_table.c.table_name, changes_table.c.row_id)
+        .where(changes_table.c.version > since, changes_table.c.version <= upto)
+        .order_by(changes_table.c.version)
+    )
+
+
+class Broadcaster:
+    """Fan-out of change events to the SSE clients of this process."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.version = 0
+        self.clients = set()
+        self._wake = None
+        self._task = None
+        self._listener = None
+        self._last_sent = 0
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        async with self.engine.connect() as conn:
+            self.version = await conn.scalar(
+                select(versions_table.c.version).where(versions_table.c.table_name == CHANGES_COUNTER)
+            ) or 0
+        if self.engine.dialect.name == 'postgresql':
+            self._listener = await self.engine.connect()
+            raw = await self._listener.get_raw_connection()
+            await raw.driver_connection.add_listener(CHANNEL, lambda *args: self._wake.set())
+        self._last_sent = asyncio.get_running_loop().time()
+        self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._listener:
+            await self._listener.close()
+        for queue in list(self.clients):
+            self._disconnect(queue)
+
+    def full(self):
+        return len(self.clients) >= MAX_CLIENTS
+
+    async def _follow(self):
+        loop = asyncio.get_running_loop()
+        # NOTIFY wakes the follower on PostgreSQL; polling is its safety net
+        timeout = HEARTBEAT_INTERVAL if self._listener else POLL_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception('Change stream poll failed')
+            if loop.time() - self._last_sent >= HEARTBEAT_INTERVAL:
+                # Keeps proxies from closing idle streams, and drops the
+                # clients that went away
+                self.publish(HEARTBEAT)
+
+    async def poll(self):
+        """Publish the versions committed since the last event, as one event."""
+        async with self.engine.connect() as conn:
+            entries = (await conn.execute(_entries(self.version))).all()
+        if entries:
+            self.version = entries[-1].version
+            self.publish(change_event(self.version, entries))
+
+    def publish(self, message):
+        self._last_sent = asyncio.get_running_loop().time()
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._disconnect(queue)
+
+    def _disconnect(self, queue):
+        self.clients.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def _replay(self, since, version):
+        async with self.engine.connect() as conn:
+            oldest = await conn.scalar(select(func.min(changes_table.c.version)))
+            if not log_covers(since, version, oldest):
+                return reset_event(version)
+            entries = (await conn.execute(_entries(since, version).limit(MAX_REPLAY_ENTRIES + 1))).all()
+        if len(entries) > MAX_REPLAY_ENTRIES:
+            return reset_event(version)
+        return change_event(version, entries)
+
+    async def stream(self, since=None):
+        """The SSE byte stream of one client, resumed after version ``since``."""
+        queue = asyncio.Queue(QUEUE_SIZE)
+        # Subscribed before reading the version: later events are queued, so
+        # nothing falls between the replay and the live events
+        self.clients.add(queue)
+        version = self.version
+        try:
+            yield f'retry: {RETRY_MS}\n\n'.encode()
+            if since is None:
+                yield encode_event('ready', version, {'version': version})
+            elif since != version:
+                yield await self._replay(since, version)
+            while (message := await queue.get()) is not None:
+                yield message
+        finally:
+            self.clients.discard(queue)
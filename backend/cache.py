@@ -0,0 +1,107 @@
+"""
+Bounded read-through cache for serialized API responses.
+
+Entries are evicted least-recently-used once ``maxsize`` is reached and expire
+after ``ttl`` seconds. Each entry is tagged with the ``(table, id)`` rows it was
+built from (``(table, '*')`` for "any row of this table", e.g. a list that a
+new row could join), and catalog changes received from pubsub.py drop exactly
+the entries whose tags they hit.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+ANY = '*'
+
+
+class ResponseCache:
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped on every invalidation so in-flight fills can detect races
+        self.generation = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._by_tag = {}
+        self._by_table = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags, generation=None):
+        """Store ``value`` unless an invalidation happened since ``generation``."""
+        tags = frozenset(tags)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+                self._by_table.setdefault(tag[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, changes):
+        """Drop entries built from any of the changed ``(table, id)`` rows."""
+        with self._lock:
+            self.generation += 1
+            doomed = set()
+            for table, id in changes:
+                if table is None:
+                    doomed.update(self._entries)
+                elif id is None:
+                    doomed.update(self._by_table.get(table, ()))
+                else:
+                    doomed.update(self._by_tag.get((table, id), ()))
+                    doomed.update(self._by_tag.get((table, ANY), ()))
+            for key in doomed:
+                self._remove(key)
+            self.invalidations += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._by_tag.clear()
+            self._by_table.clear()
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            for index, index_key in ((self._by_tag, tag), (self._by_table, tag[0])):
+                keys = index.get(index_key)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[index_key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
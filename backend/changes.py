@@ -0,0 +1,200 @@
+"""
+Incremental change feed over the catalog change log (see versions.py).
+
+GET /api/changes?since=<version> returns what changed after ``since``: the
+current state of every inserted, updated or linked row, a tombstone for
+every deleted row, each once with the last version that touched it, plus the
+types changed as a whole (imports), which clients refetch. Clients then
+continue from the returned version, so a sync costs O(changes) rather than
+O(catalog). Without ``since``, the current version is returned with every
+type to reset: how a client starts.
+
+Pages hold whole versions, so a client never sees half a transaction. The log
+is pruned after CHANGE_LOG_RETENTION_DAYS; a ``since`` older than the log (or
+newer than the catalog, after a restore) is answered with 410 and the
+current version, from which the client resyncs with full fetches.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+
+from daemons import start_periodic
+from listing import ListQueryError, parse_limit_param, parse_type_list
+from models import db, CatalogChange, CatalogVersion, Image, Design, Treatment, Material, Lens
+from serializers import column_select, row_serializer
+from versions import CHANGES_COUNTER
+
+CHANGE_TYPES = {
+    'image': Image,
+    'design': Design,
+    'treatment': Treatment,
+    'material': Material,
+    'lens': Lens,
+}
+TABLE_TYPES = {model.__tablename__: change_type for change_type, model in CHANGE_TYPES.items()}
+# Types readable without authentication, like GET /api/lenses
+PUBLIC_TYPES = {'lens'}
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+changes_table = CatalogChange.__table__
+versions_table = CatalogVersion.__table__
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeLogExpired(Exception):
+    """``since`` is not covered by the change log; carries the current version."""
+
+    def __init__(self, version):
+        super().__init__('Changes since this version are no longer available')
+        self.version = version
+
+
+def parse_change_types(value):
+    return parse_type_list(value, CHANGE_TYPES)
+
+
+def parse_since(value):
+    if value is None:
+        return None
+    try:
+        since = int(value)
+    except ValueError:
+        raise ListQueryError('since must be an integer')
+    if since < 0:
+        raise ListQueryError('since must not be negative')
+    return since
+
+
+def parse_change_limit(value):
+    return parse_limit_param(value, DEFAULT_LIMIT, MAX_LIMIT)
+
+
+def change_tables(types):
+    return [CHANGE_TYPES[change_type].__tablename__ for change_type in types]
+
+
+def log_covers(since, current, oldest):
+    """Whether the log still holds every change after ``since`` up to ``current``."""
+    # Every version has at least one entry, so the log covers ``since`` as
+    # long as the version right after it is still there
+    return since == current or (since < current and oldest is not None and since >= oldest - 1)
+
+
+def _log_bounds():
+    # Both in one statement: the current version, then the oldest one logged
+    current = (
+        select(versions_table.c.version)
+        .where(versions_table.c.table_name == CHANGES_COUNTER)
+        .scalar_subquery()
+    )
+    oldest = select(func.min(changes_table.c.version)).scalar_subquery()
+    current, oldest = db.session.execute(select(current, oldest)).one()
+    return current or 0, oldest
+
+
+def _entries(where, limit=None):
+    stmt = (
+        select(changes_table.c.version, changes_table.c.table_name, changes_table.c.row_id)
+        .where(*where)
+        .order_by(changes_table.c.version, changes_table.c.id)
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).all()
+
+
+def changes_since(since, types, limit):
+    """Return the change feed payload after version ``since``.
+
+    Without ``since`` every type is reset: the client fetches the full lists,
+    then syncs from the returned version.
+    """
+    current, oldest = _log_bounds()
+    if since is None:
+        return {'version': current, 'more': False, 'changes': [], 'reset': list(types)}
+    if not log_covers(since, current, oldest):
+        raise ChangeLogExpired(current)
+
+    tables = change_tables(types)
+    where = [
+        changes_table.c.version > since,
+        changes_table.c.version <= current,
+        changes_table.c.table_name.in_(tables),
+    ]
+    entries = _entries(where, limit + 1)
+    more = len(entries) > limit
+    version = current
+    if more:
+        # Stop before the first version not entirely in this page, or return
+        # that version alone if it does not fit in a page
+        version = entries[limit].version - 1
+        entries = [entry for entry in entries if entry.version <= version]
+        if not entries:
+            version += 1
+            entries = _entries([*where[2:], changes_table.c.version == version])
+        more = version < current
+
+    reset = sorted({table for _, table, row_id in entries if row_id is None})
+    last_versions = {}
+    for entry_version, table, row_id in entries:
+        if table not in reset:
+            last_versions[table, row_id] = entry_version
+
+    changes = []
+    for table in tables:
+        ids = [row_id for name, row_id in last_versions if name == table]
+        if not ids:
+            continue
+        model = CHANGE_TYPES[TABLE_TYPES[table]]
+        serializer = row_serializer(model)
+        rows = {
+            row.id: serializer(row)
+            for row in db.session.execute(column_select(model).where(model.id.in_(ids)))
+        }
+        for row_id in sorted(ids):
+            change = {'type': TABLE_TYPES[table], 'id': row_id, 'version': last_versions[table, row_id]}
+            if row_id in rows:
+                change['data'] = rows[row_id]
+            else:
+                change['deleted'] = True
+            changes.append(change)
+    changes.sort(key=lambda change: change['version'])
+
+    return {
+        'version': version,
+        'more': more,
+        'changes': changes,
+        'reset': [TABLE_TYPES[table] for table in reset],
+    }
+
+
+def prune_changes(retention):
+    """Delete the versions older than ``retention`` (a timedelta), whole."""
+    cutoff = datetime.utcnow() - retention
+    last_expired = (
+        select(func.max(changes_table.c.version))
+        .where(changes_table.c.changed_at < cutoff)
+        .scalar_subquery()
+    )
+    result = db.session.execute(delete(changes_table).where(changes_table.c.version <= last_expired))
+    db.session.commit()
+    return result.rowcount
+
+
+def start_pruner(app):
+    """Prune the change log every CHANGE_LOG_PRUNE_INTERVAL seconds (once per process)."""
+    interval = int(os.getenv('CHANGE_LOG_PRUNE_INTERVAL', 3600))
+    retention = timedelta(days=float(os.getenv('CHANGE_LOG_RETENTION_DAYS', 30)))
+
+    def prune():
+        removed = prune_changes(retention)
+        if removed:
+            logger.info('Pruned %d change log entries', removed)
+
+    start_periodic('change-log-pruner', app, interval, prune)
@@ -0,0 +1,45 @@
+"""
+Background threads of a worker process.
+
+gunicorn forks the workers from a preloaded master, and threads do not
+survive a fork: each thread is started on first use in every process, once.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_started = {}  # thread name -> pid of the process that started it
+_lock = threading.Lock()
+
+
+def start_daemon(name, target, *args):
+    """Run ``target(*args)`` in a daemon thread named ``name``, once per process."""
+    pid = os.getpid()
+    if _started.get(name) == pid:
+        return
+    with _lock:
+        if _started.get(name) == pid:
+            return
+        _started[name] = pid
+    threading.Thread(target=target, args=args, name=name, daemon=True).start()
+
+
+def start_periodic(name, app, interval, task):
+    """Run ``task()`` in an app context every ``interval`` seconds, once per process."""
+    if interval <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    task()
+            except Exception:
+                logger.exception('%s failed', name)
+
+    start_daemon(name, run)
@@ -0,0 +1,119 @@
+"""
+Commit-time change notifications for the catalog tables.
+
+Write handlers do not need to know which caches depend on the rows they
+touch: every flush records the affected rows on the session as
+``(table_name, id)`` pairs, and once the transaction commits each subscriber
+registered with on_commit() is called with that set. Statements that bypass
+the unit of work (bulk UPDATE/DELETE) report their rows with mark_changed();
+an id of ``None`` means "some rows of this table".
+
+Rows unlinked by the database itself (``ON DELETE SET NULL``) are not seen by
+the session: they are read just before the delete (cascaded_changes(), one
+query) and reported with it.
+
+Subscribers registered with on_change() are called inside the transaction,
+as soon as the change is known, and may write to the database themselves.
+"""
+
+from functools import lru_cache
+
+from sqlalchemy import event, literal, select, union_all
+from sqlalchemy.orm import Session
+
+_subscribers = []
+_change_subscribers = []
+
+
+def changed_tables(changes):
+    """Return the table names present in a set of ``(table, id)`` changes."""
+    return frozenset(table for table, _ in changes)
+
+
+def on_commit(callback):
+    """Register ``callback(changes)`` to run after each commit that changed rows."""
+    _subscribers.append(callback)
+    return callback
+
+
+def on_change(callback):
+    """Register ``callback(session, changes)`` to run inside the changing transaction."""
+    _change_subscribers.append(callback)
+    return callback
+
+
+def mark_changed(session, table, ids=None):
+    """Record rows changed outside of the ORM flush (e.g. bulk UPDATE).
+
+    Without ``ids`` the whole table is considered changed.
+    """
+    if ids is None:
+        ids = [None]
+    changes = frozenset((table, id) for id in ids)
+    if changes:
+        _record(session, changes)
+
+
+@lru_cache(maxsize=None)
+def _cascading_foreign_keys(table):
+    return tuple(
+        (other, fk.parent)
+        for other in sorted(table.metadata.tables.values(), key=lambda t: t.name)
+        for fk in other.foreign_keys
+        if fk.column.table is table and fk.ondelete
+    )
+
+
+def cascaded_changes(session, table, ids):
+    """``(table, id)`` of the rows an ON DELETE action will change when ``ids``
+    of ``table`` are deleted; call before the delete."""
+    keys = _cascading_foreign_keys(table)
+    if not keys or not ids:
+        return frozenset()
+    stmt = union_all(*(
+        select(literal(other.name), other.c.id).where(column.in_(ids))
+        for other, column in keys
+    ))
+    return frozenset((name, id) for name, id in session.execute(stmt))
+
+
+def _record(session, changes):
+    session.info.setdefault('changed_rows', set()).update(changes)
+    for callback in _change_subscribers:
+        callback(session, changes)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_cascaded_rows(session, flush_context, instances):
+    deleted = {}
+    for obj in session.deleted:
+        if _cascading_foreign_keys(obj.__table__):
+            deleted.setdefault(obj.__table__, []).append(obj.id)
+    cascaded = session.info.setdefault('cascaded_rows', set())
+    for table, ids in deleted.items():
+        cascaded |= cascaded_changes(session, table, ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_rows(session, flush_context):
+    changes = frozenset(
+        (obj.__table__.name, getattr(obj, 'id', None))
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    ) | session.info.pop('cascaded_rows', set())
+    if changes:
+        _record(session, changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_subscribers(session):
+    changes = session.info.pop('changed_rows', None)
+    if not changes:
+        return
+    for callback in _subscribers:
+        callback(frozenset(changes))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_rows(session):
+    session.info.pop('changed_rows', None)
+    session.info.pop('cascaded_rows', None)
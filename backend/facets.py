@@ -0,0 +1,223 @@
+"""
+Lens counts per design, material and treatment under any selection of them,
+for GET /api/lenses/facets.
+
+Within a facet the selected ids are alternatives, across facets they all
+apply, and each facet is counted under the selection of the other two only,
+so a facet keeps showing what else can be picked. ``None`` stands for lenses
+without that component.
+
+The counts come from an in-process cube of the catalog: for every facet and
+every subset of the other two, the lens count per facet value grouped by the
+values of that subset (12 views of the design x material x treatment cube).
+A query sums the groups of the selected values, or scans the view when the
+selection has more combinations than the view has groups, so its cost
+depends on the number of components, never on the number of lenses.
+
+The cube is built on the first query and kept up to date from catalog
+changes (see pubsub.py), like the search index: changed lenses are re-read
+before the next query and moved from their previous cell to the new one,
+changed components have their labels reloaded, and lenses reported changed
+as a whole are rebuilt before the next query (see indexes.py).
+"""
+
+from itertools import combinations, product
+from math import prod
+
+from sqlalchemy import select
+
+from indexes import TrackedIndex
+from listing import ListQueryError
+from models import db, Design, Treatment, Material, Lens
+from pubsub import subscribe
+
+FACETS = (('design', Design, Lens.design_id), ('material', Material, Lens.material_id),
+          ('treatment', Treatment, Lens.treatment_id))
+COMPONENT_TABLES = {model.__tablename__: i for i, (_, model, _) in enumerate(FACETS)}
+# (facet, positions of the other facets it is grouped by)
+VIEWS = tuple(
+    (facet, grouped)
+    for facet in range(len(FACETS))
+    for size in range(len(FACETS))
+    for grouped in combinations([other for other in range(len(FACETS)) if other != facet], size)
+)
+LOAD_BATCH_SIZE = 10000
+
+
+def parse_facet_filters(args):
+    """Selected ids per facet from ``?design_id=1,2&material_id=null...``.
+
+    Returns a tuple with, per facet, None (no selection) or a frozenset of ids.
+    """
+    filters = []
+    for name, _, _ in FACETS:
+        key = f'{name}_id'
+        values = [value.strip() for raw in args.getlist(key) for value in raw.split(',') if value.strip()]
+        if not values:
+            filters.append(None)
+            continue
+        selected = set()
+        for value in values:
+            if value == 'null':
+                selected.add(None)
+                continue
+            try:
+                selected.add(int(value))
+            except ValueError:
+                raise ListQueryError(f"Invalid value for '{key}': {value}")
+        filters.append(frozenset(selected))
+    return tuple(filters)
+
+
+class Cube:
+    """Lens counts of the catalog, by design, material and treatment."""
+
+    def __init__(self):
+        self.cells = {}  # lens id -> (design_id, material_id, treatment_id)
+        self.views = {view: {} for view in VIEWS}  # view -> {group: {value: count}}
+        self.labels = [{} for _ in FACETS]  # per facet: component id -> (code, name)
+
+    def load(self, conn):
+        """Count every lens and label every component (a fresh cube only)."""
+        for facet in range(len(FACETS)):
+            self.load_labels(conn, facet)
+        columns = [Lens.id] + [column for _, _, column in FACETS]
+        for row in conn.execute(select(*columns).execution_options(yield_per=LOAD_BATCH_SIZE)):
+            cell = self.cells[row[0]] = tuple(row[1:])
+            self._count(cell, 1)
+
+    def load_labels(self, conn, facet, ids=None):
+        """Reload the labels of components ``ids`` of ``facet`` (all by default)."""
+        model = FACETS[facet][1]
+        query = select(model.id, model.code, model.name)
+        if ids is None:
+            self.labels[facet] = {}
+        else:
+            query = query.where(model.id.in_(ids))
+            for id in ids:
+                self.labels[facet].pop(id, None)
+        for id, code, name in conn.execute(query):
+            self.labels[facet][id] = (code, name)
+
+    def fetch(self, conn, ids):
+        """Read the components of lenses ``ids``: {id: cell}."""
+        ids = sorted(ids)
+        columns = [Lens.id] + [column for _, _, column in FACETS]
+        cells = {}
+        for start in range(0, len(ids), LOAD_BATCH_SIZE):
+            for row in conn.execute(select(*columns).where(Lens.id.in_(ids[start:start + LOAD_BATCH_SIZE]))):
+                cells[row[0]] = tuple(row[1:])
+        return cells
+
+    def apply(self, ids, cells):
+        """Move lenses ``ids`` to their fetched ``cells``; missing ones are removed."""
+        for id in ids:
+            old, new = self.cells.get(id), cells.get(id)
+            if old == new:
+                continue
+            if old is not None:
+                self._count(old, -1)
+                del self.cells[id]
+            if new is not None:
+                self._count(new, 1)
+                self.cells[id] = new
+
+    def _count(self, cell, delta):
+        for (facet, grouped), groups in self.views.items():
+            key = tuple(cell[other] for other in grouped)
+            counts = groups.setdefault(key, {})
+            value = cell[facet]
+            count = counts.get(value, 0) + delta
+            if count:
+                counts[value] = count
+            else:
+                del counts[value]
+                if not counts:
+                    del groups[key]
+
+    def counts(self, facet, filters):
+        """{value: lens count} of ``facet`` under the filters of the others."""
+        grouped = tuple(other for other in range(len(FACETS)) if other != facet and filters[other] is not None)
+        groups = self.views[(facet, grouped)]
+        selections = [filters[other] for other in grouped]
+        if prod(map(len, selections)) <= len(groups):
+            matching = (groups.get(key) for key in product(*selections))
+        else:
+            matching = (counts for key, counts in groups.items()
+                        if all(value in selection for value, selection in zip(key, selections)))
+        total = {}
+        for counts in matching:
+            if counts:
+                for value, count in counts.items():
+                    total[value] = total.get(value, 0) + count
+        return total
+
+    def facets(self, filters):
+        """The facets payload of GET /api/lenses/facets."""
+        payload = {}
+        lenses = 0
+        for facet, (name, _, _) in enumerate(FACETS):
+            counts = self.counts(facet, filters)
+            if facet == 0:
+                lenses = sum(count for value, count in counts.items()
+                             if filters[facet] is None or value in filters[facet])
+            entries = payload[name] = []
+            # Lenses without the component last
+            for value in sorted(counts, key=lambda value: (value is None, value or 0)):
+                code, label = self.labels[facet].get(value, (None, None))
+                entries.append({'id': value, 'code': code, 'name': label, 'count': counts[value]})
+        return {'total': lenses, 'facets': payload}
+
+
+class FacetIndex(TrackedIndex):
+    """The cube of this process, refreshed from changes."""
+
+    def __init__(self):
+        super().__init__()
+        self.cube = None
+        self._pending = set()  # changed lens ids
+        self._labels = [set() for _ in FACETS]  # changed component ids
+        self._stale_labels = set()  # facets whose labels to reload
+
+    def track(self, table, id):
+        if table == 'lenses' and id is None:
+            self.mark_stale()
+        elif table == 'lenses':
+            self._pending.add(id)
+        elif table in COMPONENT_TABLES and id is None:
+            self._stale_labels.add(COMPONENT_TABLES[table])
+        elif table in COMPONENT_TABLES:
+            self._labels[COMPONENT_TABLES[table]].add(id)
+
+    def facets(self, filters):
+        """Return the facets payload under ``filters`` (see parse_facet_filters)."""
+        with self.refreshed():
+            return self.cube.facets(filters)
+
+    def build(self, conn, part):
+        cube = Cube()
+        cube.load(conn)
+        self.cube = cube
+        self._pending.clear()
+        self._stale_labels.clear()
+        for ids in self._labels:
+            ids.clear()
+
+    def update(self):
+        if not (self._pending or self._stale_labels or any(self._labels)):
+            return
+        with db.engine.connect() as conn:
+            for facet in range(len(FACETS)):
+                if facet in self._stale_labels:
+                    self.cube.load_labels(conn, facet)
+                elif self._labels[facet]:
+                    self.cube.load_labels(conn, facet, sorted(self._labels[facet]))
+                self._labels[facet].clear()
+            self._stale_labels.clear()
+            if self._pending:
+                self.cube.apply(self._pending, self.cube.fetch(conn, self._pending))
+                self._pending.clear()
+
+
+index = FacetIndex()
+subscribe(index.invalidate)
@@ -0,0 +1,68 @@
+"""
+Gunicorn settings for the production entry point:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+WEB_CONCURRENCY worker processes (default: 2 x CPUs + 1) with GUNICORN_THREADS
+threads each. The app is preloaded in the master and forked, and every worker
+drops the database connections inherited from the master. The resolved worker
+count is exported so app.py can size the connection pools to match, and
+the workers share a PROMETHEUS_MULTIPROC_DIR for /metrics. Pending migrations
+are applied once, before the first worker starts, never by the workers.
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound any slow memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+# Development: reload on code changes (incompatible with preloading)
+reload = os.getenv('FLASK_ENV') == 'development'
+preload_app = not reload
+
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+# Workers write their /metrics samples here so any of them can report the
+# totals; a fresh directory per master unless one is configured (it must then
+# be emptied before each start)
+if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='vittion-metrics-')
+
+
+def on_starting(server):
+    # Migrate once, before any worker starts: workers importing the app
+    # unpreloaded (reload mode) would all run the DDL at the same time. Done
+    # in a child process so reloaded workers do not inherit the app module.
+    if os.getenv('AUTO_MIGRATE', '1') != '0' and 'app' not in sys.modules:
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                       check=True)
+    # The app is migrated (a preloaded one at import, in the master)
+    os.environ['AUTO_MIGRATE'] = '0'
+
+
+def post_fork(server, worker):
+    # Connections opened by the master (migrations at import) must not be
+    # shared between processes
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
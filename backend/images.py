@@ -0,0 +1,356 @@
+"""
+Resized and re-encoded variants of the locally stored images.
+
+Files under IMAGE_ROOT are referenced by ``Image.url`` as
+``/api/media/<path>`` (MEDIA_URL). GET /api/media/<path> serves the original,
+and with ``?w=`` and/or ``?h=`` a variant fitted in that box (``fit=contain``,
+the default) or cropped to fill it (``fit=cover``), as WebP, JPEG or PNG
+(``format=``, WebP by default; ``q=`` quality). Images are never enlarged.
+
+Variants are encoded in a pool of IMAGE_WORKERS processes: request threads
+wait for their own variant only, and Pillow's work does not hold the GIL of
+the web worker. Concurrent requests for the same variant share one job.
+Encoded files are kept in IMAGE_CACHE_DIR under the hash of the original's
+content and the parameters, so replacing an original never serves stale
+variants; the least recently used are deleted once the cache exceeds
+IMAGE_CACHE_MAX_MB (as seen by each worker process).
+
+probe() reads the resolution of an image from its header: on disk for local
+images, and from the first bytes of a Range request for remote ones on the
+hosts listed in IMAGE_PROBE_HOSTS only (none by default), since the server
+would otherwise fetch any address a client gives it.
+"""
+
+import functools
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import unquote, urlsplit
+
+import requests
+from PIL import Image as PILImage, ImageFile, ImageOps
+from werkzeug.security import safe_join
+
+from listing import ListQueryError
+
+IMAGE_ROOT = os.path.abspath(os.getenv('IMAGE_ROOT', 'media'))
+MEDIA_URL = os.getenv('MEDIA_URL', '/api/media').rstrip('/')
+CACHE_DIR = os.getenv('IMAGE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'vittion-images')
+CACHE_MAX_BYTES = int(float(os.getenv('IMAGE_CACHE_MAX_MB', 512)) * 2 ** 20)
+WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+RENDER_TIMEOUT = float(os.getenv('IMAGE_RENDER_TIMEOUT', 30))
+# Browser and CDN lifetime of /api/media responses, revalidated by ETag after
+MAX_AGE = int(os.getenv('IMAGE_MAX_AGE', 86400))
+# Seconds allowed to read the header of a remote image; 0 disables it
+PROBE_TIMEOUT = float(os.getenv('IMAGE_PROBE_TIMEOUT', 3))
+# Hosts whose images may be fetched by probe() (comma-separated)
+PROBE_HOSTS = frozenset(host.strip().lower() for host in os.getenv('IMAGE_PROBE_HOSTS', '').split(',') if host.strip())
+PROBE_BYTES = 256 * 1024
+
+MAX_DIMENSION = 4096
+DEFAULT_QUALITY = 80
+FITS = ('contain', 'cover')
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg'), 'png': ('PNG', 'image/png')}
+SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+# EXIF orientations rotating the image by 90 degrees
+TRANSPOSED = {5, 6, 7, 8}
+
+logger = logging.getLogger(__name__)
+
+
+class Variant(namedtuple('Variant', 'width height fit format quality')):
+    __slots__ = ()
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.format][1]
+
+
+class ImageError(Exception):
+    """An image that cannot be rendered; ``status`` is the HTTP answer."""
+
+    status = 415
+
+
+class RenderUnavailable(ImageError):
+    status = 503
+
+
+# --- Sources ---
+
+def local_path(path):
+    """The file of ``path`` under IMAGE_ROOT, or None."""
+    file = safe_join(IMAGE_ROOT, path)
+    if file is None or os.path.splitext(file)[1].lower() not in SOURCE_EXTENSIONS or not os.path.isfile(file):
+        return None
+    return file
+
+
+def local_file(url):
+    """The file behind an ``Image.url`` served by /api/media, or None."""
+    if not isinstance(url, str) or not url.startswith(MEDIA_URL + '/'):
+        return None
+    return local_path(unquote(urlsplit(url[len(MEDIA_URL) + 1:]).path))
+
+
+def probe(url, remote=True):
+    """Resolution of the image at ``url`` as ``'<width>x<height>'``, or None."""
+    file = local_file(url)
+    try:
+        if file is not None:
+            with PILImage.open(file) as image:
+                return _resolution(image)
+        if not (remote and PROBE_TIMEOUT and _probe_allowed(url)):
+            return None
+        headers = {'Range': f'bytes=0-{PROBE_BYTES - 1}'}
+        # A redirect could lead off the allowed hosts
+        with requests.get(url, headers=headers, stream=True, timeout=PROBE_TIMEOUT,
+                          allow_redirects=False) as response:
+            if response.status_code not in (200, 206):
+                return None
+            parser, read = ImageFile.Parser(), 0
+            for chunk in response.iter_content(16384):
+                parser.feed(chunk)
+                if parser.image is not None:
+                    return _resolution(parser.image)
+                read += len(chunk)
+                if read >= PROBE_BYTES:
+                    break
+    except (requests.RequestException, OSError, SyntaxError) as e:
+        logger.info('Could not probe %s: %s', url, e)
+    return None
+
+
+def _probe_allowed(url):
+    if not isinstance(url, str):
+        return False
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+    except ValueError:
+        return False
+    return parts.scheme in ('http', 'https') and host is not None and host.lower() in PROBE_HOSTS
+
+
+def _resolution(image):
+    width, height = image.size
+    if image.getexif().get(0x0112) in TRANSPOSED:
+        width, height = height, width
+    return f'{width}x{height}'
+
+
+# --- Variants ---
+
+def parse_variant(args):
+    """The Variant asked by ``?w=&h=&fit=&format=&q=``, or None for the original."""
+    if not any(key in args for key in ('w', 'h', 'fit', 'format', 'q')):
+        return None
+    width, height = _dimension(args, 'w'), _dimension(args, 'h')
+    fit = args.get('fit', 'contain')
+    if fit not in FITS:
+        raise ListQueryError(f"fit must be one of {', '.join(FITS)}")
+    fmt = args.get('format', 'webp')
+    if fmt not in FORMATS:
+        raise ListQueryError(f"format must be one of {', '.join(FORMATS)}")
+    try:
+        quality = int(args.get('q', DEFAULT_QUALITY))
+    except ValueError:
+        raise ListQueryError('q must be an integer')
+    if not 1 <= quality <= 100:
+        raise ListQueryError('q must be between 1 and 100')
+    return Variant(width, height, fit, fmt, quality)
+
+
+def _dimension(args, key):
+    value = args.get(key)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ListQueryError(f'{key} must be an integer')
+    if not 1 <= value <= MAX_DIMENSION:
+        raise ListQueryError(f'{key} must be between 1 and {MAX_DIMENSION}')
+    return value
+
+
+@functools.lru_cache(maxsize=4096)
+def _content_hash(path, size, mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(2 ** 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def render(source, target, variant):
+    """Encode ``variant`` of ``source`` into ``target``; runs in the pool."""
+    with PILImage.open(source) as image:
+        if image.format == 'JPEG' and (variant.width or variant.height):
+            # Let the decoder downscale by a power of two (never below the box)
+            side = max(variant.width or 0, variant.height or 0)
+            image.draft('RGB', (side, side))
+        image = ImageOps.exif_transpose(image)
+        if variant.fit == 'cover' and variant.width and variant.height:
+            # Cropped to the box's aspect ratio, at most at the original scale
+            scale = max(variant.width / image.width, variant.height / image.height, 1)
+            size = (max(1, round(variant.width / scale)), max(1, round(variant.height / scale)))
+            image = ImageOps.fit(image, size, PILImage.LANCZOS)
+        else:
+            image.thumbnail((variant.width or image.width, variant.height or image.height), PILImage.LANCZOS)
+
+        fmt = FORMATS[variant.format][0]
+        alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        if fmt == 'JPEG' and alpha:
+            background = PILImage.new('RGB', image.size, 'white')
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        elif image.mode not in ('RGB', 'RGBA') and not (fmt == 'PNG' and image.mode in ('L', 'LA', 'P')):
+            image = image.convert('RGBA' if alpha and fmt != 'JPEG' else 'RGB')
+        options = {'quality': variant.quality}
+        if fmt == 'JPEG':
+            options.update(optimize=True, progressive=True)
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Other processes may be serving the directory: never a partial file
+        temporary = f'{target}.{os.getpid()}.tmp'
+        image.save(temporary, fmt, **options)
+        os.replace(temporary, target)
+    return os.path.getsize(target)
+
+
+class VariantCache:
+    """Variant files on disk, rendered in a process pool, evicted LRU."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, workers=WORKERS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = None  # path -> size, least recently used first
+        self._pending = {}  # path -> Future
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self, source, variant):
+        """Return the path of ``variant`` of ``source``, rendering it if needed."""
+        stat = os.stat(source)
+        key = hashlib.sha256(
+            f'{_content_hash(source, stat.st_size, stat.st_mtime_ns)}:{":".join(map(str, variant))}'.encode()
+        ).hexdigest()[:32]
+        path = os.path.join(self.directory, key[:2], f'{key}.{variant.format}')
+        submitted = False
+        with self._lock:
+            self._load()
+            if path in self._files or os.path.exists(path):
+                # Cached, here or by another worker process
+                if path not in self._files:
+                    self._record(path, os.path.getsize(path))
+                self._files.move_to_end(path)
+                self.hits += 1
+                future = None
+            else:
+                future = self._pending.get(path)
+                if future is None:
+                    self.misses += 1
+                    future = self._executor().submit(render, source, path, variant)
+                    self._pending[path] = future
+                    submitted = True
+        if submitted:
+            # Outside the lock: runs at once if the render already finished
+            future.add_done_callback(functools.partial(self._rendered, path))
+        if future is None:
+            try:
+                # Recency survives restarts and is shared with other workers
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                # Evicted by another worker meanwhile
+                with self._lock:
+                    self._forget(path)
+                return self.get(source, variant)
+        try:
+            future.result(RENDER_TIMEOUT)
+        except TimeoutError:
+            raise RenderUnavailable('Image rendering timed out')
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            raise RenderUnavailable('Image workers are unavailable')
+        except (OSError, ValueError, SyntaxError) as e:
+            logger.info('Could not render %s: %s', source, e)
+            raise ImageError('Not a supported image')
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files or ()),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rendering": len(self._pending),
+            }
+
+    def _executor(self):
+        # One pool per process: gunicorn forks the workers after importing the app
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._pid = os.getpid()
+        return self._pool
+
+    def _rendered(self, path, future):
+        with self._lock:
+            self._pending.pop(path, None)
+            if not future.cancelled() and future.exception() is None and self._files is not None:
+                self._record(path, future.result())
+
+    def _load(self):
+        if self._files is not None:
+            return
+        found = []
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, os.path.join(directory, name), stat.st_size))
+        self._files, self.size = OrderedDict(), 0
+        for _, path, size in sorted(found):
+            self._record(path, size)
+
+    def _record(self, path, size):
+        self._forget(path)
+        self._files[path] = size
+        self.size += size
+        while self.size > self.max_bytes and len(self._files) > 1:
+            evicted, evicted_size = self._files.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+            try:
+                os.remove(evicted)
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, path):
+        size = self._files.pop(path, None)
+        if size is not None:
+            self.size -= size
+
+
+variants = VariantCache()
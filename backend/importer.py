@@ -0,0 +1,274 @@
+"""
+Bulk catalog importer.
+
+Streams a JSON array, NDJSON or CSV file and upserts it in batches with
+multi-row ``INSERT ... ON CONFLICT DO UPDATE`` keyed on each table's natural
+key (``code`` for designs, treatments and materials, ``edi_code`` for lenses,
+``id`` for images). Existing rows are updated in place and nothing is
+dropped, so it can run against a live database; running workers are notified
+of the changes like for any other write.
+
+Lenses may reference their components by id (``design_id``) or by code
+(``design_code``); the field names of the JSON files in ``src/lib/data``
+(``n_complet``, ``code_edi``, ``matiere_id``...) are accepted as well. A code
+matching no component leaves the reference of the lens untouched (NULL for a
+new lens).
+
+Records without their key are skipped, and of records sharing a key within
+one batch only the last is written. Both are counted and reported with the
+unresolved codes; skipped records and unresolved codes make the command exit
+with status 1.
+
+Usage (from backend/):
+    python importer.py lenses supplier_lenses.csv [--batch-size 5000]
+    python importer.py --dir ../src/lib/data
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from events import mark_changed
+from models import db, Image, Design, Treatment, Material, Lens
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Import order matters: components must exist before lenses reference them
+ENTITIES = {
+    'images': (Image, 'id'),
+    'designs': (Design, 'code'),
+    'treatments': (Treatment, 'code'),
+    'materials': (Material, 'code'),
+    'lenses': (Lens, 'edi_code'),
+}
+
+FIELD_ALIASES = {
+    'n_complet': 'name',
+    'code_edi': 'edi_code',
+    'matiere_id': 'material_id',
+    'traitement_id': 'treatment_id',
+    'matiere_code': 'material_code',
+    'traitement_code': 'treatment_code',
+}
+
+# Lens columns that can be given as a component code instead of an id
+CODE_REFERENCES = {
+    'design_code': ('design_id', Design),
+    'material_code': ('material_id', Material),
+    'treatment_code': ('treatment_id', Treatment),
+}
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer, pos, started, eof = '', 0, False, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n' + (',' if started else ''):
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Expected a JSON array')
+                started, pos = True, pos + 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                continue
+        if eof:
+            raise ValueError('Unexpected end of JSON array')
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_records(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='' if fmt == 'csv' else None, encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        elif fmt in ('ndjson', 'jsonl'):
+            yield from (json.loads(line) for line in f if line.strip())
+        elif fmt == 'json':
+            yield from iter_json_array(f)
+        else:
+            raise ValueError(f"Unsupported format '{fmt}'")
+
+
+class Importer:
+    def __init__(self, session, batch_size=DEFAULT_BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+        self.dialect = session.get_bind().dialect.name
+        self._code_maps = {}
+        self.unresolved = Counter()  # (code field, code) -> records
+        self.keyless = 0  # records skipped for lack of their key
+        self.duplicates = 0  # records replaced by a later one of the same batch
+
+    def _insert(self, table):
+        if self.dialect == 'postgresql':
+            return postgresql.insert(table)
+        if self.dialect == 'sqlite':
+            return sqlite.insert(table)
+        raise RuntimeError(f'Upserts are not supported on {self.dialect}')
+
+    def _code_map(self, model):
+        if model not in self._code_maps:
+            rows = self.session.execute(select(model.code, model.id))
+            self._code_maps[model] = dict(rows.all())
+        return self._code_maps[model]
+
+    def normalize(self, model, record):
+        columns = model.__table__.c
+        row = {}
+        for key, value in record.items():
+            key = FIELD_ALIASES.get(key, key)
+            if value == '':
+                value = None
+            if key in CODE_REFERENCES:
+                column_name, component = CODE_REFERENCES[key]
+                if value is None:
+                    continue
+                id = self._code_map(component).get(value)
+                if id is None:
+                    self.unresolved[key, value] += 1
+                else:
+                    row[column_name] = id
+                continue
+            if key not in columns:
+                continue
+            column_type = columns[key].type
+            if value is not None and isinstance(column_type, Integer):
+                value = int(value)
+            elif isinstance(value, str) and isinstance(column_type, DateTime):
+                value = datetime.fromisoformat(value)
+            row[key] = value
+        return row
+
+    def upsert(self, model, key, rows):
+        table = model.__table__
+        # Last occurrence wins; ON CONFLICT cannot touch a row twice per statement
+        keyed = [row for row in rows if row.get(key) is not None]
+        unique = {row[key]: row for row in keyed}
+        self.keyless += len(rows) - len(keyed)
+        self.duplicates += len(keyed) - len(unique)
+        # Multi-row INSERTs need identical column sets
+        groups = {}
+        for row in unique.values():
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for columns, group in groups.items():
+            stmt = self._insert(table)
+            updates = {c: stmt.excluded[c] for c in columns if c not in (key, 'id')}
+            if updates:
+                stmt = stmt.on_conflict_do_update(index_elements=[key], set_=updates)
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[key])
+            self.session.execute(stmt, group)
+        mark_changed(self.session, table.name)
+        self.session.commit()
+        return len(unique)
+
+    def import_records(self, name, records):
+        model, key = ENTITIES[name]
+        self._code_maps.pop(model, None)
+        total, batch = 0, []
+        for record in records:
+            batch.append(self.normalize(model, record))
+            if len(batch) >= self.batch_size:
+                total += self.upsert(model, key, batch)
+                batch = []
+        if batch:
+            total += self.upsert(model, key, batch)
+        self.fix_sequence(model)
+        return total
+
+    def fix_sequence(self, model):
+        # Explicit ids leave Postgres serial sequences behind max(id)
+        if self.dialect != 'postgresql':
+            return
+        table = model.__tablename__
+        self.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"coalesce(max(id), 1), max(id) IS NOT null) FROM {table};"
+        ))
+        self.session.commit()
+
+
+def import_file(name, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    importer = Importer(db.session, batch_size)
+    start = time.perf_counter()
+    count = importer.import_records(name, iter_records(path, fmt))
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else float('inf')
+    print(f'{name}: {count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)')
+    return count, report(name, importer)
+
+
+def report(name, importer, shown=10):
+    """Print what the import left out to stderr; returns the number of problems."""
+    key = ENTITIES[name][1]
+    if importer.keyless:
+        print(f'{name}: {importer.keyless} records without {key} were skipped', file=sys.stderr)
+    if importer.duplicates:
+        print(f'{name}: {importer.duplicates} records were replaced by a later record with the same {key}',
+              file=sys.stderr)
+    unresolved = importer.unresolved
+    if unresolved:
+        print(f'{name}: {sum(unresolved.values())} references to unknown codes were not imported:', file=sys.stderr)
+        for (field, code), records in unresolved.most_common(shown):
+            print(f'  {field} {code!r} ({records} records)', file=sys.stderr)
+        if len(unresolved) > shown:
+            print(f'  ... and {len(unresolved) - shown} other codes', file=sys.stderr)
+    return importer.keyless + sum(unresolved.values())
+
+
+def import_directory(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Import ``<entity>.json`` files from ``path`` in dependency order.
+
+    Returns the number of skipped records and unresolved component references.
+    """
+    problems = 0
+    for name in ENTITIES:
+        file_path = os.path.join(path, f'{name}.json')
+        if os.path.exists(file_path):
+            problems += import_file(name, file_path, batch_size=batch_size)[1]
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk upsert catalog data.')
+    parser.add_argument('entity', nargs='?', choices=list(ENTITIES))
+    parser.add_argument('path', nargs='?')
+    parser.add_argument('--dir', help='import every <entity>.json found in this directory')
+    parser.add_argument('--format', choices=['json', 'ndjson', 'jsonl', 'csv'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if not args.dir and not (args.entity and args.path):
+        parser.error('give an entity and a file, or --dir')
+
+    from app import app
+    with app.app_context():
+        if args.dir:
+            problems = import_directory(args.dir, args.batch_size)
+        else:
+            problems = import_file(args.entity, args.path, args.format, args.batch_size)[1]
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
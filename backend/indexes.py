@@ -0,0 +1,67 @@
+"""
+In-process structures built from the catalog and kept up to date from its
+changes (see pubsub.py): the search index, the lens facets, the catalog
+snapshot.
+
+Changes are recorded as they are dispatched and applied by the next reader,
+which holds the index lock meanwhile. A part reported changed as a whole is
+rebuilt by that reader too, before it answers: answering from the previous
+build would serve its data (and cache it) under the newer catalog version of
+the response's ETag.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from models import db
+
+
+class TrackedIndex:
+    """Base of an in-process index made of ``PARTS`` built independently.
+
+    Subclasses implement ``track(table, id)``, recording a change of a row
+    (``id`` None: the whole table) and calling ``mark_stale()`` for the parts
+    to rebuild; ``build(conn, part, *args)``, building ``part`` from scratch
+    and dropping what was recorded for it; and ``update(*args)``, applying the
+    recorded changes. Both run under the lock, with the arguments of
+    ``refreshed()``.
+    """
+
+    PARTS = (None,)
+
+    def __init__(self):
+        self._stale = set(self.PARTS)  # nothing is built yet
+        self._lock = threading.Lock()
+
+    def invalidate(self, changes):
+        with self._lock:
+            for table, id in changes:
+                if table is None:
+                    self._stale.update(self.PARTS)
+                else:
+                    self.track(table, id)
+
+    def mark_stale(self, part=None):
+        self._stale.add(part)
+
+    @contextmanager
+    def refreshed(self, *args):
+        """Hold the lock, with every change dispatched so far applied."""
+        with self._lock:
+            if self._stale:
+                with db.engine.connect() as conn:
+                    for part in self.PARTS:
+                        if part in self._stale:
+                            self.build(conn, part, *args)
+                            self._stale.discard(part)
+            self.update(*args)
+            yield
+
+    def track(self, table, id):
+        raise NotImplementedError
+
+    def build(self, conn, part, *args):
+        raise NotImplementedError
+
+    def update(self, *args):
+        raise NotImplementedError
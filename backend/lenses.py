@@ -0,0 +1,84 @@
+"""
+Enriched lens payloads shared by the Flask app and the async read path.
+
+A lens can be expanded with its design, material and treatment (``*_info``
+blocks) and their image URLs; the helpers below build the eager-load options,
+the payload and the cache dependencies for a given ``expand`` set.
+"""
+
+from sqlalchemy.orm import configure_mappers, joinedload
+
+from listing import ListQueryError
+from models import Design, Treatment, Material, Lens
+from serializers import to_dict
+
+LENS_EXPANSIONS = ('design', 'material', 'treatment', 'images')
+
+# Lens.design & co. are backrefs, only created once the mappers are configured
+configure_mappers()
+
+
+def parse_expand(value):
+    expand = {part.strip() for part in (value or '').split(',') if part.strip()}
+    unknown = expand - set(LENS_EXPANSIONS)
+    if unknown:
+        raise ListQueryError(f"Cannot expand '{sorted(unknown)[0]}'")
+    return expand
+
+
+# Eager-load options so an enriched lens (or page of lenses) is a single query
+# instead of one lazy load per component and per component image
+def lens_load_options(expand):
+    options = []
+    for name, component in (('design', Design), ('material', Material), ('treatment', Treatment)):
+        if name not in expand:
+            continue
+        option = joinedload(getattr(Lens, name))
+        if 'images' in expand:
+            option = option.joinedload(component.image)
+        options.append(option)
+    return options
+
+
+# Tables whose writes can change an enriched lens payload
+def lens_tables(expand):
+    tables = ['lenses']
+    tables += [f'{name}s' for name in ('design', 'material', 'treatment') if name in expand]
+    if 'images' in expand:
+        tables.append('images')
+    return tables
+
+
+# Rows an enriched lens payload was built from, for cache invalidation
+def lens_tags(lens, expand):
+    tags = {('lenses', lens.id)}
+    for name in ('design', 'material', 'treatment'):
+        component_id = getattr(lens, f'{name}_id')
+        if name not in expand or component_id is None:
+            continue
+        tags.add((f'{name}s', component_id))
+        component = getattr(lens, name)
+        if 'images' in expand and component and component.image_id is not None:
+            tags.add(('images', component.image_id))
+    return tags
+
+
+# ``components`` may be a dict shared by a batch of lenses: each component
+# is then serialized once, however many lenses use it
+def serialize_lens(lens, expand, components=None):
+    data = to_dict(lens)
+    for name in ('design', 'material', 'treatment'):
+        if name not in expand:
+            continue
+        component = getattr(lens, name)
+        if not component:
+            continue
+        info = components.get((name, component.id)) if components is not None else None
+        if info is None:
+            info = to_dict(component)
+            if 'images' in expand and component.image:
+                info['image_url'] = component.image.url
+            if components is not None:
+                components[name, component.id] = info
+        data[f'{name}_info'] = info
+    return data
@@ -0,0 +1,216 @@
+"""
+Keyset pagination, filtering and sorting for the catalog list endpoints.
+
+A list request may carry:
+- equality filters (``?design_id=3``, ``?category=Design``), see LIST_FILTERS
+- ``sort=<column>`` or ``sort=-<column>`` for descending order, see SORTABLE
+- ``limit=<n>`` and ``cursor=<opaque>`` to page through the results
+- ``stream=json`` or ``stream=ndjson`` for the whole filtered collection,
+  streamed in chunks of STREAM_BATCH_SIZE rows (see check_stream)
+
+Pages are addressed by the (sort value, id) of the last row served rather than
+by an OFFSET, so no page reads through the rows before it: sorted by id, page N
+is the same primary key range scan as page 1. Other sorts filter on
+(sort value, id) with an OR predicate that no index serves, so each page sorts
+the matching rows (a top-N sort bounded by the limit).
+"""
+
+import base64
+import binascii
+import json
+import os
+
+from sqlalchemy import Integer, and_, or_
+
+from models import Image, Design, Treatment, Material, Lens
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 1000))
+STREAM_MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+# Columns that can be used as equality filters on each list endpoint
+LIST_FILTERS = {
+    Image: ('category', 'resolution'),
+    Design: ('code', 'image_id'),
+    Treatment: ('code', 'image_id'),
+    Material: ('code', 'image_id'),
+    Lens: ('edi_code', 'design_id', 'material_id', 'treatment_id'),
+}
+
+# Columns that can be used with ?sort= (id is always the tie-breaker)
+SORTABLE = {
+    Image: ('id', 'name', 'category'),
+    Design: ('id', 'code', 'name'),
+    Treatment: ('id', 'code', 'name'),
+    Material: ('id', 'code', 'name'),
+    Lens: ('id', 'name', 'edi_code'),
+}
+
+
+class ListQueryError(ValueError):
+    """Raised when list query parameters are malformed."""
+
+
+def encode_cursor(value, id):
+    raw = json.dumps([value, id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def check_stream(fmt, params):
+    """Validate ``?stream=<fmt>`` with the ListQuery ``params``; returns the mimetype."""
+    if fmt not in STREAM_MIMETYPES:
+        raise ListQueryError(f"Unknown stream format '{fmt}'")
+    if params.paginated:
+        raise ListQueryError('Streaming does not support limit or cursor')
+    return STREAM_MIMETYPES[fmt]
+
+
+def encode_stream_chunk(fmt, batch, first):
+    """A batch of JSON-encoded rows as a piece of the ``fmt`` stream."""
+    if fmt == 'ndjson':
+        return '\n'.join(batch) + '\n'
+    return ('' if first else ',') + ','.join(batch)
+
+
+def is_id(value):
+    """Whether a decoded JSON value is an integer id (``true`` is not)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor, column):
+    """(sort value, id) of a cursor on ``column``; values must match its type."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise ListQueryError('Invalid cursor')
+    valid = is_id(value) if isinstance(column.type, Integer) else isinstance(value, str)
+    if not is_id(id) or not (value is None or valid):
+        raise ListQueryError('Invalid cursor')
+    return value, id
+
+
+def parse_type_list(value, known, error="Unknown type '{}'"):
+    """Names of ``known`` from ``?types=a,b`` (all of them when absent)."""
+    types = [part.strip() for part in (value or '').split(',') if part.strip()]
+    unknown = set(types) - set(known)
+    if unknown:
+        raise ListQueryError(error.format(sorted(unknown)[0]))
+    return types or list(known)
+
+
+def parse_limit_param(value, default, maximum):
+    """``?limit=`` between 1 and ``maximum``, ``default`` when absent."""
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ListQueryError('limit must be an integer')
+    if not 1 <= limit <= maximum:
+        raise ListQueryError(f'limit must be between 1 and {maximum}')
+    return limit
+
+
+def _parse_filter_value(column, raw):
+    if raw in ('', 'null'):
+        return None
+    if isinstance(column.type, Integer):
+        try:
+            return int(raw)
+        except ValueError:
+            raise ListQueryError(f"Invalid value for '{column.name}': {raw}")
+    return raw
+
+
+class ListQuery:
+    """Parsed list parameters for one model, applied to a query or select."""
+
+    def __init__(self, model, filters=None, sort='id', descending=False,
+                 cursor=None, limit=None):
+        self.model = model
+        self.filters = filters or {}
+        self.sort = sort
+        self.descending = descending
+        self.cursor = cursor
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, model, args):
+        table = model.__table__
+        filters = {}
+        for name in LIST_FILTERS.get(model, ()):
+            if name in args:
+                filters[name] = _parse_filter_value(table.c[name], args[name])
+
+        sort = args.get('sort', 'id')
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in SORTABLE.get(model, ('id',)):
+            raise ListQueryError(f"Cannot sort by '{sort}'")
+
+        cursor = None
+        if args.get('cursor'):
+            cursor = decode_cursor(args['cursor'], model.__table__.c[sort])
+
+        limit = None
+        if 'limit' in args or cursor is not None:
+            try:
+                limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+            except ValueError:
+                raise ListQueryError('Invalid limit')
+            if limit < 1:
+                raise ListQueryError('Invalid limit')
+            limit = min(limit, MAX_PAGE_SIZE)
+
+        return cls(model, filters, sort, descending, cursor, limit)
+
+    @property
+    def paginated(self):
+        return self.limit is not None
+
+    def _keyset(self):
+        table = self.model.__table__
+        col, id_col = table.c[self.sort], table.c.id
+        value, last_id = self.cursor
+        after = id_col < last_id if self.descending else id_col > last_id
+        if self.sort == 'id':
+            return after
+        # NULL sort values are always served last, in id order
+        if value is None:
+            return and_(col.is_(None), after)
+        past = col < value if self.descending else col > value
+        return or_(past, and_(col == value, after), col.is_(None))
+
+    def apply(self, query):
+        """Add filters, ordering, cursor and limit to a Query or Select."""
+        table = self.model.__table__
+        for name, value in self.filters.items():
+            column = table.c[name]
+            query = query.filter(column.is_(None) if value is None else column == value)
+
+        if self.cursor is not None:
+            query = query.filter(self._keyset())
+
+        col, id_col = table.c[self.sort], table.c.id
+        if self.sort == 'id':
+            order = [id_col.desc() if self.descending else id_col.asc()]
+        elif self.descending:
+            order = [col.is_(None), col.desc(), id_col.desc()]
+        else:
+            order = [col.is_(None), col.asc(), id_col.asc()]
+        query = query.order_by(*order)
+
+        if self.paginated:
+            # Fetch one extra row to know whether another page exists
+            query = query.limit(self.limit + 1)
+        return query
+
+    def page(self, rows):
+        """Trim the look-ahead row and return ``(rows, next_cursor)``."""
+        if not self.paginated or len(rows) <= self.limit:
+            return rows, None
+        rows = rows[:self.limit]
+        last = rows[-1]
+        return rows, encode_cursor(getattr(last, self.sort), last.id)
@@ -0,0 +1,158 @@
+"""
+Per-request SQL and latency instrumentation, exposed on /metrics.
+
+Engine events time every statement and Flask request hooks attribute them to
+the route being served, recording per route (``/api/lenses/<int:id>``, not
+the raw path):
+- ``http_request_duration_seconds``: request latency, by status
+- ``http_request_queries``: SQL statements issued per request
+- ``http_request_sql_duration_seconds``: time spent in those statements
+- ``http_request_sql_rows``: rows returned or affected, as reported by the
+  DBAPI cursor (SQLite does not report rows for SELECTs)
+
+Streamed responses are accounted for once the stream ends. Under gunicorn
+the workers' metrics are aggregated through PROMETHEUS_MULTIPROC_DIR (see
+gunicorn.conf.py).
+
+With SLOW_REQUEST_MS set, requests slower than that are logged with every
+statement they ran, their duration and parameters.
+"""
+
+import logging
+import os
+import time
+
+from flask import Blueprint, Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 0))
+SLOW_REQUEST_MAX_STATEMENTS = int(os.getenv('SLOW_REQUEST_MAX_STATEMENTS', 100))
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency',
+    ['method', 'route', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_queries', 'SQL statements issued per request',
+    ['method', 'route'], buckets=COUNT_BUCKETS,
+)
+REQUEST_SQL_TIME = Histogram(
+    'http_request_sql_duration_seconds', 'Time spent executing SQL per request',
+    ['method', 'route'],
+)
+REQUEST_ROWS = Histogram(
+    'http_request_sql_rows', 'Rows returned or affected by SQL per request',
+    ['method', 'route'], buckets=ROW_BUCKETS,
+)
+
+
+class RequestStats:
+    __slots__ = ('start', 'status', 'streamed', 'queries', 'sql_time', 'rows', 'statements')
+
+    def __init__(self, capture):
+        self.start = time.perf_counter()
+        self.status = 500
+        self.streamed = False
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.statements = [] if capture else None
+
+    def record(self, statement, parameters, elapsed, rowcount):
+        self.queries += 1
+        self.sql_time += elapsed
+        if rowcount > 0:
+            self.rows += rowcount
+        if self.statements is not None and len(self.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+            self.statements.append((elapsed, statement, parameters))
+
+
+def _current_stats():
+    return g.get('request_stats') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('statement_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    starts = conn.info.get('statement_start')
+    if stats is None or not starts:
+        return
+    stats.record(statement, parameters, time.perf_counter() - starts.pop(), cursor.rowcount)
+
+
+@metrics_bp.before_app_request
+def _start_request():
+    g.request_stats = RequestStats(capture=SLOW_REQUEST_MS > 0)
+
+
+@metrics_bp.after_app_request
+def _record_status(response):
+    stats = _current_stats()
+    if stats is not None:
+        stats.status = response.status_code
+        if response.is_streamed:
+            # The body (and its queries) is produced after teardown: account
+            # for the request once the server closes the response
+            stats.streamed = True
+            response.call_on_close(_observer(stats))
+    return response
+
+
+@metrics_bp.teardown_app_request
+def _observe_request(exc):
+    stats = g.get('request_stats')
+    if stats is not None and not stats.streamed:
+        _observer(stats)()
+
+
+def _observer(stats):
+    method = request.method
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    path = request.full_path.rstrip('?')
+
+    def observe():
+        elapsed = time.perf_counter() - stats.start
+        REQUEST_LATENCY.labels(method, route, str(stats.status)).observe(elapsed)
+        REQUEST_QUERIES.labels(method, route).observe(stats.queries)
+        REQUEST_SQL_TIME.labels(method, route).observe(stats.sql_time)
+        REQUEST_ROWS.labels(method, route).observe(stats.rows)
+
+        if stats.statements is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+            statements = '\n'.join(
+                f'  [{duration * 1000:.1f} ms] {statement} {parameters!r:.500}'
+                for duration, statement, parameters in stats.statements
+            )
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms SQL, %d rows\n%s',
+                method, path, route, elapsed * 1000,
+                stats.queries, stats.sql_time * 1000, stats.rows, statements
+            )
+
+    return observe
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # One worker answers the scrape for all of them
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,92 @@
+"""baseline schema
+
+The tables as db.create_all() used to create them. Databases created that way
+already have them and have no alembic_version: existing tables are skipped so
+`flask db upgrade` adopts such a database at this revision.
+
+Revision ID: 8d1f0c3a2b47
+Revises:
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1f0c3a2b47'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _component_columns():
+    return [
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('code', sa.String(length=50), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('image_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['image_id'], ['images.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code'),
+    ]
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    def create_table(name, *columns):
+        if name not in existing:
+            op.create_table(name, *columns)
+
+    create_table(
+        'images',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('url', sa.Text(), nullable=False),
+        sa.Column('category', sa.String(length=50), nullable=True),
+        sa.Column('resolution', sa.String(length=50), nullable=True),
+        sa.Column('upload_date', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create_table('designs', *_component_columns())
+    create_table('treatments', *_component_columns())
+    create_table('materials', *_component_columns())
+    create_table(
+        'lenses',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('edi_code', sa.String(length=50), nullable=True),
+        sa.Column('design_id', sa.Integer(), nullable=True),
+        sa.Column('material_id', sa.Integer(), nullable=True),
+        sa.Column('treatment_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['design_id'], ['designs.id']),
+        sa.ForeignKeyConstraint(['material_id'], ['materials.id']),
+        sa.ForeignKeyConstraint(['treatment_id'], ['treatments.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('edi_code'),
+    )
+    create_table(
+        'catalog_versions',
+        sa.Column('table_name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name'),
+    )
+    if 'refresh_tokens' not in existing:
+        op.create_table(
+            'refresh_tokens',
+            sa.Column('token_hash', sa.String(length=64), nullable=False),
+            sa.Column('user_id', sa.String(length=64), nullable=False),
+            sa.Column('user_data', sa.JSON(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('token_hash'),
+        )
+        op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_refresh_tokens_expires_at', table_name='refresh_tokens')
+    for name in ('refresh_tokens', 'catalog_versions', 'lenses', 'materials', 'treatments', 'designs', 'images'):
+        op.drop_table(name)
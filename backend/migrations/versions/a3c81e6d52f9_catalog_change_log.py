@@ -0,0 +1,43 @@
+"""catalog change log
+
+The catalog_changes table behind /api/changes: every write transaction takes
+the next value of the 'catalog_changes' counter in catalog_versions and logs
+the rows it changed under that version (see versions.py).
+
+Revision ID: a3c81e6d52f9
+Revises: e5b93d0f7a21
+Create Date: 2026-10-18 15:02:11.904377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c81e6d52f9'
+down_revision = 'e5b93d0f7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'catalog_changes',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('table_name', sa.String(length=50), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=True),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_catalog_changes_version', 'catalog_changes', ['version'], unique=False)
+    # The counter exists from the start: concurrent first writers must not
+    # both try to create it
+    versions = sa.table('catalog_versions', sa.column('table_name'), sa.column('version'))
+    op.bulk_insert(versions, [{'table_name': 'catalog_changes', 'version': 0}])
+
+
+def downgrade():
+    op.execute("DELETE FROM catalog_versions WHERE table_name = 'catalog_changes'")
+    op.drop_index('ix_catalog_changes_version', table_name='catalog_changes')
+    op.drop_table('catalog_changes')
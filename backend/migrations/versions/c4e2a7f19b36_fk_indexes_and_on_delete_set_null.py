@@ -0,0 +1,93 @@
+"""index foreign keys, ON DELETE SET NULL
+
+Every component reference (lenses.design_id/material_id/treatment_id and
+image_id on designs, treatments and materials) gets an index, so filtering
+lenses by component and the foreign-key checks of a delete use it instead of
+scanning the table, and its constraint is recreated with ON DELETE SET NULL,
+so deleting an image or a component is a single statement: the database
+unlinks the rows that referenced it.
+
+On PostgreSQL the constraints are added NOT VALID then validated, and the
+indexes built CONCURRENTLY, so writes are not blocked on a large catalog.
+SQLite tables are rebuilt (batch mode), its constraints having no names.
+
+Revision ID: c4e2a7f19b36
+Revises: 8d1f0c3a2b47
+Create Date: 2026-10-18 09:47:03.552917
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e2a7f19b36'
+down_revision = '8d1f0c3a2b47'
+branch_labels = None
+depends_on = None
+
+# (table, column, referenced table)
+FOREIGN_KEYS = [
+    ('designs', 'image_id', 'images'),
+    ('treatments', 'image_id', 'images'),
+    ('materials', 'image_id', 'images'),
+    ('lenses', 'design_id', 'designs'),
+    ('lenses', 'material_id', 'materials'),
+    ('lenses', 'treatment_id', 'treatments'),
+]
+
+# Names given to unnamed (SQLite) constraints so batch mode can drop them
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _tables():
+    tables = {}
+    for table, column, referred in FOREIGN_KEYS:
+        tables.setdefault(table, []).append((column, referred))
+    return tables
+
+
+def _constraint_name(inspector, table, column, referred):
+    for fk in inspector.get_foreign_keys(table):
+        if fk['constrained_columns'] == [column] and fk['name']:
+            return fk['name']
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _replace_foreign_keys(ondelete):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    postgresql = bind.dialect.name == 'postgresql'
+    for table, columns in _tables().items():
+        names = {column: _constraint_name(inspector, table, column, referred) for column, referred in columns}
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred in columns:
+                batch_op.drop_constraint(names[column], type_='foreignkey')
+                batch_op.create_foreign_key(
+                    names[column], referred, [column], ['id'],
+                    ondelete=ondelete, postgresql_not_valid=postgresql
+                )
+        if postgresql:
+            for column, _ in columns:
+                op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {names[column]}')
+
+
+def upgrade():
+    _replace_foreign_keys('SET NULL')
+
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block() if postgresql else nullcontext():
+        for table, column, _ in FOREIGN_KEYS:
+            op.create_index(
+                f'ix_{table}_{column}', table, [column], unique=False, if_not_exists=True,
+                postgresql_concurrently=postgresql
+            )
+
+
+def downgrade():
+    for table, column, _ in FOREIGN_KEYS:
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
+    _replace_foreign_keys(None)
+
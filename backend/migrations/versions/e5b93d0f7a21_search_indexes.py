@@ -0,0 +1,63 @@
+"""full-text and trigram search indexes
+
+GIN indexes for /api/search on PostgreSQL: the weighted tsvector of each
+searchable table (the expressions of search.document_sql(), which must stay
+identical for the planner to use them) and a trigram index on its name, for
+typo-tolerant matches. Built CONCURRENTLY so writes are not blocked.
+
+Other databases search with the in-process index of search.py: nothing to do.
+
+Revision ID: e5b93d0f7a21
+Revises: c4e2a7f19b36
+Create Date: 2026-10-18 14:05:26.730114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b93d0f7a21'
+down_revision = 'c4e2a7f19b36'
+branch_labels = None
+depends_on = None
+
+# table -> weighted columns, as in search.SEARCH_TYPES at this revision
+DOCUMENTS = {
+    'lenses': (('edi_code', 'A'), ('name', 'B'), ('description', 'C')),
+    'designs': (('code', 'A'), ('name', 'B'), ('description', 'C')),
+    'treatments': (('code', 'A'), ('name', 'B'), ('description', 'C')),
+    'materials': (('code', 'A'), ('name', 'B'), ('description', 'C')),
+    'images': (('name', 'B'), ('category', 'C')),
+}
+
+
+def _document(columns):
+    return ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+        for column, weight in columns
+    )
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for table, columns in DOCUMENTS.items():
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_search '
+                f'ON {table} USING gin (({_document(columns)}))'
+            )
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_name_trgm '
+                f'ON {table} USING gin (name gin_trgm_ops)'
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for table in DOCUMENTS:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS ix_{table}_search')
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS ix_{table}_name_trgm')
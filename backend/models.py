@@ -1,8 +1,19 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
+# SQLite only enforces foreign keys (and their ON DELETE actions) when asked
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 class Image(db.Model):
     __tablename__ = 'images'
     id = db.Column(db.Integer, primary_key=True)
@@ -12,10 +23,10 @@ class Image(db.Model):
     resolution = db.Column(db.String(50))
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # Relationships
-    designs = db.relationship('Design', backref='image', lazy=True)
-    treatments = db.relationship('Treatment', backref='image', lazy=True)
-    materials = db.relationship('Material', backref='image', lazy=True)
+    # Relationships (children are unlinked by ON DELETE SET NULL, not loaded)
+    designs = db.relationship('Design', backref='image', lazy=True, passive_deletes=True)
+    treatments = db.relationship('Treatment', backref='image', lazy=True, passive_deletes=True)
+    materials = db.relationship('Material', backref='image', lazy=True, passive_deletes=True)
 
 class Design(db.Model):
     __tablename__ = 'designs'
@@ -23,8 +34,8 @@ class Design(db.Model):
     code = db.Column(db.String(50), nullable=False, unique=True)
     name = db.Column(db.String(255))
     description = db.Column(db.Text)
-    image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=True)
-    lenses = db.relationship('Lens', backref='design', lazy=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('images.id', ondelete='SET NULL'), nullable=True, index=True)
+    lenses = db.relationship('Lens', backref='design', lazy=True, passive_deletes=True)
 
 class Treatment(db.Model):
     __tablename__ = 'treatments'
@@ -32,8 +43,8 @@ class Treatment(db.Model):
     code = db.Column(db.String(50), nullable=False, unique=True)
     name = db.Column(db.String(255))
     description = db.Column(db.Text)
-    image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=True)
-    lenses = db.relationship('Lens', backref='treatment', lazy=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('images.id', ondelete='SET NULL'), nullable=True, index=True)
+    lenses = db.relationship('Lens', backref='treatment', lazy=True, passive_deletes=True)
 
 class Material(db.Model):
     __tablename__ = 'materials'
@@ -41,8 +52,8 @@ class Material(db.Model):
     code = db.Column(db.String(50), nullable=False, unique=True)
     name = db.Column(db.String(255))
     description = db.Column(db.Text)
-    image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=True)
-    lenses = db.relationship('Lens', backref='material', lazy=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('images.id', ondelete='SET NULL'), nullable=True, index=True)
+    lenses = db.relationship('Lens', backref='material', lazy=True, passive_deletes=True)
 
 class Lens(db.Model):
     __tablename__ = 'lenses'
@@ -52,6 +63,28 @@ class Lens(db.Model):
     edi_code = db.Column(db.String(50), unique=True)
     
     # Relationships
-    design_id = db.Column(db.Integer, db.ForeignKey('designs.id'), nullable=True)
-    material_id = db.Column(db.Integer, db.ForeignKey('materials.id'), nullable=True)
-    treatment_id = db.Column(db.Integer, db.ForeignKey('treatments.id'), nullable=True)
+    design_id = db.Column(db.Integer, db.ForeignKey('designs.id', ondelete='SET NULL'), nullable=True, index=True)
+    material_id = db.Column(db.Integer, db.ForeignKey('materials.id', ondelete='SET NULL'), nullable=True, index=True)
+    treatment_id = db.Column(db.Integer, db.ForeignKey('treatments.id', ondelete='SET NULL'), nullable=True, index=True)
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Append-only log of catalog changes, one entry per changed row and
+# transaction (see versions.py); row_id is None when a whole table changed
+class CatalogChange(db.Model):
+    __tablename__ = 'catalog_changes'
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class RefreshToken(db.Model):
+    __tablename__ = 'refresh_tokens'
+    token_hash = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.String(64), nullable=False)
+    user_data = db.Column(db.JSON, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,161 @@
+"""
+Cross-worker fan-out of committed catalog changes.
+
+Every commit's changes (see events.py) are dispatched to the local
+subscribers (in-process caches) as soon as the commit succeeds. On PostgreSQL
+they are also sent with NOTIFY from inside the committing transaction, so they
+are delivered only if it commits, and a listener thread in every worker
+process relays notifications from the other workers to its own subscribers.
+
+Notifications are asynchronous, and other databases have none, so readers
+also catch up from the catalog change log (see versions.py): conditional()
+reads the catalog version along with the table versions of its ETag, and
+catch_up() dispatches, before the response is built, the changes logged up to
+that version that this process has not dispatched yet (one query, only when
+the version moved). A cache consulted after it never predates its ETag,
+whichever worker committed.
+
+A ``(None, None)`` change means anything may have changed, e.g. after the
+listener reconnects and notifications may have been lost.
+"""
+
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+from sqlalchemy import text
+
+from daemons import start_daemon
+from events import on_change, on_commit
+from models import CatalogChange
+
+CHANNEL = 'catalog_changes'
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7900
+# Log entries read by one catch-up; beyond, everything is invalidated
+MAX_CATCH_UP_ENTRIES = 10000
+
+logger = logging.getLogger(__name__)
+
+_subscribers = []
+_caught_up = {'version': None}
+_catch_up_lock = threading.Lock()
+
+changes_table = CatalogChange.__table__
+
+
+def subscribe(callback):
+    """Register ``callback(changes)`` for local and remote catalog changes."""
+    _subscribers.append(callback)
+    return callback
+
+
+def dispatch(changes):
+    for callback in _subscribers:
+        try:
+            callback(changes)
+        except Exception:
+            logger.exception('Catalog change subscriber failed')
+
+
+def origin():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def encode(changes):
+    rows = sorted(changes, key=lambda c: (c[0], c[1] is None, c[1] or 0))
+    payload = json.dumps({'origin': origin(), 'rows': rows}, separators=(',', ':'))
+    if len(payload) > MAX_PAYLOAD:
+        # Too many rows for one notification: fall back to whole tables
+        tables = sorted({table for table, _ in changes})
+        payload = json.dumps({'origin': origin(), 'rows': [[t, None] for t in tables]})
+    return payload
+
+
+def decode(payload):
+    message = json.loads(payload)
+    return message['origin'], frozenset((table, id) for table, id in message['rows'])
+
+
+def catch_up(conn, version):
+    """Dispatch the changes logged up to catalog ``version`` not dispatched yet.
+
+    The first call of a process only records ``version``: its caches are
+    filled afterwards.
+    """
+    seen = _caught_up['version']
+    if seen is not None and version == seen:
+        return
+    with _catch_up_lock:
+        seen = _caught_up['version']
+        if seen is None or version == seen:
+            _caught_up['version'] = version
+            return
+        if version < seen:
+            # Another catalog (restored database): start over
+            changes = frozenset({(None, None)})
+        else:
+            entries = conn.execute(
+                changes_table.select()
+                .where(changes_table.c.version > seen, changes_table.c.version <= version)
+                .order_by(changes_table.c.version)
+                .limit(MAX_CATCH_UP_ENTRIES + 1)
+            ).all()
+            # Every version has entries: the log covers ``seen`` if the next one is there
+            if not entries or entries[0].version != seen + 1 or len(entries) > MAX_CATCH_UP_ENTRIES:
+                changes = frozenset({(None, None)})
+            else:
+                changes = frozenset((entry.table_name, entry.row_id) for entry in entries)
+        # Under the lock: no request goes past catch_up() before its caches are told
+        dispatch(changes)
+        _caught_up['version'] = version
+
+
+@on_commit
+def _dispatch_local(changes):
+    dispatch(changes)
+
+
+@on_change
+def _notify_remote(session, changes):
+    conn = session.connection()
+    if conn.dialect.name != 'postgresql':
+        return
+    conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                 {'channel': CHANNEL, 'payload': encode(changes)})
+
+
+def _listen(engine):
+    own = origin()
+    while True:
+        try:
+            conn = engine.raw_connection()
+            conn.detach()
+            dbapi_conn = conn.driver_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            # Changes may have been missed while disconnected
+            dispatch(frozenset({(None, None)}))
+            while True:
+                if select.select([dbapi_conn], [], [], 30) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    sender, changes = decode(notify.payload)
+                    if sender != own:
+                        dispatch(changes)
+        except Exception:
+            logger.exception('Catalog change listener lost its connection')
+            time.sleep(5)
+
+
+def start_listener(engine):
+    """Start the NOTIFY relay for this process (idempotent, fork-aware)."""
+    if engine.dialect.name == 'postgresql':
+        start_daemon('catalog-listener', _listen, engine)
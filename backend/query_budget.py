@@ -0,0 +1,100 @@
+"""
+Query budgets and N+1 detection.
+
+QueryLog records the SQL statements the current thread sends through any
+engine. statement_shape() reduces a statement to its shape (bound parameters,
+literals, IN lists and multi-row VALUES collapsed), so the same query run once
+per row of a result — the usual N+1 pattern of walking a lazy relationship —
+shows up as a single shape executed many times. query_budget() fails when the
+block issues more statements than declared, or repeats a shape more than
+``max_repeats`` times:
+
+    with query_budget(2):
+        client.get('/api/lenses/1')
+
+benchmarks/query_budgets.py runs every route of the app against a synthetic
+catalog with its declared budget.
+"""
+
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_MAX_REPEATS = 2
+
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+_VALUES = re.compile(r'\bVALUES (\([?, ]*\))(?:, \([?, ]*\))+', re.IGNORECASE)
+
+_active = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement):
+    shape = ' '.join(statement.split())
+    shape = _PARAMETER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?)', shape)
+    return _VALUES.sub(r'VALUES \1', shape)
+
+
+class QueryLog:
+    """Statements executed by this thread while the log is open."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        if not hasattr(_active, 'logs'):
+            _active.logs = []
+        _active.logs.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _active.logs.remove(self)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def shapes(self):
+        return Counter(statement_shape(statement) for statement, _ in self.statements)
+
+    def repeated(self, max_repeats=DEFAULT_MAX_REPEATS):
+        """Shapes executed more than ``max_repeats`` times: likely N+1 queries."""
+        return {shape: n for shape, n in self.shapes().items() if n > max_repeats}
+
+    def problems(self, max_queries, max_repeats=DEFAULT_MAX_REPEATS):
+        problems = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append(f'{self.count} statements, budget is {max_queries}')
+        for shape, n in self.repeated(max_repeats).items():
+            problems.append(f'likely N+1: {n} x {shape}')
+        return problems
+
+    def report(self):
+        return '\n'.join(
+            f'{n:4d} x {shape}' for shape, n in self.shapes().most_common()
+        )
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _log_statement(conn, cursor, statement, parameters, context, executemany):
+    for log in getattr(_active, 'logs', ()):
+        log.statements.append((statement, parameters))
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=DEFAULT_MAX_REPEATS):
+    """Fail if the block runs over ``max_queries`` statements or repeats one."""
+    with QueryLog() as log:
+        yield log
+    problems = log.problems(max_queries, max_repeats)
+    if problems:
+        raise QueryBudgetExceeded('\n'.join(problems) + '\nStatements:\n' + log.report())
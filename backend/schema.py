@@ -0,0 +1,43 @@
+"""
+Schema management on top of the Alembic migrations in migrations/.
+
+The schema is owned by the migrations: app.py upgrades the database to the
+latest revision at startup (unless AUTO_MIGRATE=0; under gunicorn, once
+before the workers start) and ``flask db upgrade`` does the same from the
+command line. On PostgreSQL an upgrade holds an advisory lock, so replicas
+starting together migrate one after the other. Databases created with the
+former ``db.create_all()`` are adopted by the baseline revision, which only
+creates missing tables.
+"""
+
+import os
+
+import flask_migrate
+from sqlalchemy import text
+
+from models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Key of the advisory lock serializing upgrades (PostgreSQL)
+MIGRATION_LOCK_ID = 0x76697474
+
+
+def upgrade_schema(revision='head'):
+    if db.engine.dialect.name != 'postgresql':
+        flask_migrate.upgrade(directory=MIGRATIONS_DIR, revision=revision)
+        return
+    with db.engine.connect() as conn:
+        conn.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+        try:
+            # A concurrent upgrade is done by now: finds nothing left to apply
+            flask_migrate.upgrade(directory=MIGRATIONS_DIR, revision=revision)
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+
+
+def reset_schema(revision='head'):
+    """Drop every table and rebuild the schema (seeding, benchmarks)."""
+    db.drop_all()
+    db.session.execute(text('DROP TABLE IF EXISTS alembic_version'))
+    db.session.commit()
+    upgrade_schema(revision)
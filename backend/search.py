@@ -0,0 +1,341 @@
+"""
+Catalog search across lenses, components and images.
+
+Each searchable table contributes a weighted document: its code (``edi_code``
+for lenses) weighs most, then the name, then the description (the category
+for images). Query words match whole words or word prefixes, and every word
+of the query must match.
+
+On PostgreSQL the documents are full-text indexed (``simple`` configuration,
+prefix ``tsquery``) and names are trigram indexed, which also catches typos;
+see the e5b93d0f7a21 migration, whose expressions must stay identical to
+``document_sql()``. Results are ranked with ``ts_rank`` plus the trigram word
+similarity of the name.
+
+Other databases use an in-process inverted index with the same weights. It
+is built on the first search and kept up to date from catalog changes (see
+pubsub.py): changed rows are re-read and re-indexed before the next search,
+and a table reported changed as a whole is rebuilt before it (see
+indexes.py).
+"""
+
+import os
+import re
+import sys
+from bisect import bisect_left
+from itertools import product, takewhile
+from math import prod
+
+from sqlalchemy import select, text
+
+from indexes import TrackedIndex
+from listing import parse_limit_param, parse_type_list
+from models import db, Image, Design, Treatment, Material, Lens
+from pubsub import subscribe
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', 100))
+# Terms a query word may expand to as a prefix (in-process index)
+MAX_PREFIX_TERMS = int(os.getenv('SEARCH_MAX_PREFIX_TERMS', 2000))
+# Shorter query words only match whole words (in-process index)
+MIN_PREFIX_LENGTH = 2
+# Score combinations of a multi-word query beyond which words are not graded
+MAX_COMBINATIONS = 64
+# Rows of the rarest word checked one by one before intersecting sets
+PROBE_SIZE = 1000
+LOAD_BATCH_SIZE = 10000
+
+# Result type -> model, code column and weighted columns. A, B and C are the
+# full-text weights; ts_rank gives them 1.0, 0.4 and 0.2 by default
+SEARCH_TYPES = {
+    'lens': (Lens, 'edi_code', (('edi_code', 'A'), ('name', 'B'), ('description', 'C'))),
+    'design': (Design, 'code', (('code', 'A'), ('name', 'B'), ('description', 'C'))),
+    'treatment': (Treatment, 'code', (('code', 'A'), ('name', 'B'), ('description', 'C'))),
+    'material': (Material, 'code', (('code', 'A'), ('name', 'B'), ('description', 'C'))),
+    'image': (Image, None, (('name', 'B'), ('category', 'C'))),
+}
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+# Score of a prefix match relative to a whole-word match
+PREFIX_FACTOR = 0.5
+
+WORD = re.compile(r'\w+')
+TABLE_TYPES = {model.__tablename__: search_type for search_type, (model, _, _) in SEARCH_TYPES.items()}
+
+
+def tokenize(value):
+    return WORD.findall(value.lower()) if value else []
+
+
+def parse_types(value):
+    return parse_type_list(value, SEARCH_TYPES, "Cannot search '{}'")
+
+
+def parse_limit(value):
+    return parse_limit_param(value, DEFAULT_LIMIT, MAX_LIMIT)
+
+
+def search(query, types, limit):
+    """Return the ``limit`` best matches of ``query`` as result dicts."""
+    words = tokenize(query)
+    if not words:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        return _search_postgres(query, words, types, limit)
+    return _load_results(index.search(words, types, limit))
+
+
+# --- PostgreSQL: full-text and trigram indexes ---
+
+def document_sql(search_type):
+    """The weighted tsvector of a table, as indexed by the migration."""
+    return ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+        for column, weight in SEARCH_TYPES[search_type][2]
+    )
+
+
+def _search_postgres(query, words, types, limit):
+    branches = []
+    for search_type in types:
+        model, code, _ = SEARCH_TYPES[search_type]
+        document = document_sql(search_type)
+        branches.append(
+            f"(SELECT '{search_type}' AS type, id, name, {code or 'NULL'} AS code, "
+            f"ts_rank({document}, query) + word_similarity(:q, coalesce(name, '')) AS score "
+            f"FROM {model.__tablename__}, to_tsquery('simple', :tsquery) AS query "
+            f"WHERE {document} @@ query OR :q <% name "
+            f"ORDER BY score DESC, id LIMIT :limit)"
+        )
+    rows = db.session.execute(
+        text(' UNION ALL '.join(branches) + ' ORDER BY score DESC, type, id LIMIT :limit'),
+        {'q': query, 'tsquery': ' & '.join(f'{word}:*' for word in words), 'limit': limit}
+    )
+    return [_result(row.type, row.id, row.name, row.code, row.score) for row in rows]
+
+
+def _result(search_type, id, name, code, score):
+    return {'type': search_type, 'id': id, 'name': name, 'code': code, 'score': round(score, 4)}
+
+
+def _load_results(ranked):
+    """Fetch names and codes of ``(score, type, id)`` matches, one query per type."""
+    ids = {}
+    for _, search_type, id in ranked:
+        ids.setdefault(search_type, []).append(id)
+    rows = {}
+    for search_type, type_ids in ids.items():
+        model, code, _ = SEARCH_TYPES[search_type]
+        columns = [model.id, model.name, getattr(model, code) if code else None]
+        stmt = select(*[c for c in columns if c is not None]).where(model.id.in_(type_ids))
+        for row in db.session.execute(stmt):
+            rows[search_type, row[0]] = row[1], row[2] if code else None
+    # Rows deleted since the index was refreshed are skipped
+    return [
+        _result(search_type, id, *rows[search_type, id], score)
+        for score, search_type, id in ranked if (search_type, id) in rows
+    ]
+
+
+# --- In-process inverted index ---
+
+class TableIndex:
+    """Inverted index of one table.
+
+    Each field weight has its own postings, term -> row ids, a term matching
+    a single row (codes, mostly) being stored as that bare id. Matching is
+    done with set operations and only the ``limit`` best rows are read.
+    """
+
+    def __init__(self, search_type):
+        self.search_type = search_type
+        self.postings = {weight: {} for weight in WEIGHTS}
+        self.terms = []  # sorted vocabulary, for prefix lookups
+        self.docs = {}  # row id -> its terms, to unindex it
+
+    def columns(self):
+        model = SEARCH_TYPES[self.search_type][0]
+        return [model.id] + [getattr(model, column) for column, _ in SEARCH_TYPES[self.search_type][2]]
+
+    def load(self, conn):
+        """Index every row of the table (a fresh index only)."""
+        result = conn.execute(select(*self.columns()).execution_options(yield_per=LOAD_BATCH_SIZE))
+        for row in result:
+            self._add(row[0], row[1:])
+        self.terms = sorted({term for postings in self.postings.values() for term in postings})
+
+    def fetch(self, conn, ids):
+        """Read the indexed columns of ``ids``: {id: values}."""
+        ids = sorted(ids)
+        rows = {}
+        model = SEARCH_TYPES[self.search_type][0]
+        for start in range(0, len(ids), LOAD_BATCH_SIZE):
+            chunk = ids[start:start + LOAD_BATCH_SIZE]
+            for row in conn.execute(select(*self.columns()).where(model.id.in_(chunk))):
+                rows[row[0]] = row[1:]
+        return rows
+
+    def apply(self, ids, rows):
+        """Re-index ``ids`` from fetched ``rows``; missing rows are removed."""
+        for id in ids:
+            old = set(self._remove(id))
+            new = set(self._add(id, rows[id])) if id in rows else set()
+            # The vocabulary is large: only touch the terms that came or went
+            for term in old - new:
+                if not any(term in postings for postings in self.postings.values()):
+                    del self.terms[bisect_left(self.terms, term)]
+            for term in new - old:
+                i = bisect_left(self.terms, term)
+                if i == len(self.terms) or self.terms[i] != term:
+                    self.terms.insert(i, term)
+
+    def _add(self, id, values):
+        best = {}
+        for value, (_, weight) in zip(values, SEARCH_TYPES[self.search_type][2]):
+            for term in tokenize(value):
+                if term not in best or WEIGHTS[weight] > WEIGHTS[best[term]]:
+                    best[term] = weight
+        for term, weight in best.items():
+            postings = self.postings[weight]
+            entry = postings.get(term)
+            if entry is None:
+                postings[sys.intern(term)] = id
+            elif isinstance(entry, int):
+                postings[term] = {entry, id}
+            else:
+                entry.add(id)
+        terms = self.docs[id] = tuple(sys.intern(term) for term in best)
+        return terms
+
+    def _remove(self, id):
+        terms = self.docs.pop(id, ())
+        for term in terms:
+            for postings in self.postings.values():
+                entry = postings.get(term)
+                if entry == id or entry == {id}:
+                    del postings[term]
+                elif isinstance(entry, set):
+                    entry.discard(id)
+        return terms
+
+    def matches(self, word):
+        """``[(score, entries)]`` of the terms matching ``word``, best first."""
+        terms = [word]
+        if len(word) >= MIN_PREFIX_LENGTH:
+            i = bisect_left(self.terms, word)
+            following = self.terms[i:i + MAX_PREFIX_TERMS + 1]
+            terms += [term for term in takewhile(lambda term: term.startswith(word), following) if term != word]
+        levels = {}
+        for weight, postings in self.postings.items():
+            for term in terms:
+                entry = postings.get(term)
+                if entry is not None:
+                    score = WEIGHTS[weight] * (1.0 if term == word else PREFIX_FACTOR)
+                    levels.setdefault(score, []).append(entry)
+        return sorted(levels.items(), reverse=True)
+
+    def top(self, words, limit):
+        """The ``limit`` best ``(score, id)`` rows matching all ``words``."""
+        levels = [self.matches(word) for word in words]
+        if not all(levels):
+            return []
+        if len(levels) == 1:
+            # One word: walk its postings best first, no set is built
+            candidates = ((score, id) for score, entries in levels[0] for id in _ids(entries))
+        else:
+            if prod(len(word_levels) for word_levels in levels) > MAX_COMBINATIONS:
+                # Too many score combinations: one level per word, its best
+                levels = [[(word_levels[0][0], [e for _, entries in word_levels for e in entries])]
+                          for word_levels in levels]
+            levels = [[(score, _union(entries)) for score, entries in word_levels] for word_levels in levels]
+            combinations = sorted(product(*levels), key=lambda combination: -sum(s for s, _ in combination))
+            candidates = (
+                (sum(score for score, _ in combination), id)
+                for combination in combinations
+                for id in _intersection([ids for _, ids in combination])
+            )
+        results, seen = [], set()
+        for score, id in candidates:
+            if id not in seen:
+                seen.add(id)
+                results.append((score, id))
+                if len(results) == limit:
+                    break
+        return results
+
+
+def _ids(entries):
+    for entry in entries:
+        if isinstance(entry, int):
+            yield entry
+        else:
+            yield from entry
+
+
+def _intersection(sets):
+    """Ids in all ``sets``, lazily: words that go together are found by probing
+    the smallest set, the full intersection is only computed if that fails."""
+    smallest, *others = sorted(sets, key=len)
+    for probed, id in enumerate(smallest, 1):
+        if all(id in other for other in others):
+            yield id
+        if probed == PROBE_SIZE:
+            yield from smallest.intersection(*others)
+            return
+
+
+def _union(entries):
+    if len(entries) == 1 and isinstance(entries[0], set):
+        return entries[0]
+    ids = set()
+    for entry in entries:
+        if isinstance(entry, int):
+            ids.add(entry)
+        else:
+            ids |= entry
+    return ids
+
+
+class SearchIndex(TrackedIndex):
+    """In-process search index of the catalog tables, refreshed from changes."""
+
+    PARTS = tuple(SEARCH_TYPES)
+
+    def __init__(self):
+        super().__init__()
+        self.tables = {}
+        self._pending = {}  # search type -> changed row ids
+
+    def track(self, table, id):
+        if table in TABLE_TYPES and id is None:
+            self.mark_stale(TABLE_TYPES[table])
+        elif table in TABLE_TYPES:
+            self._pending.setdefault(TABLE_TYPES[table], set()).add(id)
+
+    def search(self, words, types, limit):
+        """Return the ``limit`` best ``(score, type, id)`` matches of ``words``."""
+        with self.refreshed():
+            ranked = []
+            for search_type in types:
+                ranked += [(score, search_type, id) for score, id in self.tables[search_type].top(words, limit)]
+        order = {search_type: i for i, search_type in enumerate(types)}
+        ranked.sort(key=lambda match: (-match[0], order[match[1]], match[2]))
+        return ranked[:limit]
+
+    def build(self, conn, search_type):
+        table = TableIndex(search_type)
+        table.load(conn)
+        self.tables[search_type] = table
+        self._pending.pop(search_type, None)
+
+    def update(self):
+        if not self._pending:
+            return
+        with db.engine.connect() as conn:
+            for search_type, ids in self._pending.items():
+                table = self.tables[search_type]
+                table.apply(ids, table.fetch(conn, ids))
+        self._pending.clear()
+
+
+index = SearchIndex()
+subscribe(index.invalidate)
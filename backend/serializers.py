@@ -0,0 +1,55 @@
+"""
+Per-model serializers compiled once at import time.
+
+For each model two functions are generated from its column list:
+- ``to_dict(obj)`` reads attributes of a hydrated ORM instance
+- ``row_to_dict(row)`` reads a plain column tuple, as returned by
+  ``select(*Model.__table__.columns)``, without building ORM instances
+
+Both return the same dict the generic column loop used to build, with
+datetimes converted to ISO 8601 strings.
+"""
+
+from sqlalchemy import DateTime, select
+
+from models import Image, Design, Treatment, Material, Lens
+
+CATALOG_MODELS = (Image, Design, Treatment, Material, Lens)
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _compile(model):
+    fields = []
+    for index, column in enumerate(model.__table__.columns):
+        convert = '_isoformat' if isinstance(column.type, DateTime) else ''
+        fields.append((column.name, index, convert))
+    attr_items = ', '.join(f'{name!r}: {conv}(obj.{name})' for name, _, conv in fields)
+    row_items = ', '.join(f'{name!r}: {conv}(row[{i}])' for name, i, conv in fields)
+    source = (
+        f'def to_dict(obj):\n    return {{{attr_items}}}\n'
+        f'def row_to_dict(row):\n    return {{{row_items}}}\n'
+    )
+    namespace = {'_isoformat': _isoformat}
+    exec(compile(source, f'<serializer {model.__name__}>', 'exec'), namespace)
+    return namespace['to_dict'], namespace['row_to_dict']
+
+
+_compiled = {model: _compile(model) for model in CATALOG_MODELS}
+
+
+def to_dict(obj):
+    """Serialize a hydrated catalog model instance."""
+    return _compiled[type(obj)][0](obj)
+
+
+def row_serializer(model):
+    """Return the tuple serializer matching ``column_select(model)``."""
+    return _compiled[model][1]
+
+
+def column_select(model):
+    """Select the model's columns as plain tuples, in serializer order."""
+    return select(*model.__table__.columns)
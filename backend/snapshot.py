@@ -0,0 +1,485 @@
+"""
+Prebuilt snapshot of the public catalog: every lens, enriched as by
+GET /api/lenses/<id> (design, material and treatment info with their image
+URLs), in one file per encoding:
+
+- ``<hash>.json``: ``{"lenses": [...], "version": N}``, the lens objects of
+  the API, in id order
+- ``<hash>.bin``: the compact binary encoding below, where components are
+  stored once and referenced by id (decode_binary() reads it back)
+
+Both are gzip-compressed and named after the hash of their bytes, so they
+never change: GET /api/catalog/snapshot returns the current names, and kiosks
+and CDNs cache the files themselves for good. ``version`` is the catalog
+version (see versions.py) the snapshot includes every change up to.
+
+The snapshot is kept in parts: lenses by id range (SNAPSHOT_CHUNK_SIZE ids),
+each compressed on its own as a raw deflate segment, and the components.
+Catalog changes mark the parts they touch (a component, the lens ranges that
+use it); every manifest request first reads the catalog version and catches
+up with the changes other workers committed up to it (see
+pubsub.catch_up()), then rebuilds those parts only, and joins the segments into
+one gzip member, combining their CRC-32s without the uncompressed bytes.
+Whole-table changes rebuild everything before the next manifest, like the
+search index (see indexes.py). Files are written to SNAPSHOT_DIR, from which
+any worker serves them.
+
+Binary encoding: unsigned LEB128 varints; a string is its UTF-8 length plus
+one then its bytes (0: null); a component reference is its id (0: none).
+
+    b'VCAT', format (1), version, number of lenses
+    for design, material, treatment: count, then per component
+        id, code, name, description, image, image_url
+    per lens, in id order: id, name, description, edi_code, design,
+        material, treatment
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import re
+import struct
+import tempfile
+import zlib
+
+from sqlalchemy import or_, select
+
+from indexes import TrackedIndex
+from models import db, Image, Design, Treatment, Material, Lens
+from pubsub import catch_up, subscribe
+from serializers import column_select, row_serializer
+from versions import CHANGES_COUNTER, versions_table
+
+CHUNK_SIZE = int(os.getenv('SNAPSHOT_CHUNK_SIZE', 1000))
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR') or os.path.join(tempfile.gettempdir(), 'vittion-snapshots')
+# Files of earlier snapshots kept per encoding, for clients still on them
+KEEP_FILES = int(os.getenv('SNAPSHOT_KEEP_FILES', 10))
+COMPRESSION_LEVEL = 6
+
+COMPONENTS = (('design', Design), ('material', Material), ('treatment', Treatment))
+COMPONENT_TABLES = {model.__tablename__: name for name, model in COMPONENTS}
+FORMATS = {'json': 'application/json', 'bin': 'application/octet-stream'}
+MAGIC = b'VCAT'
+FORMAT_VERSION = 1
+
+# No file name nor mtime: the same content always compresses to the same bytes
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+# Empty final deflate block, closing the segments
+DEFLATE_END = b'\x03\x00'
+
+
+# --- Encoding ---
+
+def _varint(value, out):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _string(value, out):
+    if value is None:
+        out.append(0)
+        return
+    data = value.encode()
+    _varint(len(data) + 1, out)
+    out += data
+
+
+def _dumps(payload):
+    # What jsonify produces for the same payload
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+
+class Part:
+    """A raw deflate segment, with the CRC-32 and length of its input."""
+
+    __slots__ = ('data', 'crc', 'size')
+
+    def __init__(self, raw):
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+        # Byte-aligned and not final, so segments can follow each other
+        self.data = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.crc = zlib.crc32(raw)
+        self.size = len(raw)
+
+    def raw(self):
+        return zlib.decompressobj(-15).decompress(self.data)
+
+
+def _gf2_apply(operator, vector):
+    total = 0
+    for row in operator:
+        if not vector:
+            break
+        if vector & 1:
+            total ^= row
+        vector >>= 1
+    return total
+
+
+def _zero_operators():
+    # The CRC-32 register after one zero bit, as a 32x32 matrix over GF(2)
+    operator = [0xedb88320] + [1 << n for n in range(31)]
+    operators = []
+    for bits in range(35):
+        operator = [_gf2_apply(operator, row) for row in operator]
+        if bits >= 2:
+            operators.append(operator)
+    return operators
+
+
+# _ZEROS[k] appends 2**k zero bytes to a CRC-32, as zlib's crc32_combine
+_ZEROS = _zero_operators()
+
+
+def _crc32_combine(crc1, crc2, size2):
+    for operator in _ZEROS:
+        if not size2:
+            break
+        if size2 & 1:
+            crc1 = _gf2_apply(operator, crc1)
+        size2 >>= 1
+    return crc1 ^ crc2
+
+
+def gzip_join(parts):
+    """One gzip member made of ``parts``, without recompressing them."""
+    crc, size = 0, 0
+    for part in parts:
+        crc = _crc32_combine(crc, part.crc, part.size)
+        size += part.size
+    trailer = struct.pack('<II', crc, size & 0xffffffff)
+    return b''.join([GZIP_HEADER, *(part.data for part in parts), DEFLATE_END, trailer])
+
+
+def decode_binary(data):
+    """Read a (decompressed) binary snapshot back into ``(version, lenses)``,
+    the lenses enriched as in the JSON snapshot."""
+    position = 0
+
+    def varint():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def string():
+        nonlocal position
+        size = varint()
+        if not size:
+            return None
+        position += size - 1
+        return data[position - size + 1:position].decode()
+
+    if data[:4] != MAGIC or data[4] != FORMAT_VERSION:
+        raise ValueError('Not a binary catalog snapshot')
+    position = 5
+    version, count = varint(), varint()
+    components = {}
+    for name, _ in COMPONENTS:
+        for _ in range(varint()):
+            info = {'id': varint(), 'code': string(), 'name': string(), 'description': string()}
+            info['image_id'] = varint() or None
+            image_url = string()
+            if info['image_id'] is not None:
+                info['image_url'] = image_url
+            components[name, info['id']] = info
+    lenses = []
+    for _ in range(count):
+        lens = {'id': varint(), 'name': string(), 'description': string(), 'edi_code': string()}
+        for name, _ in COMPONENTS:
+            lens[f'{name}_id'] = varint() or None
+            if lens[f'{name}_id'] is not None:
+                lens[f'{name}_info'] = components[name, lens[f'{name}_id']]
+        lenses.append(lens)
+    return version, lenses
+
+
+# --- Parts ---
+
+class Chunk:
+    """The lenses of one id range, as a JSON and a binary segment."""
+
+    __slots__ = ('count', 'json', 'binary', '_lead')
+
+    def __init__(self, count, json, binary):
+        self.count = count
+        # Each lens is preceded by a comma; see lead()
+        self.json = Part(json.encode())
+        self.binary = binary
+        self._lead = None
+
+    def lead(self):
+        """The JSON segment without its leading comma, for the first chunk."""
+        if self._lead is None:
+            self._lead = Part(self.json.raw()[1:])
+        return self._lead
+
+
+# A component in the JSON of a chunk before its info is spliced in: only
+# object keys are unescaped quotes followed by a colon
+_INFO_REFERENCE = re.compile(r'"(%s)_info":(\d+)' % '|'.join(name for name, _ in COMPONENTS))
+
+
+def _load_components(conn, ids=None):
+    """``{(name, id): info}`` as serialize_lens builds them, for all or ``ids``."""
+    images = Image.__table__
+    infos = {}
+    for name, model in COMPONENTS:
+        table = model.__table__
+        stmt = select(*table.columns, images.c.url).outerjoin(images, table.c.image_id == images.c.id)
+        if ids is not None:
+            if not ids.get(name):
+                continue
+            stmt = stmt.where(table.c.id.in_(ids[name]))
+        serialize = row_serializer(model)
+        for row in conn.execute(stmt):
+            info = serialize(row)
+            if row.image_id is not None:
+                info['image_url'] = row.url
+            infos[name, row.id] = info
+    return infos
+
+
+def _components_part(components):
+    out = bytearray()
+    for name, _ in COMPONENTS:
+        infos = sorted((info for (kind, _), info in components.items() if kind == name), key=lambda i: i['id'])
+        _varint(len(infos), out)
+        for info in infos:
+            _varint(info['id'], out)
+            for field in ('code', 'name', 'description'):
+                _string(info[field], out)
+            _varint(info['image_id'] or 0, out)
+            _string(info.get('image_url'), out)
+    return Part(bytes(out))
+
+
+class State:
+    """Parts of one snapshot and what each was built from."""
+
+    def __init__(self):
+        self.version = 0
+        self.components = {}  # (name, id) -> info
+        self.users = {}  # (name, id) -> indexes of the chunks with lenses using it
+        self.chunks = {}  # index -> Chunk
+        self.info_json = {}  # (name, id) -> JSON of the info, as embedded in lenses
+        self.components_part = None
+        self.count = 0
+        self.files = {}  # format -> (name, gzip bytes)
+
+    def build(self, conn, version=None):
+        self.version = _read_version(conn) if version is None else version
+        self.components = _load_components(conn)
+        self.components_part = _components_part(self.components)
+        self.load_chunks(conn, None)
+
+    def load_chunks(self, conn, indexes, json_only=()):
+        """(Re)build the chunks at ``indexes``, or all of them.
+
+        Only the JSON of the ``json_only`` chunks is rebuilt: their lenses
+        did not change, only components they embed.
+        """
+        table = Lens.__table__
+        stmt = column_select(Lens).order_by(table.c.id)
+        previous = {}
+        if indexes is not None:
+            for index in indexes:
+                chunk = self.chunks.pop(index, None)
+                if chunk is not None and index in json_only:
+                    previous[index] = chunk
+            stmt = stmt.where(or_(*(
+                table.c.id.between(index * CHUNK_SIZE, (index + 1) * CHUNK_SIZE - 1)
+                for index in sorted(indexes)
+            )))
+        rows = conn.execution_options(yield_per=10000).execute(stmt)
+        for index, group in itertools.groupby(rows, key=lambda row: row.id // CHUNK_SIZE):
+            self.chunks[index] = self._chunk(index, list(group), previous.get(index))
+
+    def _chunk(self, index, rows, previous=None):
+        serialize = row_serializer(Lens)
+        # The binary segment references components by id: it stays valid
+        # unless lenses were added or removed behind the change events
+        binary = None if previous is not None and previous.count == len(rows) else bytearray()
+        lenses = []
+        for row in rows:
+            lens = serialize(row)
+            if binary is not None:
+                _varint(lens['id'], binary)
+                for field in ('name', 'description', 'edi_code'):
+                    _string(lens[field], binary)
+            for name, _ in COMPONENTS:
+                component_id = lens[f'{name}_id']
+                if binary is not None:
+                    _varint(component_id or 0, binary)
+                if component_id is None:
+                    continue
+                self.users.setdefault((name, component_id), set()).add(index)
+                if (name, component_id) in self.components:
+                    # Spliced in below, encoded once per component
+                    lens[f'{name}_info'] = component_id
+            lenses.append(lens)
+        json = _INFO_REFERENCE.sub(self._info, _dumps(lenses)[1:-1])
+        return Chunk(
+            len(lenses),
+            ',' + json if lenses else '',
+            previous.binary if binary is None else Part(bytes(binary)),
+        )
+
+    def _info(self, match):
+        key = match[1], int(match[2])
+        info = self.info_json.get(key)
+        if info is None:
+            info = self.info_json[key] = _dumps(self.components[key])
+        return f'"{match[1]}_info":{info}'
+
+    def assemble(self):
+        chunks = [self.chunks[index] for index in sorted(self.chunks) if self.chunks[index].count]
+        count = sum(chunk.count for chunk in chunks)
+        json_parts = [
+            Part(b'{"lenses":['),
+            *(chunk.lead() if i == 0 else chunk.json for i, chunk in enumerate(chunks)),
+            Part(f'],"version":{self.version}}}'.encode()),
+        ]
+        header = bytearray(MAGIC)
+        header.append(FORMAT_VERSION)
+        _varint(self.version, header)
+        _varint(count, header)
+        binary_parts = [Part(bytes(header)), self.components_part, *(chunk.binary for chunk in chunks)]
+        self.files = {'json': _publish('json', gzip_join(json_parts)),
+                      'bin': _publish('bin', gzip_join(binary_parts))}
+        self.count = count
+
+
+def _read_version(conn):
+    return conn.scalar(
+        select(versions_table.c.version).where(versions_table.c.table_name == CHANGES_COUNTER)
+    ) or 0
+
+
+# --- Files ---
+
+def _publish(fmt, data):
+    name = f'{hashlib.sha256(data).hexdigest()[:32]}.{fmt}'
+    path = os.path.join(SNAPSHOT_DIR, name + '.gz')
+    if not os.path.exists(path):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        # Other workers may be serving the directory: never a partial file
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+        _prune(fmt)
+    return name, data
+
+
+def _prune(fmt):
+    suffix = f'.{fmt}.gz'
+    paths = [os.path.join(SNAPSHOT_DIR, name) for name in os.listdir(SNAPSHOT_DIR) if name.endswith(suffix)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[KEEP_FILES:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def read_file(name):
+    """The gzip bytes of snapshot file ``name``, or None if unknown."""
+    for current, data in snapshot.files().values():
+        if name == current:
+            return data
+    stem, _, fmt = name.partition('.')
+    if fmt not in FORMATS or len(stem) != 32 or not all(c in '0123456789abcdef' for c in stem):
+        return None
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, name + '.gz'), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+# --- Snapshot ---
+
+class CatalogSnapshot(TrackedIndex):
+    """The current snapshot of this process, refreshed from changes."""
+
+    def __init__(self):
+        super().__init__()
+        self.state = None
+        self._chunks = set()  # lens chunks to rebuild
+        self._components = set()  # (name, id) to reload
+        self._images = set()
+
+    def track(self, table, id):
+        if id is None and (table in COMPONENT_TABLES or table in ('lenses', 'images')):
+            self.mark_stale()
+        elif table == 'lenses':
+            self._chunks.add(id // CHUNK_SIZE)
+        elif table in COMPONENT_TABLES:
+            self._components.add((COMPONENT_TABLES[table], id))
+        elif table == 'images':
+            self._images.add(id)
+
+    def current(self):
+        """Return the snapshot State, brought up to date with the changes."""
+        with db.engine.connect() as conn:
+            version = _read_version(conn)
+            catch_up(conn, version)
+        with self.refreshed(version):
+            return self.state
+
+    def files(self):
+        state = self.state
+        return state.files if state else {}
+
+    def build(self, conn, part, version):
+        state = State()
+        state.build(conn, version)
+        state.assemble()
+        self.state = state
+        self._chunks.clear()
+        self._components.clear()
+        self._images.clear()
+
+    def update(self, version):
+        if not (self._chunks or self._components or self._images):
+            return
+        state = self.state
+        with db.engine.connect() as conn:
+            # Every change up to it is applied; later ones may be too
+            state.version = version
+            components = set(self._components)
+            components.update(key for key, info in state.components.items() if info['image_id'] in self._images)
+            json_only = set()
+            if components:
+                ids = {}
+                for name, id in components:
+                    ids.setdefault(name, []).append(id)
+                loaded = _load_components(conn, ids)
+                for key in components:
+                    if key in loaded:
+                        state.components[key] = loaded[key]
+                    else:
+                        state.components.pop(key, None)
+                    state.info_json.pop(key, None)
+                    json_only |= state.users.get(key, set())
+                state.components_part = _components_part(state.components)
+            json_only -= self._chunks
+            if self._chunks or json_only:
+                state.load_chunks(conn, self._chunks | json_only, json_only)
+        state.assemble()
+        self._chunks.clear()
+        self._components.clear()
+        self._images.clear()
+
+
+snapshot = CatalogSnapshot()
+subscribe(snapshot.invalidate)
@@ -0,0 +1,81 @@
+"""
+Aggregated catalog statistics for the dashboard overview.
+
+Counts and lens distributions are computed with GROUP BY in the database and
+cached in-process under the table versions of the response's ETag, until a
+catalog change committed by any worker is dispatched (see pubsub.py). A TTL
+bounds staleness should a notification be lost.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from pubsub import subscribe
+from models import db, Image, Design, Treatment, Material, Lens
+
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', 60))
+
+_lock = threading.Lock()
+_cache = {'value': None, 'expires_at': 0.0, 'generation': 0, 'versions': None}
+
+
+def _distribution(component, fk_column):
+    rows = db.session.execute(
+        select(component.id, component.code, component.name, func.count(Lens.id))
+        .outerjoin(Lens, fk_column == component.id)
+        .group_by(component.id, component.code, component.name)
+        .order_by(component.id)
+    )
+    return [
+        {'id': id, 'code': code, 'name': name, 'count': count}
+        for id, code, name, count in rows
+    ]
+
+
+def compute_stats():
+    """Run the aggregate queries and build the stats payload."""
+    counts = db.session.execute(select(
+        select(func.count(Image.id)).scalar_subquery().label('images'),
+        select(func.count(Design.id)).scalar_subquery().label('designs'),
+        select(func.count(Treatment.id)).scalar_subquery().label('treatments'),
+        select(func.count(Material.id)).scalar_subquery().label('materials'),
+        select(func.count(Lens.id)).scalar_subquery().label('lenses'),
+    )).one()
+    return {
+        'counts': dict(counts._mapping),
+        'lenses_by_design': _distribution(Design, Lens.design_id),
+        'lenses_by_material': _distribution(Material, Lens.material_id),
+        'lenses_by_treatment': _distribution(Treatment, Lens.treatment_id),
+    }
+
+
+def get_stats(versions=None):
+    """Return the cached stats payload, recomputing it when stale.
+
+    ``versions`` are the table versions the response's ETag was derived from
+    (see versions.conditional()); a payload cached under others is stale.
+    """
+    now = time.monotonic()
+    with _lock:
+        if (_cache['value'] is not None and now < _cache['expires_at']
+                and _cache['versions'] == versions):
+            return _cache['value']
+        generation = _cache['generation']
+    value = compute_stats()
+    with _lock:
+        # Do not store a result that a concurrent commit already invalidated
+        if generation == _cache['generation']:
+            _cache['value'] = value
+            _cache['expires_at'] = now + STATS_CACHE_TTL
+            _cache['versions'] = versions
+    return value
+
+
+@subscribe
+def invalidate_stats(changes):
+    with _lock:
+        _cache['value'] = None
+        _cache['generation'] += 1
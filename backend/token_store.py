@@ -0,0 +1,157 @@
+"""
+Refresh-token stores.
+
+Two interchangeable backends, selected with REFRESH_TOKEN_STORE:
+- ``database`` (default): the ``refresh_tokens`` table, shared by every
+  worker; tokens are stored as SHA-256 digests and expired rows are removed
+  with a range delete on the ``expires_at`` index
+- ``memory``: a per-process dict plus a min-heap on expiry, for single-worker
+  development setups
+
+Both expose put/get/pop/delete/purge_expired. pop() is atomic so a refresh
+token can only be rotated once, and purge_expired() is run on a schedule by
+a sweeper thread in each worker, so storage is bounded by active sessions.
+"""
+
+import hashlib
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, select
+
+from daemons import start_periodic
+from models import db, RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class MemoryTokenStore:
+    def __init__(self):
+        self._tokens = {}
+        self._expiry_heap = []  # (expires_at, token), live tokens plus _dead others
+        self._dead = 0
+        self._lock = threading.Lock()
+
+    def put(self, token, record):
+        with self._lock:
+            if self._tokens.get(token) is not None:
+                self._dead += 1
+            self._tokens[token] = record
+            heapq.heappush(self._expiry_heap, (record['expires_at'], token))
+            self._compact()
+
+    def get(self, token):
+        with self._lock:
+            return self._tokens.get(token)
+
+    def pop(self, token):
+        with self._lock:
+            record = self._tokens.pop(token, None)
+            if record is not None:
+                self._dead += 1
+                self._compact()
+            return record
+
+    def delete(self, token):
+        return self.pop(token) is not None
+
+    def _compact(self):
+        # Drop the heap entries of rotated and revoked tokens once they
+        # outnumber the live ones, so the heap stays within twice the tokens
+        if self._dead > len(self._tokens):
+            self._expiry_heap = [(record['expires_at'], token)
+                                 for token, record in self._tokens.items()]
+            heapq.heapify(self._expiry_heap)
+            self._dead = 0
+
+    def purge_expired(self, now=None):
+        now = now or _utcnow()
+        removed = 0
+        with self._lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] < now:
+                expires_at, token = heapq.heappop(heap)
+                record = self._tokens.get(token)
+                if record is not None and record['expires_at'] == expires_at:
+                    del self._tokens[token]
+                    removed += 1
+                else:
+                    self._dead -= 1  # entry of a token already revoked or rotated
+        return removed
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+class DatabaseTokenStore:
+    table = RefreshToken.__table__
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def _record(row):
+        expires_at = row.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return {'user_id': row.user_id, 'user_data': row.user_data, 'expires_at': expires_at}
+
+    def put(self, token, record):
+        db.session.execute(insert(self.table).values(
+            token_hash=self._digest(token),
+            user_id=record['user_id'],
+            user_data=record['user_data'],
+            expires_at=record['expires_at'].astimezone(timezone.utc).replace(tzinfo=None),
+        ))
+        db.session.commit()
+
+    def get(self, token):
+        row = db.session.execute(
+            select(self.table).where(self.table.c.token_hash == self._digest(token))
+        ).first()
+        return self._record(row) if row else None
+
+    def pop(self, token):
+        row = db.session.execute(
+            delete(self.table).where(self.table.c.token_hash == self._digest(token))
+            .returning(self.table.c.user_id, self.table.c.user_data, self.table.c.expires_at)
+        ).first()
+        db.session.commit()
+        return self._record(row) if row else None
+
+    def delete(self, token):
+        return self.pop(token) is not None
+
+    def purge_expired(self, now=None):
+        now = (now or _utcnow()).astimezone(timezone.utc).replace(tzinfo=None)
+        result = db.session.execute(delete(self.table).where(self.table.c.expires_at < now))
+        db.session.commit()
+        return result.rowcount
+
+
+def create_token_store(kind=None):
+    kind = kind or os.getenv('REFRESH_TOKEN_STORE', 'database')
+    if kind == 'memory':
+        return MemoryTokenStore()
+    if kind == 'database':
+        return DatabaseTokenStore()
+    raise ValueError(f"Unknown REFRESH_TOKEN_STORE '{kind}'")
+
+
+def start_sweeper(app, store, interval):
+    """Purge expired tokens every ``interval`` seconds (once per process)."""
+
+    def sweep():
+        removed = store.purge_expired()
+        if removed:
+            logger.info('Purged %d expired refresh tokens', removed)
+
+    start_periodic('refresh-token-sweeper', app, interval, sweep)
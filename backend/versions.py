@@ -0,0 +1,127 @@
+"""
+Per-table catalog versions, the catalog change log and conditional GET support.
+
+Each catalog table has a row in ``catalog_versions`` whose counter is bumped in
+the same transaction as any write to that table, so every worker sees the
+same version. GET endpoints derive a strong ETag from the versions of the
+tables they read and answer a matching ``If-None-Match`` with 304 after a
+single primary-key lookup, before any ORM query runs.
+
+Every write transaction also takes the next catalog version (the
+``catalog_changes`` counter) and logs the rows it changed under it in
+``catalog_changes``, read by /api/changes (see changes.py). The counter row
+is locked first and held until commit, so writers queue on it and versions
+become visible in increasing order: a reader that saw version N has seen
+every change up to N. conditional() reads it with the table versions and has
+the in-process caches catch up to it (see pubsub.catch_up()) before the view
+runs, so a body is never older than its ETag; the table versions are left in
+``g.catalog_versions`` for caches keyed by them.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.orm import Session
+
+from events import changed_tables, on_change
+from models import db, CatalogChange, CatalogVersion
+from pubsub import catch_up
+
+CATALOG_TABLES = ('images', 'designs', 'treatments', 'materials', 'lenses')
+# catalog_versions row counting the versions of the change log
+CHANGES_COUNTER = 'catalog_changes'
+
+versions_table = CatalogVersion.__table__
+changes_table = CatalogChange.__table__
+
+
+def _bump(conn, names):
+    # One statement whatever the number of counters; returns {name: version}
+    bumped = dict(conn.execute(
+        update(versions_table)
+        .where(versions_table.c.table_name.in_(names))
+        .values(version=versions_table.c.version + 1)
+        .returning(versions_table.c.table_name, versions_table.c.version)
+    ).all())
+    missing = [{'table_name': name, 'version': 1} for name in names if name not in bumped]
+    if missing:
+        conn.execute(insert(versions_table), missing)
+        bumped.update((row['table_name'], 1) for row in missing)
+    return bumped
+
+
+@on_change
+def bump_versions(session, changes):
+    catalog_changes = [(table, id) for table, id in changes if table in CATALOG_TABLES]
+    if not catalog_changes:
+        return
+    conn = session.connection()
+    version = session.info.get('change_version')
+    if version is None:
+        # First catalog write of the transaction: take the change counter
+        # before any table counter, so all writers lock in the same order
+        version = session.info['change_version'] = _bump(conn, [CHANGES_COUNTER])[CHANGES_COUNTER]
+
+    # Once per table and transaction: readers only see the committed value
+    bumped_tables = session.info.setdefault('bumped_versions', set())
+    names = sorted(changed_tables(catalog_changes) - bumped_tables)
+    if names:
+        bumped_tables.update(names)
+        _bump(conn, names)
+
+    conn.execute(insert(changes_table), [
+        {'version': version, 'table_name': table, 'row_id': id} for table, id in catalog_changes
+    ])
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset_bumped_versions(session):
+    session.info.pop('bumped_versions', None)
+    session.info.pop('change_version', None)
+
+
+def current_versions(tables):
+    """Return ``{table_name: version}`` for the given tables (0 if never written)."""
+    rows = db.session.execute(
+        select(versions_table.c.table_name, versions_table.c.version)
+        .where(versions_table.c.table_name.in_(tables))
+    )
+    versions = dict.fromkeys(tables, 0)
+    for name, version in rows:
+        versions[name] = version
+    return versions
+
+
+def compute_etag(tables):
+    versions = current_versions([*tables, CHANGES_COUNTER])
+    catch_up(db.session.connection(), versions.pop(CHANGES_COUNTER))
+    g.catalog_versions = versions
+    key = request.full_path + '|' + ','.join(f'{t}:{versions[t]}' for t in sorted(versions))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(*tables):
+    """Emit an ETag derived from ``tables`` and answer If-None-Match with 304.
+
+    ``tables`` may also be a single callable returning the table names, for
+    endpoints whose dependencies vary with the request arguments.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            names = tables[0]() if callable(tables[0]) else tables
+            etag = compute_etag(names)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return decorated
+    return decorator
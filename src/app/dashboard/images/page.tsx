@@ -2,7 +2,7 @@ import { useState, useEffect } from "react";
 import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
 import { ImageDetailModal } from "@/components/features/ImageDetailModal";
-import { fetchImages } from "@/lib/api";
+import { fetchImages, imageUrl } from "@/lib/api";
 import {
   MoreVertical,
   Download,
@@ -122,8 +122,9 @@ export default function ImagesPage() {
                 >
                   <div className="aspect-[4/3] w-full overflow-hidden bg-slate-50">
                     <img
-                      src={img.url}
+                      src={imageUrl(img.url, 320, 240, "cover")}
                       alt={img.name}
+                      loading="lazy"
                       className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
                     />
                     <div className="absolute inset-0 bg-black/40 opacity-0 group-hover:opacity-100 transition-opacity flex items-center justify-center">
@@ -2,7 +2,7 @@ import { useState, useEffect } from "react";
 import { EntityTable } from "@/components/features/EntityTable";
 import { EditModal } from "@/components/features/EditModal";
 import { DeleteModal } from "@/components/features/DeleteModal";
-import { fetchLenses, createLens, updateLens, deleteLens } from "@/lib/api";
+import { fetchLensPage, createLens, updateLens, deleteLens } from "@/lib/api";
 
 export default function LensesDashboardPage() {
   const [lenses, setLenses] = useState<any[]>([]);
@@ -10,6 +10,9 @@ export default function LensesDashboardPage() {
   const [isEditOpen, setIsEditOpen] = useState(false);
   const [isDeleteOpen, setIsDeleteOpen] = useState(false);
   const [currentEntity, setCurrentEntity] = useState<any>(null);
+  // Cursor of the next page of lenses; null once all are loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   // For select options in EditModal (if EditModal supports select types, otherwise we use text/number)
   // EditModal doesn't seem to support 'select' yet based on previous views, but I can check or assume it's text for now
@@ -18,8 +21,9 @@ export default function LensesDashboardPage() {
   const loadData = async () => {
     setIsLoading(true);
     try {
-      const data = await fetchLenses();
-      setLenses(data);
+      const page = await fetchLensPage();
+      setLenses(page.items);
+      setNextCursor(page.next_cursor);
     } catch (error) {
       console.error("Failed to load lenses:", error);
     } finally {
@@ -27,6 +31,19 @@ export default function LensesDashboardPage() {
     }
   };
 
+  const loadMore = async () => {
+    setIsLoadingMore(true);
+    try {
+      const page = await fetchLensPage(nextCursor);
+      setLenses((current) => [...current, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error("Failed to load lenses:", error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     loadData();
   }, []);
@@ -120,6 +137,19 @@ export default function LensesDashboardPage() {
         searchPlaceholder="Rechercher un verre..."
       />
 
+      {!isLoading && nextCursor && (
+        <div className="flex justify-center mt-6">
+          <Button
+            variant="outline"
+            className="rounded-xl px-6"
+            onClick={loadMore}
+            disabled={isLoadingMore}
+          >
+            {isLoadingMore ? "Chargement..." : "Charger plus de verres"}
+          </Button>
+        </div>
+      )}
+
       {currentEntity && (
         <>
           <EditModal
@@ -23,12 +23,16 @@ import {
   Cell,
   Legend,
 } from "recharts";
-import {
-  fetchDesigns,
-  fetchLenses,
-  fetchTreatments,
-  fetchMaterials,
-} from "@/lib/api";
+import { fetchStats } from "@/lib/api";
+
+interface CatalogStats {
+  counts: {
+    designs: number;
+    lenses: number;
+    treatments: number;
+    materials: number;
+  };
+}
 
 export default function DashboardOverview() {
   const [data, setData] = useState({
@@ -42,17 +46,12 @@ export default function DashboardOverview() {
   useEffect(() => {
     const loadStats = async () => {
       try {
-        const [d, l, t, m] = await Promise.all([
-          fetchDesigns(),
-          fetchLenses(),
-          fetchTreatments(),
-          fetchMaterials(),
-        ]);
+        const { counts } = (await fetchStats()) as CatalogStats;
         setData({
-          designs: d.length,
-          lenses: l.length,
-          treatments: t.length,
-          materials: m.length,
+          designs: counts.designs,
+          lenses: counts.lenses,
+          treatments: counts.treatments,
+          materials: counts.materials,
         });
       } catch (error) {
         console.error("Failed to fetch dashboard stats:", error);
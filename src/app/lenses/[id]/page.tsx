@@ -4,7 +4,7 @@ import { ArrowLeft, Eye, RefreshCw } from "lucide-react";
 import { Button } from "@/components/ui/button";
 import { ComparisonCard } from "@/components/cards/ComparisonCard";
 import { cn } from "@/lib/utils";
-import { fetchLens } from "@/lib/api";
+import { fetchLens, subscribeCatalogChanges } from "@/lib/api";
 
 interface LensBadgeProps {
   number: number;
@@ -81,6 +81,35 @@ export default function LensDetailPage() {
     loadLensData();
   }, [id]);
 
+  // The lens on screen, for the change subscription below
+  const lensRef = useRef<any>(null);
+  lensRef.current = lens;
+
+  // Refresh in place when this lens, one of its components or their images
+  // change
+  useEffect(() => {
+    if (!id) return;
+    return subscribeCatalogChanges(async ({ changes, reset }) => {
+      const shown = lensRef.current;
+      const changed = (type: string, value: number | null | undefined) =>
+        reset.includes(type) ||
+        (value != null && (changes[type] ?? []).includes(value));
+      const components = ["design", "material", "treatment"];
+      const affected =
+        changed("lens", parseInt(id)) ||
+        components.some((name) => changed(name, shown?.[`${name}_id`])) ||
+        components.some((name) =>
+          changed("image", shown?.[`${name}_info`]?.image_id),
+        );
+      if (!affected) return;
+      try {
+        setLens(await fetchLens(parseInt(id)));
+      } catch (err) {
+        console.error("Failed to refresh lens:", err);
+      }
+    });
+  }, [id]);
+
   useEffect(() => {
     const updatePaths = () => {
       if (!containerRef.current || !lens) return;
@@ -1,18 +1,47 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { Link } from "react-router-dom";
 import { ArrowLeft, Play, Info, Layers, Beaker, Palette } from "lucide-react";
 import { Button } from "@/components/ui/button";
-import { fetchLenses } from "@/lib/api";
+import {
+  fetchLensIfExists,
+  fetchLensPage,
+  subscribeCatalogChanges,
+} from "@/lib/api";
+
+// Beyond this many changed lenses, reloading is cheaper than one fetch each
+const MAX_LENS_REFETCH = 20;
 
 export default function LensesIndexPage() {
   const [lenses, setLenses] = useState<any[]>([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  // Cursor of the next page of lenses (by id); null once all are loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const nextCursorRef = useRef<string | null>(null);
+
+  const showPage = (items: any[], cursor: string | null, append: boolean) => {
+    setLenses((current) => (append ? [...current, ...items] : items));
+    setNextCursor(cursor);
+    nextCursorRef.current = cursor;
+  };
+
+  const loadMore = async () => {
+    setIsLoadingMore(true);
+    try {
+      const page = await fetchLensPage(nextCursorRef.current);
+      showPage(page.items, page.next_cursor, true);
+    } catch (error) {
+      console.error("Failed to fetch lenses:", error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
 
   useEffect(() => {
     const loadLenses = async () => {
       try {
-        const data = await fetchLenses();
-        setLenses(data);
+        const page = await fetchLensPage();
+        showPage(page.items, page.next_cursor, false);
       } catch (error) {
         console.error("Failed to fetch lenses:", error);
       } finally {
@@ -20,6 +49,33 @@ export default function LensesIndexPage() {
       }
     };
     loadLenses();
+    // Follow the catalog changes instead of polling: only lenses are shown
+    // here, and only the ones that changed are fetched again
+    return subscribeCatalogChanges(async ({ changes, reset }) => {
+      const ids = changes.lens ?? [];
+      if (reset.includes("lens") || ids.length > MAX_LENS_REFETCH) {
+        await loadLenses();
+        return;
+      }
+      if (ids.length === 0) return;
+      try {
+        const fetched = await Promise.all(ids.map(fetchLensIfExists));
+        setLenses((current) => {
+          // Lenses past the loaded pages come with the next ones
+          const last = current.length ? current[current.length - 1].id : 0;
+          const loaded = (id: number) =>
+            nextCursorRef.current === null || id <= last;
+          const byId = new Map(current.map((lens) => [lens.id, lens]));
+          ids.forEach((id, i) => {
+            if (fetched[i] && loaded(id)) byId.set(id, fetched[i]);
+            else byId.delete(id);
+          });
+          return [...byId.values()].sort((a, b) => a.id - b.id);
+        });
+      } catch (error) {
+        console.error("Failed to refresh lenses:", error);
+      }
+    });
   }, []);
 
   return (
@@ -67,6 +123,19 @@ export default function LensesIndexPage() {
             </div>
           )}
 
+          {!isLoading && nextCursor && (
+            <div className="flex justify-center mt-12">
+              <Button
+                variant="outline"
+                className="rounded-2xl h-12 px-8 font-bold"
+                onClick={loadMore}
+                disabled={isLoadingMore}
+              >
+                {isLoadingMore ? "Chargement..." : "Voir plus de verres"}
+              </Button>
+            </div>
+          )}
+
           {!isLoading && lenses.length === 0 && (
             <div className="text-center py-20 bg-white rounded-[3rem] border border-dashed border-slate-300">
               <Layers className="w-16 h-16 text-slate-200 mx-auto mb-4" />
@@ -3,6 +3,7 @@ import imagesData from "@/lib/data/images.json";
 import { Modal } from "@/components/ui/Modal";
 import { Search, Check } from "lucide-react";
 import { cn } from "@/lib/utils";
+import { imageUrl } from "@/lib/api";
 
 interface ImagePickerProps {
   isOpen: boolean;
@@ -60,7 +61,7 @@ export function ImagePicker({
               }}
             >
               <img
-                src={img.url}
+                src={imageUrl(img.url, 240, 240, "cover")}
                 alt={img.name}
                 className="w-full h-full object-cover"
               />
@@ -49,6 +49,16 @@ async function refreshAccessToken(): Promise<boolean> {
   }
 }
 
+// Non-2xx answer of the API, with its HTTP status
+export class ApiError extends Error {
+  status: number;
+
+  constructor(status: number, statusText: string) {
+    super(`API Error: ${statusText}`);
+    this.status = status;
+  }
+}
+
 // --- Helper for authenticated requests with auto-refresh ---
 async function apiRequest(
   path: string,
@@ -90,14 +100,47 @@ async function apiRequest(
   }
 
   if (!res.ok) {
-    throw new Error(`API Error: ${res.statusText}`);
+    throw new ApiError(res.status, res.statusText);
   }
 
   return res.json();
 }
 
+// --- Paging (keyset: ?limit= and the previous page's next_cursor) ---
+export interface Page<T = any> {
+  items: T[];
+  // cursor of the next page; null on the last one
+  next_cursor: string | null;
+}
+
+// Rows per page of the catalog lists (the backend serves at most 500)
+export const PAGE_SIZE = 50;
+const MAX_PAGE_SIZE = 500;
+
+const fetchPage = (
+  path: string,
+  cursor: string | null = null,
+  limit = PAGE_SIZE,
+) => {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  return apiRequest(`${path}?${params}`) as Promise<Page>;
+};
+
+// Every row of a short list (components, images), one bounded page at a time
+async function fetchAllPages(path: string): Promise<any[]> {
+  const items: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const page: Page = await fetchPage(path, cursor, MAX_PAGE_SIZE);
+    items.push(...page.items);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return items;
+}
+
 // --- Images ---
-export const fetchImages = () => apiRequest("/images");
+export const fetchImages = () => fetchAllPages("/images");
 export const fetchImage = (id: number) => apiRequest(`/images/${id}`);
 export const createImage = (data: unknown) =>
   apiRequest("/images", "POST", data);
@@ -106,8 +149,26 @@ export const updateImage = (id: number, data: unknown) =>
 export const deleteImage = (id: number) =>
   apiRequest(`/images/${id}`, "DELETE");
 
+// Locally stored images (/api/media/...) resized by the backend to fit
+// width x height (or fill it with fit "cover"); other URLs are unchanged
+export function imageUrl(
+  url: string,
+  width: number,
+  height?: number,
+  fit: "contain" | "cover" = "contain",
+): string {
+  if (!url.startsWith("/api/media/")) return url;
+  const resolved = new URL(url, new URL(API_BASE_URL, window.location.href));
+  resolved.searchParams.set("w", String(Math.round(width * window.devicePixelRatio)));
+  if (height) {
+    resolved.searchParams.set("h", String(Math.round(height * window.devicePixelRatio)));
+    resolved.searchParams.set("fit", fit);
+  }
+  return resolved.toString();
+}
+
 // --- Designs ---
-export const fetchDesigns = () => apiRequest("/designs");
+export const fetchDesigns = () => fetchAllPages("/designs");
 export const createDesign = (data: unknown) =>
   apiRequest("/designs", "POST", data);
 export const updateDesign = (id: number, data: unknown) =>
@@ -116,7 +177,7 @@ export const deleteDesign = (id: number) =>
   apiRequest(`/designs/${id}`, "DELETE");
 
 // --- Treatments ---
-export const fetchTreatments = () => apiRequest("/treatments");
+export const fetchTreatments = () => fetchAllPages("/treatments");
 export const createTreatment = (data: unknown) =>
   apiRequest("/treatments", "POST", data);
 export const updateTreatment = (id: number, data: unknown) =>
@@ -125,7 +186,7 @@ export const deleteTreatment = (id: number) =>
   apiRequest(`/treatments/${id}`, "DELETE");
 
 // --- Materials ---
-export const fetchMaterials = () => apiRequest("/materials");
+export const fetchMaterials = () => fetchAllPages("/materials");
 export const createMaterial = (data: unknown) =>
   apiRequest("/materials", "POST", data);
 export const updateMaterial = (id: number, data: unknown) =>
@@ -134,17 +195,103 @@ export const deleteMaterial = (id: number) =>
   apiRequest(`/materials/${id}`, "DELETE");
 
 // --- Lenses (public GET endpoints, protected mutations) ---
-export const fetchLenses = () => apiRequest("/lenses");
+// Lenses by id, PAGE_SIZE at a time: the catalog is too large to list at once
+export const fetchLensPage = (cursor: string | null = null) =>
+  fetchPage("/lenses", cursor);
 export const fetchLens = (id: number) => apiRequest(`/lenses/${id}`);
+// The lens, or null once it was deleted
+export const fetchLensIfExists = (id: number) =>
+  fetchLens(id).catch((error) => {
+    if (error instanceof ApiError && error.status === 404) return null;
+    throw error;
+  });
 export const createLens = (data: unknown) =>
   apiRequest("/lenses", "POST", data);
 export const updateLens = (id: number, data: unknown) =>
   apiRequest(`/lenses/${id}`, "PUT", data);
 export const deleteLens = (id: number) => apiRequest(`/lenses/${id}`, "DELETE");
 
+// Selected component ids per facet (null: lenses without one)
+export interface LensFacetSelection {
+  design_id?: (number | null)[];
+  material_id?: (number | null)[];
+  treatment_id?: (number | null)[];
+}
+
+export interface LensFacetCount {
+  id: number | null;
+  code: string | null;
+  name: string | null;
+  count: number;
+}
+
+export interface LensFacets {
+  // lenses matching the whole selection
+  total: number;
+  // each facet counted under the selection of the other two
+  facets: Record<"design" | "material" | "treatment", LensFacetCount[]>;
+}
+
+export const fetchLensFacets = (
+  selection: LensFacetSelection = {},
+): Promise<LensFacets> => {
+  const params = new URLSearchParams();
+  for (const [key, ids] of Object.entries(selection)) {
+    if (ids?.length) {
+      params.set(key, ids.map((id) => (id === null ? "null" : id)).join(","));
+    }
+  }
+  const query = params.toString();
+  return apiRequest(
+    `/lenses/facets${query ? `?${query}` : ""}`,
+  ) as Promise<LensFacets>;
+};
+
+// --- Catalog change stream (Server-Sent Events, served by backend/asgi.py) ---
+export interface CatalogChangeEvent {
+  version: number;
+  // ids changed per type: lens, design, treatment, material, image
+  changes: Record<string, number[]>;
+  // types changed as a whole, to refetch
+  reset: string[];
+}
+
+// Served by the ASGI app (the "asgi" service of docker-compose.yml, port
+// 5001); the fallback suits a proxy routing /api/changes/stream there
+const CHANGE_STREAM_URL =
+  import.meta.env.VITE_CHANGE_STREAM_URL || `${API_BASE_URL}/changes/stream`;
+
+// EventSource reconnects by itself and resumes after the last event id;
+// returns the function that closes the stream
+export function subscribeCatalogChanges(
+  onChange: (event: CatalogChangeEvent) => void,
+): () => void {
+  const source = new EventSource(CHANGE_STREAM_URL);
+  source.addEventListener("change", (e) =>
+    onChange(JSON.parse((e as MessageEvent).data)),
+  );
+  return () => source.close();
+}
+
+// --- Dashboard ---
+export const fetchStats = () => apiRequest("/stats");
+
+// --- Batch (ordered create/update/delete/link/unlink, one transaction) ---
+export const applyBatch = (operations: unknown[]) =>
+  apiRequest("/batch", "POST", { operations });
+
 // --- Relationships ---
 export const linkProduct = (type: string, id: number, image_id: number) =>
   apiRequest("/link", "POST", { type, id, image_id });
 
 export const unlinkProduct = (type: string, id: number) =>
   apiRequest("/unlink", "POST", { type, id });
+
+// Bulk variants: items may mix Design / Traitement / Matière
+export const linkProducts = (
+  items: { type: string; id: number }[],
+  image_id: number,
+) => apiRequest("/link", "POST", { items, image_id });
+
+export const unlinkProducts = (items: { type: string; id: number }[]) =>
+  apiRequest("/unlink", "POST", { items });